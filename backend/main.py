@@ -1,10 +1,13 @@
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from backend.routes.auth_routes import router as auth_router
 from backend.routes.model_routes import router as model_router
 from backend.routes.neo4j_routes import router as neo4j_router
 from backend.routes.chat_routes import router as chat_router
+from backend.routes.admin_routes import router as admin_router
+from backend.services import metrics
 
 """
 后端主入口模块
@@ -43,11 +46,17 @@ def create_app() -> FastAPI:
     def favicon():
         return Response(status_code=204)
 
+    # Prometheus 指标接口：各问答阶段耗时直方图、大模型首 token 时间与生成速度
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
     # 注册子模块路由（路由前缀已在各自模块中定义）
     app.include_router(auth_router)
     app.include_router(model_router)
     app.include_router(neo4j_router)
     app.include_router(chat_router)
+    app.include_router(admin_router)
 
     return app
 
@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+
+import model_config
+from backend.services.app_state import ner_service, prompt_service
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+# ========== 缓存监控接口 ==========
+
+@router.get("/cache/ner")
+def ner_cache_stats():
+    """查看 NER 查询结果缓存的命中率、条目数与内存估算，用于调整缓存大小"""
+    return ner_service.cache_stats()
+
+
+@router.delete("/cache/ner")
+def clear_ner_cache():
+    """清空 NER 查询结果缓存"""
+    ner_service.clear_cache()
+    return ner_service.cache_stats()
+
+
+@router.get("/cache/knowledge")
+def knowledge_cache_stats():
+    """查看知识图谱检索缓存的命中率、条目数与当前图谱版本"""
+    return prompt_service.knowledge_cache_stats()
+
+
+@router.delete("/cache/knowledge")
+def clear_knowledge_cache():
+    """清空知识图谱检索缓存"""
+    prompt_service.clear_knowledge_cache()
+    return prompt_service.knowledge_cache_stats()
+
+
+# ========== 大模型客户端监控接口 ==========
+
+@router.get("/llm/clients")
+def llm_client_stats():
+    """查看 Ollama / 硅基流动客户端的调用次数、错误与重试次数、进行中的流式生成数以及连接池状态"""
+    return model_config.llm_clients.stats()
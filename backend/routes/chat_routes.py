@@ -1,3 +1,5 @@
+import os
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 from starlette.responses import StreamingResponse
@@ -11,7 +13,11 @@ from backend.services.chat_service import ChatService
 
 # 创建 APIRouter 实例，统一设置前缀和标签
 router = APIRouter(prefix="/api/chat", tags=["聊天"])
-chat_service = ChatService()
+chat_service = ChatService(
+    # NER（CPU 密集）与意图识别（可能等待大模型）各用一个线程池，按 CPU 核数与并发问答量调整
+    ner_workers=int(os.environ.get("CHAT_NER_WORKERS", "4")),
+    intent_workers=int(os.environ.get("CHAT_INTENT_WORKERS", "32")),
+)
 
 class ChatRequest(BaseModel):
     """
@@ -22,19 +28,22 @@ class ChatRequest(BaseModel):
     model_name: str               # 模型名称
     api_key: str | None = None    # 硅基流动 API 密钥（可选）
     neo4j_password: str | None = None # Neo4j 数据库密码（可选，用于自动重连）
+    trace: bool = False           # 是否在 done 事件中返回各阶段耗时明细
 
 @router.post("/stream")
-def stream_chat(payload: ChatRequest):
+async def stream_chat(payload: ChatRequest):
     """
     流式对话接口
     接收用户问题，调用后端服务进行意图识别、知识检索和模型生成，并以流的形式返回结果。
+    整个流程在事件循环中异步执行，生成答案期间不占用线程池中的线程。
     """
-    generator = chat_service.stream_chat(
+    generator = chat_service.stream_chat_async(
         query=payload.query,
         model_source=payload.model_source,
         model_name=payload.model_name,
         api_key=payload.api_key,
         neo4j_password=payload.neo4j_password,
+        trace=payload.trace,
     )
     # 使用 StreamingResponse 返回生成器产生的内容，每行代表一个 JSON 数据块
     return StreamingResponse(generator, media_type="application/json")
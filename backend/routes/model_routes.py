@@ -1,12 +1,18 @@
+import os
+
 from fastapi import APIRouter
 
 from backend.services.model_service import ModelService
 
 
 router = APIRouter(prefix="/api/models", tags=["models"])
-model_service = ModelService()
+# 本地模型列表的缓存存活时间（秒）
+model_service = ModelService(ttl=float(os.environ.get("MODEL_LIST_TTL", "60")))
+# 服务启动时在后台发现一次本地模型
+model_service.refresh_async()
 
 
 @router.get("")
-def list_models():
-    return model_service.get_available_models()
+def list_models(refresh: bool = False):
+    """返回可用模型列表及本地模型列表的缓存时长；refresh=true 时立即重新发现本地模型"""
+    return model_service.get_available_models(force_refresh=refresh)
@@ -1,3 +1,5 @@
+import os
+
 from backend.services.intent_service import IntentService
 from backend.services.ner_service import NerService
 from backend.services.neo4j_service import Neo4jService
@@ -8,14 +10,34 @@ intent_service = IntentService()#在 app_state.py 中实例化 IntentService，
 #在 chat_service.stream_chat 调用 intent_service.recognize。
 
 
-ner_service = NerService() #提供实体提取服务实例，用于从查询中识别实体。
+ner_service = NerService(
+    # 设置 NER_INFERENCE_MODE=int8 启用 CPU 动态量化推理，NER_TORCHSCRIPT=1 额外做 TorchScript 追踪
+    inference_mode=os.environ.get("NER_INFERENCE_MODE", "fp32"),
+    torchscript=os.environ.get("NER_TORCHSCRIPT") == "1",
+    # 查询结果缓存容量与存活时间（秒），NER_CACHE_SIZE=0 关闭缓存
+    cache_size=int(os.environ.get("NER_CACHE_SIZE", "2048")),
+    cache_ttl=float(os.environ.get("NER_CACHE_TTL", "3600")),
+    # 检查模型与词库文件是否更新的间隔（秒）
+    version_check_interval=float(os.environ.get("NER_VERSION_CHECK_INTERVAL", "5")),
+) #提供实体提取服务实例，用于从查询中识别实体。
 
 
-neo4j_service = Neo4jService() #提供知识检索服务实例，用于从知识图谱中提取相关知识。
+neo4j_service = Neo4jService(
+    uri=os.environ.get("NEO4J_URI", "bolt://localhost:7687"),
+    user=os.environ.get("NEO4J_USER", "neo4j"),
+    database=os.environ.get("NEO4J_DATABASE") or None,
+    # 连接池大小与借用连接的超时时间（秒），按并发问答量调整
+    max_connection_pool_size=int(os.environ.get("NEO4J_POOL_SIZE", "50")),
+    connection_acquisition_timeout=float(os.environ.get("NEO4J_ACQUISITION_TIMEOUT", "5")),
+) #提供知识检索服务实例，用于从知识图谱中提取相关知识。
 
 
-prompt_service = PromptService() #提供提示词生成与知识检索相关的服务实例
+prompt_service = PromptService(
+    # 提示词 token 预算（估算值），超出时按意图优先级截断检索到的知识；设为 0 表示不限制
+    token_budget=int(os.environ.get("PROMPT_TOKEN_BUDGET", "1536")) or None,
+) #提供提示词生成与知识检索相关的服务实例
 
 
-# 服务初始化时自动尝试连接Neo4j
-neo4j_service.connect()
+# 服务初始化时自动尝试连接Neo4j，连接成功后在后台预热高频疾病的知识缓存
+if neo4j_service.connect():
+    prompt_service.warm_up_async(neo4j_service.client, top_n=int(os.environ.get("KNOWLEDGE_WARM_UP_TOP_N", "50")))
@@ -1,18 +1,265 @@
+import asyncio
 import json
-from typing import Dict, Generator, Optional
-
-from ollama import Client
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Generator, Optional, Tuple
 
 import model_config
+from backend.services import metrics
 from backend.services.app_state import intent_service, ner_service, neo4j_service, prompt_service
 
 """
 核心问答服务类
 该类集成了意图识别、实体提取、知识检索和模型生成等多个子服务，
 实现了完整的 RAG (检索增强生成) 工作流。
+stream_chat_async 为全异步版本：大模型流式输出与 Neo4j 查询均使用异步 IO，
+只有 CPU 密集的 NER 在专用线程池中执行，生成过程中不占用线程。
+
+流式响应为换行分隔的 JSON（NDJSON），事件按以下顺序发送：
+    entities / intent   实体识别、意图识别各自完成时立即发送（两者先后不定）
+    knowledge           知识检索与提示词生成完成后发送
+    meta                完整元数据（含提示词、各阶段耗时与提示词 token 统计），与之前的协议兼容
+    delta*              答案增量
+    error               任一步骤失败时发送
+    done                结束；请求 trace 时附带逐阶段耗时明细
+阶段事件均带 elapsed_ms（相对请求开始的毫秒数），用于统计各阶段的首字节时间。
+各阶段耗时同时汇总到 metrics 的直方图，由 /metrics 导出。
 """
 
+# 可并行执行的阶段名 -> 展示名称
+STAGE_NAMES = {"ner": "实体识别", "intent": "意图识别"}
+
+
+class StageError(Exception):
+    """某个并行阶段执行失败"""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{STAGE_NAMES.get(stage, stage)}失败: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float, float]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, start, time.perf_counter()
+
+
+async def _timed_async(awaitable: Awaitable) -> Tuple[Any, float, float]:
+    start = time.perf_counter()
+    result = await awaitable
+    return result, start, time.perf_counter()
+
+
+def _stage_timings(start: float, stage_times: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+    """各阶段相对请求开始的起始时间与耗时，以及并行总耗时和相比串行节省的时间"""
+    timings: Dict[str, Any] = {
+        name: {
+            "start_ms": round((stage_start - start) * 1000, 2),
+            "duration_ms": round((stage_end - stage_start) * 1000, 2),
+        }
+        for name, (stage_start, stage_end) in stage_times.items()
+    }
+    wall = (time.perf_counter() - start) * 1000
+    timings["parallel_ms"] = round(wall, 2)
+    # 与串行执行相比节省的时间，即各阶段的重叠部分
+    timings["saved_ms"] = round(max(0.0, sum(stage_end - stage_start for stage_start, stage_end
+                                             in stage_times.values()) * 1000 - wall), 2)
+    return timings
+
+
+def _event(payload: Dict[str, Any]) -> bytes:
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+
 class ChatService:
+    def __init__(self, ner_workers: int = 4, intent_workers: int = 32):
+        # NER 是 CPU 密集阶段，在专用线程池中执行（同步与异步流程共用），线程数按 CPU 核数设置；
+        # 意图识别可能阻塞等待大模型，使用单独的、更大的线程池，慢速的大模型调用不会占满 NER 的线程
+        self._ner_executor = ThreadPoolExecutor(max_workers=ner_workers, thread_name_prefix="ner")
+        self._intent_executor = ThreadPoolExecutor(max_workers=intent_workers, thread_name_prefix="intent")
+        # 同步流程中各阶段名 -> 执行该阶段的线程池，未列出的阶段在意图识别线程池中执行
+        self._stage_executors = {"ner": self._ner_executor, "intent": self._intent_executor}
+
+    def iter_stages(self, stages: Dict[str, Tuple[Callable, tuple]]) -> Generator[Tuple[str, Any, float, float], None, None]:
+        """
+        并行执行互不依赖的阶段，按完成顺序产出 (阶段名, 结果, 开始时间, 结束时间)。
+
+        任一阶段出错时取消尚未开始的阶段并抛出 StageError；已在运行的阶段无法中断，
+        其结果（或异常）会被丢弃，不会影响后续请求。调用方提前停止迭代时同样丢弃其余阶段。
+        """
+        futures = {}
+        for name, (fn, args) in stages.items():
+            executor = self._stage_executors.get(name, self._intent_executor)
+            futures[executor.submit(metrics.run_in_context(_timed, fn, *args))] = name
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        raise StageError(futures[future], future.exception())
+                for future in done:
+                    result, stage_start, stage_end = future.result()
+                    yield futures[future], result, stage_start, stage_end
+        finally:
+            for other in pending:
+                other.cancel()
+                # 取回被丢弃阶段的异常，避免其在后台无人处理
+                other.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def run_stages(self, stages: Dict[str, Tuple[Callable, tuple]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """并行执行各阶段，全部完成后返回 (各阶段结果, 耗时信息)，出错时抛出 StageError"""
+        start = time.perf_counter()
+        results, stage_times = {}, {}
+        for name, result, stage_start, stage_end in self.iter_stages(stages):
+            results[name] = result
+            stage_times[name] = (stage_start, stage_end)
+        return results, _stage_timings(start, stage_times)
+
+    async def iter_stages_async(self, stages: Dict[str, Awaitable]) -> AsyncGenerator[Tuple[str, Any, float, float], None]:
+        """iter_stages 的异步版本：并发等待各阶段，按完成顺序产出，任一阶段出错时取消其余阶段"""
+        tasks = {asyncio.ensure_future(_timed_async(stage)): name for name, stage in stages.items()}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        raise StageError(tasks[task], task.exception())
+                for task in done:
+                    result, stage_start, stage_end = task.result()
+                    yield tasks[task], result, stage_start, stage_end
+        finally:
+            for other in pending:
+                other.cancel()
+                other.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def run_stages_async(self, stages: Dict[str, Awaitable]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """run_stages 的异步版本"""
+        start = time.perf_counter()
+        results, stage_times = {}, {}
+        async for name, result, stage_start, stage_end in self.iter_stages_async(stages):
+            results[name] = result
+            stage_times[name] = (stage_start, stage_end)
+        return results, _stage_timings(start, stage_times)
+
+    @staticmethod
+    def _done_event(trace: metrics.Trace, include_trace: bool, status: str) -> Dict[str, Any]:
+        """结束事件：记录整次问答耗时，include_trace 为 True 时附带逐阶段明细"""
+        total = time.perf_counter() - trace.start
+        metrics.CHAT_SECONDS.observe(total, status=status)
+        event: Dict[str, Any] = {"type": "done"}
+        if include_trace:
+            event["total_ms"] = round(total * 1000, 2)
+            event["trace"] = trace.to_list()
+        return event
+
+    @staticmethod
+    def _knowledge_event(yitu: str, entities: Dict[str, str], knowledge: str, start: float) -> Dict[str, Any]:
+        """知识检索完成时发送的事件；意图与实体为生成提示词后的最终结果（症状可能已反查出疾病）"""
+        return {
+            "type": "knowledge",
+            "intent": yitu,
+            "entities": entities,
+            "knowledge": knowledge,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    @staticmethod
+    def _stage_event(name: str, result: Any, start: float) -> Dict[str, Any]:
+        """实体识别 / 意图识别阶段完成时发送的事件"""
+        elapsed = round((time.perf_counter() - start) * 1000, 2)
+        if name == "ner":
+            return {"type": "entities", "entities": result, "elapsed_ms": elapsed}
+        return {"type": "intent", "intent": "、".join(intent_service.intent_names(result)), "elapsed_ms": elapsed}
+
+    async def stream_chat_async(
+        self,
+        query: str,
+        model_source: str,
+        model_name: str,
+        api_key: Optional[str],
+        neo4j_password: Optional[str],
+        trace: bool = False,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        stream_chat 的全异步版本，流程与事件格式完全相同。
+        NER 在专用线程池中执行，意图识别（需要时）、知识检索与答案生成均为异步 IO，
+        因此同时进行的问答数量不受线程池大小限制。
+        """
+        loop = asyncio.get_running_loop()
+        request_trace = metrics.start_trace()
+        start = request_trace.start
+
+        # 1. 数据库连接处理（仅在未连接时发生，放到默认线程池中执行）
+        if not neo4j_service.status().get("connected") and neo4j_password:
+            with metrics.span("neo4j.connect"):
+                await loop.run_in_executor(None, neo4j_service.connect, neo4j_password)
+        stages_start = time.perf_counter()
+
+        # 2. 实体提取与意图识别（并发），各自完成时立即发送阶段事件
+        results, stage_times = {}, {}
+        try:
+            async for name, result, stage_start, stage_end in self.iter_stages_async({
+                "ner": loop.run_in_executor(self._ner_executor, metrics.run_in_context(ner_service.get_entities, query)),
+                "intent": intent_service.recognize_async(query, model_name, model_source, api_key),
+            }):
+                results[name] = result
+                stage_times[name] = (stage_start, stage_end)
+                yield _event(self._stage_event(name, result, start))
+        except StageError as exc:
+            yield _event({"type": "error", "message": str(exc)})
+            yield _event(self._done_event(request_trace, trace, "error"))
+            return
+        timings = _stage_timings(stages_start, stage_times)
+        entities, intent_result = results["ner"], results["intent"]
+
+        # 3. 生成提示词（包含知识检索）
+        prompt_start = time.perf_counter()
+        prompt_stats: Dict[str, Any] = {}
+        prompt, yitu, entities = await prompt_service.generate_prompt_async(
+            intent_result, query, neo4j_service.async_client, entities, prompt_stats
+        )
+        timings["prompt_ms"] = round((time.perf_counter() - prompt_start) * 1000, 2)
+        knowledge = prompt_service.extract_knowledge(prompt)
+        yield _event(self._knowledge_event(yitu, entities, knowledge, start))
+
+        # 4. 发送元数据
+        yield _event({
+            "type": "meta",
+            "intent": yitu,
+            "entities": entities,
+            "prompt": prompt,
+            "knowledge": knowledge,
+            "timings": timings,
+            "prompt_tokens": prompt_stats,
+        })
+
+        # 5. 异步流式生成答案，记录首 token 时间与生成速度
+        status = "ok"
+        timer = metrics.GenerationTimer("ollama" if model_source == "local" else "siliconflow")
+        try:
+            if model_source == "local":
+                async for delta in model_config.astream_ollama(model_name, prompt):
+                    timer.delta(delta)
+                    yield _event({"type": "delta", "content": delta})
+            elif not api_key:
+                status = "error"
+                yield _event({"type": "error", "message": "请在侧边栏输入硅基流动 API Key"})
+            else:
+                async for delta in model_config.astream_siliconflow(model_name, prompt, api_key):
+                    timer.delta(delta)
+                    yield _event({"type": "delta", "content": delta})
+        except Exception as exc:
+            status = "error"
+            yield _event({"type": "error", "message": f"生成答案失败: {str(exc)}"})
+        if status == "ok" or timer.first is not None:
+            timer.finish()
+
+        # 6. 标志结束
+        yield _event(self._done_event(request_trace, trace, status))
+
     def stream_chat(
         self,
         query: str,
@@ -20,90 +267,94 @@ class ChatService:
         model_name: str,
         api_key: Optional[str],
         neo4j_password: Optional[str],
+        trace: bool = False,
     ) -> Generator[bytes, None, None]:
         """
         流式问答核心方法。
         
         工作流程：
         1. 检查并连接 Neo4j 数据库。
-        2. 调用 NER 服务提取查询中的实体。
-        3. 调用意图识别服务判断用户提问意图。
-        4. 调用提示词服务从知识图谱中检索信息并生成模型提示词。
-        5. 调用语言模型（本地或 API）获取生成的答案并以流的形式返回。
+        2. 并行调用 NER 服务提取查询中的实体、调用意图识别服务判断用户提问意图，各自完成时立即发送事件。
+        3. 调用提示词服务从知识图谱中检索信息并生成模型提示词，完成后发送检索到的知识。
+        4. 调用语言模型（本地或 API）获取生成的答案并以流的形式返回。
+        trace 为 True 时在 done 事件中附带各阶段耗时明细。
         """
+        request_trace = metrics.start_trace()
+        start = request_trace.start
+
         # 1. 数据库连接处理
         if not neo4j_service.status().get("connected") and neo4j_password:
-            neo4j_service.connect(custom_password=neo4j_password)
+            with metrics.span("neo4j.connect"):
+                neo4j_service.connect(custom_password=neo4j_password)
+        stages_start = time.perf_counter()
 
-        # 2. 实体提取
-        entities = ner_service.get_entities(query)
-        
-        # 3. 意图识别
-        intent_result = intent_service.recognize(query, model_name, model_source, api_key)
-        
-        # 4. 生成提示词（包含知识检索）
+        # 2. 实体提取与意图识别（并行），各自完成时立即发送阶段事件
+        results, stage_times = {}, {}
+        try:
+            for name, result, stage_start, stage_end in self.iter_stages({
+                "ner": (ner_service.get_entities, (query,)),
+                "intent": (intent_service.recognize, (query, model_name, model_source, api_key)),
+            }):
+                results[name] = result
+                stage_times[name] = (stage_start, stage_end)
+                yield _event(self._stage_event(name, result, start))
+        except StageError as exc:
+            yield _event({"type": "error", "message": str(exc)})
+            yield _event(self._done_event(request_trace, trace, "error"))
+            return
+        timings = _stage_timings(stages_start, stage_times)
+        entities, intent_result = results["ner"], results["intent"]
+
+        # 3. 生成提示词（包含知识检索）
+        metrics.activate(request_trace)
+        prompt_start = time.perf_counter()
+        prompt_stats: Dict[str, Any] = {}
         prompt, yitu, entities = prompt_service.generate_prompt(
-            intent_result, query, neo4j_service.client, entities
+            intent_result, query, neo4j_service.client, entities, prompt_stats
         )
+        timings["prompt_ms"] = round((time.perf_counter() - prompt_start) * 1000, 2)
         # 提取从图谱中找到的知识，用于前端展示
         knowledge = prompt_service.extract_knowledge(prompt)
+        yield _event(self._knowledge_event(yitu, entities, knowledge, start))
 
-        # 5. 发送元数据（Meta）给前端，包含意图、实体、检索到的知识等
-        meta = {
+        # 4. 发送元数据（Meta）给前端，包含意图、实体、提示词、检索到的知识与各阶段耗时
+        yield _event({
             "type": "meta",
             "intent": yitu,
             "entities": entities,
             "prompt": prompt,
             "knowledge": knowledge,
-        }
-        yield (json.dumps(meta, ensure_ascii=False) + "\n").encode("utf-8")
+            "timings": timings,
+            "prompt_tokens": prompt_stats,
+        })
 
-        # 6. 调用模型生成答案并流式返回增量内容（Delta）
+        # 5. 调用模型生成答案并流式返回增量内容（Delta），记录首 token 时间与生成速度
+        status = "ok"
+        timer = metrics.GenerationTimer("ollama" if model_source == "local" else "siliconflow")
         try:
             if model_source == "local":
-                # 调用本地 Ollama
-                ollama_client = Client(host="http://127.0.0.1:11434")
-                for chunk in ollama_client.chat(
-                    model=model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    stream=True,
-                ):
+                # 调用本地 Ollama（共享连接池）
+                for chunk in model_config.call_ollama(model_name, prompt, stream=True):
                     delta = chunk["message"]["content"]
-                    yield (json.dumps({"type": "delta", "content": delta}, ensure_ascii=False) + "\n").encode(
-                        "utf-8"
-                    )
+                    metrics.activate(request_trace)
+                    timer.delta(delta)
+                    yield _event({"type": "delta", "content": delta})
             else:
                 # 调用在线 API (硅基流动)
                 if not api_key:
-                    yield (
-                        json.dumps({"type": "error", "message": "请在侧边栏输入硅基流动 API Key"}, ensure_ascii=False)
-                        + "\n"
-                    ).encode("utf-8")
+                    status = "error"
+                    yield _event({"type": "error", "message": "请在侧边栏输入硅基流动 API Key"})
                 else:
-                    stream_response = model_config.call_siliconflow(model_name, prompt, api_key, stream=True)
-                    for line in stream_response.iter_lines():
-                        if not line:
-                            continue
-                        line = line.decode("utf-8")
-                        if not line.startswith("data: "):
-                            continue
-                        data_str = line[6:]
-                        if data_str.strip() == "[DONE]":
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            if "choices" in data and len(data["choices"]) > 0:
-                                delta = data["choices"][0].get("delta", {}).get("content", "")
-                                if delta:
-                                    yield (
-                                        json.dumps({"type": "delta", "content": delta}, ensure_ascii=False) + "\n"
-                                    ).encode("utf-8")
-                        except json.JSONDecodeError:
-                            continue
+                    for delta in model_config.stream_siliconflow(model_name, prompt, api_key):
+                        metrics.activate(request_trace)
+                        timer.delta(delta)
+                        yield _event({"type": "delta", "content": delta})
         except Exception as exc:
-            yield (
-                json.dumps({"type": "error", "message": f"生成答案失败: {str(exc)}"}, ensure_ascii=False) + "\n"
-            ).encode("utf-8")
+            status = "error"
+            yield _event({"type": "error", "message": f"生成答案失败: {str(exc)}"})
+        metrics.activate(request_trace)
+        if status == "ok" or timer.first is not None:
+            timer.finish()
 
-        # 7. 标志结束
-        yield (json.dumps({"type": "done"}, ensure_ascii=False) + "\n").encode("utf-8")
+        # 6. 标志结束
+        yield _event(self._done_event(request_trace, trace, status))
@@ -1,65 +1,95 @@
-from typing import Optional
+from typing import List, Optional
 
 import model_config
+from backend.services import metrics
+
+# 关键词 -> 意图简称
+SIMPLE_INTENTS = {
+    "怎么办": ["简介", "治疗", "药品", "检查"],
+    "吃什么": ["药品", "宜吃"],
+    "不能吃": ["忌吃"],
+    "症状": ["简介", "症状"],
+    "原因": ["简介", "病因"],
+    "预防": ["简介", "预防"],
+    "检查": ["简介", "检查"],
+    "治疗": ["简介", "治疗", "药品"],
+    "并发": ["简介", "并发"],
+    "生产": ["生产商"],
+    "多久": ["简介", "治疗周期", "治愈概率"],
+    "几天": ["简介", "治疗周期", "治愈概率"],
+    "多长时间": ["简介", "治疗周期"],
+    "能好": ["简介", "治疗周期", "治愈概率"],
+    "能治好": ["简介", "治疗", "治愈概率"],
+    "治愈": ["简介", "治愈概率", "治疗"],
+    "痊愈": ["简介", "治愈概率", "治疗周期"],
+    "恢复": ["简介", "治疗周期", "治愈概率"],
+}
+
+# 意图简称 -> 意图全称
+INTENT_NAMES = {
+    "简介": "查询疾病简介",
+    "治疗": "查询疾病的治疗方法",
+    "药品": "查询疾病所需药品",
+    "宜吃": "查询疾病宜吃食物",
+    "忌吃": "查询疾病忌吃食物",
+    "检查": "查询疾病所需检查项目",
+    "症状": "查询疾病的症状",
+    "病因": "查询疾病病因",
+    "预防": "查询疾病预防措施",
+    "并发": "查询疾病的并发疾病",
+    "生产商": "查询药品的生产商",
+    "治疗周期": "查询治疗周期",
+    "治愈概率": "查询治愈概率",
+}
 
 
 class IntentService:
     def __init__(self):
-        self._simple_intents = {
-            "怎么办": ["简介", "治疗", "药品", "检查"],
-            "吃什么": ["药品", "宜吃"],
-            "不能吃": ["忌吃"],
-            "症状": ["简介", "症状"],
-            "原因": ["简介", "病因"],
-            "预防": ["简介", "预防"],
-            "检查": ["简介", "检查"],
-            "治疗": ["简介", "治疗", "药品"],
-            "并发": ["简介", "并发"],
-            "生产": ["生产商"],
-            "多久": ["简介", "治疗周期", "治愈概率"],
-            "几天": ["简介", "治疗周期", "治愈概率"],
-            "多长时间": ["简介", "治疗周期"],
-            "能好": ["简介", "治疗周期", "治愈概率"],
-            "能治好": ["简介", "治疗", "治愈概率"],
-            "治愈": ["简介", "治愈概率", "治疗"],
-            "痊愈": ["简介", "治愈概率", "治疗周期"],
-            "恢复": ["简介", "治疗周期", "治愈概率"],
-        }
+        self._simple_intents = SIMPLE_INTENTS
 
     def recognize(self, query: str, model_name: str, model_type: str, api_key: Optional[str]) -> str:
+        # 耗时按实际走的分支记录为 intent.keyword / intent.llm
+        with metrics.span("intent.keyword") as info:
+            result = self._match_keywords(query)
+            if result is not None:
+                return result
+            info["stage"] = "intent.llm"
+            try:
+                return model_config.call_model(model_name, self._llm_prompt(query), model_type, api_key, stream=False)
+            except Exception:
+                info["fallback"] = True
+                return "[查询疾病简介] # 默认意图"
+
+    async def recognize_async(self, query: str, model_name: str, model_type: str, api_key: Optional[str]) -> str:
+        """recognize 的异步版本，需要调用大模型时使用异步 HTTP 请求"""
+        with metrics.span("intent.keyword") as info:
+            result = self._match_keywords(query)
+            if result is not None:
+                return result
+            info["stage"] = "intent.llm"
+            try:
+                return await model_config.acall_model(model_name, self._llm_prompt(query), model_type, api_key)
+            except Exception:
+                info["fallback"] = True
+                return "[查询疾病简介] # 默认意图"
+
+    def _match_keywords(self, query: str) -> Optional[str]:
+        """按关键词表识别意图，没有关键词命中时返回 None"""
         for keyword, intents in self._simple_intents.items():
             if keyword in query:
-                intent_list = []
-                for intent in intents:
-                    if intent == "简介":
-                        intent_list.append("查询疾病简介")
-                    elif intent == "治疗":
-                        intent_list.append("查询疾病的治疗方法")
-                    elif intent == "药品":
-                        intent_list.append("查询疾病所需药品")
-                    elif intent == "宜吃":
-                        intent_list.append("查询疾病宜吃食物")
-                    elif intent == "忌吃":
-                        intent_list.append("查询疾病忌吃食物")
-                    elif intent == "检查":
-                        intent_list.append("查询疾病所需检查项目")
-                    elif intent == "症状":
-                        intent_list.append("查询疾病的症状")
-                    elif intent == "病因":
-                        intent_list.append("查询疾病病因")
-                    elif intent == "预防":
-                        intent_list.append("查询疾病预防措施")
-                    elif intent == "并发":
-                        intent_list.append("查询疾病的并发疾病")
-                    elif intent == "生产商":
-                        intent_list.append("查询药品的生产商")
-                    elif intent == "治疗周期":
-                        intent_list.append("查询治疗周期")
-                    elif intent == "治愈概率":
-                        intent_list.append("查询治愈概率")
+                intent_list = [INTENT_NAMES[intent] for intent in intents]
                 return f"{intent_list} # 根据关键词'{keyword}'匹配"
+        return None
+
+    @staticmethod
+    def intent_names(result: str) -> List[str]:
+        """从 recognize 的返回文本中按出现顺序提取意图名称，用于在生成提示词前先行展示"""
+        found = {name: result.find(name) for name in set(INTENT_NAMES.values()) if name in result}
+        return sorted(found, key=found.get)
 
-        prompt = f"""
+    @staticmethod
+    def _llm_prompt(query: str) -> str:
+        return f"""
 你是医疗意图识别专家。分析用户问题："{query}"
 
 从以下类别选择最相关的（可多选，最多3个）：
@@ -77,7 +107,3 @@ class IntentService:
 
 直接输出：["类别1", "类别2"]
 """
-        try:
-            return model_config.call_model(model_name, prompt, model_type, api_key, stream=False)
-        except Exception:
-            return "[查询疾病简介] # 默认意图"
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Optional
+
+from backend.services.ttl_cache import TTLCache
+
+"""
+知识检索缓存
+缓存 PromptService 对知识图谱的查询结果，键为 (查询类型, 实体, 属性/关系, 目标标签)。
+图谱只会在重新运行 build_up_graph.py 时变化，该脚本导入完成后会更新图谱版本文件，
+缓存只检查该文件的修改时间来判断是否失效，命中时完全不访问 Neo4j。
+同时记录各疾病被查询的次数并持久化，供服务启动后预热高频疾病。
+"""
+
+# 图谱版本文件，由 build_up_graph.py 在导入完成后写入
+GRAPH_VERSION_PATH = os.path.join("tmp_data", "graph_version")
+# 疾病查询频次文件
+FREQUENCY_PATH = os.path.join("tmp_data", "knowledge_frequency.json")
+
+
+class KnowledgeCache:
+    def __init__(
+        self,
+        maxsize: int = 8192,
+        version_path: str = GRAPH_VERSION_PATH,
+        frequency_path: str = FREQUENCY_PATH,
+        save_every: int = 50,
+    ):
+        # 图谱数据只随重新构建而变化，条目不设过期时间，仅按容量淘汰
+        self._cache = TTLCache(maxsize=maxsize, ttl=None)
+        self._version_path = version_path
+        self._version = self._read_version()
+        self._frequency_path = frequency_path
+        self._frequency = self._load_frequency()
+        self._save_every = save_every
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def _read_version(self) -> Optional[int]:
+        try:
+            return os.stat(self._version_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_version(self) -> None:
+        """图谱版本文件变化（重新构建过图谱）时清空缓存"""
+        version = self._read_version()
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def get(self, key: Hashable) -> Any:
+        """查找缓存的查询结果，未命中返回 None"""
+        self._check_version()
+        return self._cache.get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._cache.set(key, value)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats["graph_version"] = self._version
+        stats["tracked_entities"] = len(self._frequency)
+        return stats
+
+    # ========== 查询频次统计 ==========
+
+    def _load_frequency(self) -> Counter:
+        try:
+            with open(self._frequency_path, "r", encoding="utf-8") as f:
+                return Counter(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return Counter()
+
+    def save_frequency(self) -> None:
+        """将查询频次写回磁盘"""
+        with self._lock:
+            data = dict(self._frequency)
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self._frequency_path), exist_ok=True)
+            with open(self._frequency_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def record(self, entity: str) -> None:
+        """记录一次实体查询，每累计 save_every 次写回一次磁盘"""
+        with self._lock:
+            self._frequency[entity] += 1
+            self._unsaved += 1
+            should_save = self._unsaved >= self._save_every
+        if should_save:
+            self.save_frequency()
+
+    def top_entities(self, n: int) -> List[str]:
+        """返回被查询次数最多的 n 个实体"""
+        with self._lock:
+            return [entity for entity, _ in self._frequency.most_common(n)]
@@ -0,0 +1,239 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+"""
+耗时统计与 Prometheus 指标导出
+各服务用 span()/record() 记录阶段耗时：汇总进直方图（/metrics 以 Prometheus 文本格式导出），
+同时追加到当前请求的 Trace（通过 contextvars 传递），问答结束时可随 done 事件返回逐阶段明细。
+线程池中执行的阶段需用 run_in_context 提交，才能把耗时记到发起请求的 Trace 上。
+不依赖 prometheus_client，只实现本项目用到的直方图与计数器。
+"""
+
+# 秒级耗时的桶：覆盖从亚毫秒的缓存命中到数十秒的大模型生成
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 生成速度（token/s）的桶
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签取值 -> (各桶计数（非累计）, 总和, 样本数)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total, n) for key, (counts, total, n) in sorted(self._series.items())]
+        for key, counts, total, n in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for key, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "healthrag_stage_duration_seconds", "Duration of each chat pipeline stage.", ["stage"]))
+CHAT_SECONDS = REGISTRY.register(Histogram(
+    "healthrag_chat_duration_seconds", "End-to-end duration of a chat request.", ["status"]))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.register(Histogram(
+    "healthrag_llm_time_to_first_token_seconds", "Time from sending the prompt to the first answer delta.",
+    ["backend"]))
+LLM_TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "healthrag_llm_tokens_per_second", "Answer generation speed after the first token (estimated tokens).",
+    ["backend"], buckets=RATE_BUCKETS))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "healthrag_llm_generated_tokens_total", "Generated answer tokens (estimated).", ["backend"]))
+
+
+class Trace:
+    """一次请求的逐阶段耗时明细，可被多个线程同时追加"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, stage: str, start: float, seconds: float, **attrs: Any) -> None:
+        span = {"stage": stage, "start_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round(seconds * 1000, 2)}
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span["start_ms"])
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("healthrag_trace", default=None)
+
+
+def start_trace() -> Trace:
+    """为当前请求（当前上下文）开始一个新的 Trace"""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def activate(trace: Optional[Trace]) -> None:
+    """
+    把 trace 设为当前上下文的 Trace。
+    同步生成器由 Starlette 逐块在线程池中迭代，每次迭代的上下文都是新复制的，
+    因此生成器在每段调用其他服务的代码前都要重新激活。
+    """
+    _current_trace.set(trace)
+
+
+def record(stage: str, seconds: float, start: Optional[float] = None, **attrs: Any) -> None:
+    """记录一段已测得的耗时：写入直方图，并追加到当前 Trace（start 为 perf_counter 起点，缺省按结束于此刻推算）"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, time.perf_counter() - seconds if start is None else start, seconds, **attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    计时代码块。产出的字典可在块内补充属性（如 attrs["stage"] 改为实际走的分支）。
+    块内抛出异常时同样记录，并带上 error 属性。
+    """
+    info: Dict[str, Any] = dict(attrs, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException as exc:
+        info["error"] = type(exc).__name__
+        raise
+    finally:
+        name = info.pop("stage")
+        record(name, time.perf_counter() - start, start, **info)
+
+
+def run_in_context(fn: Callable, *args: Any) -> Callable[[], Any]:
+    """把 fn(*args) 绑定到当前上下文，供提交到线程池（线程池不会自动传递 contextvars）"""
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args)
+
+
+class GenerationTimer:
+    """大模型生成计时：首个增量的等待时间（TTFT）与之后的生成速度"""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self._parts: List[str] = []
+
+    def delta(self, text: str) -> None:
+        if self.first is None:
+            self.first = time.perf_counter()
+            LLM_FIRST_TOKEN_SECONDS.observe(self.first - self.start, backend=self.backend)
+            record("llm.first_token", self.first - self.start, self.start)
+        self._parts.append(text)
+
+    def finish(self) -> None:
+        """生成结束（含出错）时调用，token 数按回答文本估算"""
+        from backend.services.prompt_budget import estimate_tokens
+
+        end = time.perf_counter()
+        tokens = estimate_tokens("".join(self._parts))
+        attrs: Dict[str, Any] = {"tokens": tokens}
+        if self.first is not None and tokens > 1 and end > self.first:
+            rate = (tokens - 1) / (end - self.first)
+            LLM_TOKENS_PER_SECOND.observe(rate, backend=self.backend)
+            attrs["tokens_per_s"] = round(rate, 1)
+        LLM_TOKENS.inc(tokens, backend=self.backend)
+        record("llm.generate", end - self.start, self.start, **attrs)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,6 +1,8 @@
 import os
 import sys
-from typing import Dict, List
+import threading
+import time
+from typing import Any, Dict, List, Optional
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if PROJECT_ROOT not in sys.path:
@@ -8,7 +10,72 @@ if PROJECT_ROOT not in sys.path:
 
 import model_config
 
+"""
+模型列表服务
+本地 Ollama 模型列表保存在内存中，请求直接返回缓存值及其存在时长，不在请求线程中发现模型。
+尚无缓存或缓存超过 ttl 秒时由后台线程刷新（优先 HTTP /api/tags，失败时回退到 'ollama list'），
+刷新期间立即返回当前值（服务刚启动时为空列表，refreshing 为 True）；刷新失败时保留旧值并记录错误。
+"""
+
 
 class ModelService:
-    def get_available_models(self) -> Dict[str, List[str]]:
-        return model_config.get_available_models()
+    def __init__(self, ttl: float = 60.0, timeout: float = 5.0):
+        # ttl: 缓存存活时间（秒）；timeout: 单次发现的超时时间
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._models: List[str] = []
+        self._source: Optional[str] = None
+        self._updated_at: Optional[float] = None   # 上次成功刷新的时间（monotonic）
+        self._checked_at: Optional[float] = None   # 上次尝试刷新的时间，失败时据此避免频繁重试
+        self._error: Optional[str] = None
+        self._refreshing: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """同步发现一次本地模型并更新缓存"""
+        try:
+            models, source = model_config.discover_ollama_models(self.timeout)
+        except Exception as exc:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._error = str(exc)
+            return
+        with self._lock:
+            self._models, self._source = models, source
+            self._updated_at = self._checked_at = time.monotonic()
+            self._error = None
+
+    def refresh_async(self) -> threading.Thread:
+        """在后台线程中刷新缓存；已有刷新在进行时直接返回该线程"""
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return self._refreshing
+            thread = threading.Thread(target=self.refresh, name="model-discovery", daemon=True)
+            self._refreshing = thread
+        thread.start()
+        return thread
+
+    def get_available_models(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        返回 {'local', 'siliconflow', 'cache_age', 'source', 'error', 'refreshing'}。
+        cache_age 为本地模型列表距上次成功刷新的秒数，从未成功时为 None；
+        refreshing 表示后台刷新正在进行，调用方可稍后重新获取。
+        force_refresh 为 True 时先同步刷新再返回，否则不等待刷新、立即返回缓存值。
+        """
+        if force_refresh:
+            self.refresh()
+        with self._lock:
+            checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at > self.ttl:
+            self.refresh_async()
+
+        with self._lock:
+            age = None if self._updated_at is None else time.monotonic() - self._updated_at
+            return {
+                "local": list(self._models),
+                "siliconflow": list(model_config.SILICONFLOW_MODELS),
+                "cache_age": age,
+                "source": self._source,
+                "error": self._error,
+                "refreshing": self._refreshing is not None and self._refreshing.is_alive(),
+            }
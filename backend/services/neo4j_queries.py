@@ -0,0 +1,78 @@
+from typing import Dict
+
+# 实体名称全文索引（由 build_up_graph.py 创建，cjk 分析器）
+FULLTEXT_INDEX = "entity_name_fulltext"
+
+"""
+Neo4j 查询模板注册表
+后端使用的全部 Cypher 语句集中在此定义。实体名、节点 ID、标签过滤、数量限制、属性名与关系类型
+一律通过参数传入，不拼接进查询文本：同一模板的查询文本始终不变，可以命中 Neo4j 的执行计划缓存，
+实体名中含有引号等特殊字符时也不会破坏语句。
+"""
+
+QUERIES: Dict[str, str] = {
+    # ========== 问答知识检索 (prompt_service) ==========
+    # 单次往返取回一次问答所需的全部知识：
+    #   1. 未给出疾病时，用症状反查疾病（取第一个候选）；
+    #   2. 取出该疾病被请求的全部属性（$props 为属性名列表）与关系目标（$rels 为 [关系名, 目标标签] 列表）；
+    #   3. 同时查询药品的生产商。
+    # 各参数为 null 或空列表时对应部分不产生任何结果。
+    "knowledge.retrieve": """
+OPTIONAL MATCH (sd:疾病)-[:疾病的症状]->(:疾病症状 {名称: $symptom})
+WITH collect(sd.名称) AS symptom_diseases
+WITH symptom_diseases, coalesce($disease, head(symptom_diseases)) AS disease_name
+OPTIONAL MATCH (d:疾病 {名称: disease_name})
+OPTIONAL MATCH (m:药品商)-[:生产]->(:药品 {名称: $drug})
+WITH symptom_diseases, disease_name, d, collect(m.名称) AS makers
+RETURN symptom_diseases, disease_name,
+       CASE WHEN d IS NULL THEN [] ELSE [p IN $props | d[p]] END AS props,
+       CASE WHEN d IS NULL THEN [] ELSE [r IN $rels |
+           [(d)-[rel]->(b) WHERE type(rel) = r[0] AND r[1] IN labels(b) | b.名称]] END AS rels,
+       makers
+LIMIT 1
+""",
+
+    # ========== 知识图谱可视化 (neo4j_service) ==========
+    # $labels 为空列表时不过滤节点类型
+    "graph.overview_nodes": """
+MATCH (n)
+WHERE size($labels) = 0 OR any(label IN labels(n) WHERE label IN $labels)
+RETURN id(n) AS node_id, n, labels(n) AS node_labels
+LIMIT $limit
+""",
+    "graph.edges_between": """
+MATCH (n)-[r]->(m)
+WHERE id(n) IN $ids AND id(m) IN $ids
+RETURN id(n) AS source_id, id(m) AS target_id, type(r) AS rel_type
+LIMIT $limit
+""",
+    # 先用全文索引按短语召回候选，再用 CONTAINS 精确过滤，结果与 graph.search_nodes 一致
+    "graph.search_nodes_fulltext": """
+CALL db.index.fulltext.queryNodes('%s', $phrase) YIELD node AS n
+WHERE n.名称 CONTAINS $query
+RETURN id(n) AS node_id, n, labels(n) AS node_labels
+LIMIT $limit
+""" % FULLTEXT_INDEX,
+    "graph.search_nodes": """
+MATCH (n)
+WHERE n.名称 CONTAINS $query
+RETURN id(n) AS node_id, n, labels(n) AS node_labels
+LIMIT $limit
+""",
+    "graph.neighbors": """
+MATCH (n)-[r]-(m)
+WHERE id(n) IN $ids AND (size($labels) = 0 OR any(label IN labels(m) WHERE label IN $labels))
+RETURN id(n) AS source_id, id(m) AS target_id, m, labels(m) AS m_labels, type(r) AS rel_type
+LIMIT $limit
+""",
+    "graph.node_details": """
+MATCH (n)
+WHERE id(n) = $id
+RETURN n, labels(n) AS labels
+""",
+}
+
+
+def get_query(name: str) -> str:
+    """按名称获取查询模板，未注册的名称抛出 KeyError"""
+    return QUERIES[name]
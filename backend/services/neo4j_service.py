@@ -1,42 +1,141 @@
+import asyncio
+import re
 from typing import Any, Dict, List, Optional
 
-import py2neo
+from neo4j import AsyncGraphDatabase, GraphDatabase, READ_ACCESS
+from neo4j.exceptions import ClientError
+
+from backend.services.neo4j_queries import get_query
 
 """
 Neo4j 图数据库服务类
 负责管理与 Neo4j 数据库的连接、身份验证以及状态监控。
 提供了自动尝试多种常用默认密码的机制，提高连接成功率。
+基于官方驱动的连接池：并发请求各自从池中借用连接，所有查询在托管读事务中执行，
+查询语句统一来自 neo4j_queries 中的参数化模板。
+异步问答流程使用同一账号另建的异步驱动（在事件循环中首次使用时创建）。
 """
 
+
+# Lucene 查询语法中的特殊字符
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def fulltext_phrase(query: str) -> str:
+    """将搜索关键词转义为 Lucene 短语查询"""
+    return '"%s"' % _LUCENE_SPECIAL.sub(r"\\\1", query)
+
+
+def _is_missing_fulltext_index(error: Exception) -> bool:
+    """全文索引不存在时 db.index.fulltext.queryNodes 报错 "There is no such fulltext schema index" """
+    message = f"{getattr(error, 'message', '')} {error}".lower()
+    return isinstance(error, ClientError) and "no such fulltext schema index" in message
+
+
+class QueryResult:
+    """查询结果，兼容 py2neo 风格的 .data() 调用"""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self._records = records
+
+    def data(self) -> List[Dict[str, Any]]:
+        return self._records
+
+
+class Neo4jClient:
+    """
+    连接池客户端。每次查询从驱动的连接池中借用一个会话，在托管读事务中执行
+    （遇到瞬时错误时由驱动自动重试），结果转换为普通字典后立即归还连接。
+    """
+
+    def __init__(self, driver, database: Optional[str] = None):
+        self._driver = driver
+        self._database = database
+
+    def read(self, cypher: str, parameters: Optional[Dict[str, Any]] = None, **kwparameters) -> List[Dict[str, Any]]:
+        """在托管读事务中执行查询，返回记录字典列表"""
+        params = dict(parameters or {}, **kwparameters)
+        with self._driver.session(database=self._database, default_access_mode=READ_ACCESS) as session:
+            return session.execute_read(lambda tx: tx.run(cypher, params).data())
+
+    def run(self, cypher: str, parameters: Optional[Dict[str, Any]] = None, **kwparameters) -> QueryResult:
+        """兼容 py2neo.Graph.run(...).data() 的调用方式"""
+        return QueryResult(self.read(cypher, parameters, **kwparameters))
+
+    def close(self) -> None:
+        self._driver.close()
+
+
+class AsyncNeo4jClient:
+    """异步连接池客户端，接口与 Neo4jClient 相同（方法均为协程），供异步问答流程使用"""
+
+    def __init__(self, driver, database: Optional[str] = None):
+        self._driver = driver
+        self._database = database
+
+    @staticmethod
+    async def _read_tx(tx, cypher: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        result = await tx.run(cypher, params)
+        return await result.data()
+
+    async def read(self, cypher: str, parameters: Optional[Dict[str, Any]] = None,
+                   **kwparameters) -> List[Dict[str, Any]]:
+        """在托管读事务中执行查询，返回记录字典列表"""
+        params = dict(parameters or {}, **kwparameters)
+        async with self._driver.session(database=self._database, default_access_mode=READ_ACCESS) as session:
+            return await session.execute_read(self._read_tx, cypher, params)
+
+    async def run(self, cypher: str, parameters: Optional[Dict[str, Any]] = None, **kwparameters) -> QueryResult:
+        return QueryResult(await self.read(cypher, parameters, **kwparameters))
+
+    async def close(self) -> None:
+        await self._driver.close()
+
+
 class Neo4jService:
-    def __init__(self):
-        # 内部保存 py2neo.Graph 客户端实例
-        self._client = None
+    def __init__(
+        self,
+        uri: str = "bolt://localhost:7687",
+        user: str = "neo4j",
+        database: Optional[str] = None,
+        max_connection_pool_size: int = 50,
+        connection_acquisition_timeout: float = 5.0,
+        connection_timeout: float = 5.0,
+        max_transaction_retry_time: float = 5.0,
+    ):
+        self._uri = uri
+        self._user = user
+        self._database = database
+        # 连接池配置：池大小决定最大并发查询数，借用连接超过 acquisition_timeout 秒则报错而不是无限等待；
+        # 托管事务遇到瞬时错误时最多重试 max_transaction_retry_time 秒，避免一次问答被长时间阻塞
+        self._pool_config = {
+            "max_connection_pool_size": max_connection_pool_size,
+            "connection_acquisition_timeout": connection_acquisition_timeout,
+            "connection_timeout": connection_timeout,
+            "max_transaction_retry_time": max_transaction_retry_time,
+        }
+        # 内部保存连接池客户端实例
+        self._client: Optional[Neo4jClient] = None
+        # 异步客户端及其所属事件循环；连接成功的账号密码用于创建异步驱动
+        self._async_client: Optional[AsyncNeo4jClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._auth: Optional[tuple] = None
         # 记录当前是否已成功连接
         self._connected = False
         # 记录最后一次连接错误的详细信息
         self._last_error: Optional[str] = None
+        # 全文索引是否可用（查询报告索引不存在后置为 False，重新连接时重置）
+        self._fulltext_available = True
 
-    def _connection_attempts(self, custom_password: Optional[str]) -> List[Dict[str, str]]:
+    def _connection_attempts(self, custom_password: Optional[str]) -> List[str]:
         """
-        构造一系列连接尝试方案。
+        构造一系列待尝试的密码。
         包含常见的默认配置和用户提供的自定义密码。
         """
-        attempts = [
-            {"uri": "bolt://localhost:7687", "user": "neo4j", "password": "neo4j"},
-            {"uri": "bolt://localhost:7687", "user": "neo4j", "password": "password"},
-            {"uri": "bolt://localhost:7687", "user": "neo4j", "password": "asd2528836683"},
-            {"uri": "bolt://localhost:7687", "user": "neo4j", "password": "12345678"},
-            {"uri": "bolt://localhost:7687", "user": "neo4j", "password": "admin"},
-            {"uri": "http://localhost:7474", "user": "neo4j", "password": "neo4j"},
-            {"uri": "http://localhost:7474", "user": "neo4j", "password": "password"},
-        ]
+        attempts = ["neo4j", "password", "asd2528836683", "12345678", "admin"]
         # 如果用户手动输入了密码，将其置于最高优先级
         if custom_password:
-            attempts.insert(
-                0,
-                {"uri": "bolt://localhost:7687", "user": "neo4j", "password": custom_password},
-            )
+            attempts.insert(0, custom_password)
         return attempts
 
     def connect(self, custom_password: Optional[str] = None) -> bool:
@@ -44,44 +143,73 @@ class Neo4jService:
         尝试建立数据库连接。
         遍历所有预设的尝试方案，直到成功或全部失败。
         """
-        self._client = None
-        self._connected = False
+        self.close()
         self._last_error = None
+        self._fulltext_available = True
 
-        for attempt in self._connection_attempts(custom_password):
+        for password in self._connection_attempts(custom_password):
+            driver = None
             try:
-                # 根据协议选择连接方式
-                if attempt["uri"].startswith("bolt"):
-                    client = py2neo.Graph(attempt["uri"], auth=(attempt["user"], attempt["password"]))
-                else:
-                    client = py2neo.Graph(
-                        attempt["uri"],
-                        user=attempt["user"],
-                        password=attempt["password"],
-                        name="neo4j",
-                    )
-                # 执行一个简单的查询以验证连接有效性
-                client.run("RETURN 1")
-                self._client = client
+                driver = GraphDatabase.driver(self._uri, auth=(self._user, password), **self._pool_config)
+                # 验证连接与身份认证是否有效（不走事务重试，失败立即尝试下一个密码）
+                driver.verify_connectivity()
+                self._client = Neo4jClient(driver, self._database)
+                self._auth = (self._user, password)
                 self._connected = True
                 return True
             except Exception as exc:
                 self._last_error = str(exc)
+                if driver is not None:
+                    driver.close()
 
         return False
 
+    def close(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._connected = False
+        self._auth = None
+        # 异步驱动只能在其所属的事件循环中关闭
+        client, loop = self._async_client, self._async_loop
+        self._async_client = self._async_loop = None
+        if client is not None and loop is not None and not loop.is_closed():
+            try:
+                if asyncio.get_running_loop() is loop:
+                    loop.create_task(client.close())
+                    return
+            except RuntimeError:
+                pass
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.close(), loop)
+
     def status(self) -> Dict[str, Any]:
         """返回当前连接状态信息"""
         return {
             "connected": self._connected,
             "error": self._last_error,
+            "uri": self._uri,
+            "pool": self._pool_config,
         }
 
     @property
-    def client(self) -> Optional[py2neo.Graph]:
-        """获取底层 py2neo 客户端实例"""
+    def client(self) -> Optional[Neo4jClient]:
+        """获取连接池客户端实例"""
         return self._client
 
+    @property
+    def async_client(self) -> Optional[AsyncNeo4jClient]:
+        """获取异步客户端实例（需在事件循环中访问），未连接时返回 None"""
+        if not self._connected or self._auth is None:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            driver = AsyncGraphDatabase.driver(self._uri, auth=self._auth, **self._pool_config)
+            self._async_client = AsyncNeo4jClient(driver, self._database)
+            self._async_loop = loop
+        return self._async_client
+
     def get_graph_overview(self, limit: int = 100, node_types: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         获取知识图谱概览数据，用于可视化展示。
@@ -101,15 +229,10 @@ class Neo4jService:
             edges = []
             node_id_set = set()  # 用于去重
             
-            # 构建节点类型过滤条件，直接返回 Neo4j 的 id(n)
-            if node_types:
-                label_conditions = " OR ".join([f"'{nt}' IN labels(n)" for nt in node_types])
-                node_query = f"MATCH (n) WHERE {label_conditions} RETURN id(n) as node_id, n, labels(n) as node_labels LIMIT {limit}"
-            else:
-                node_query = f"MATCH (n) RETURN id(n) as node_id, n, labels(n) as node_labels LIMIT {limit}"
-            
-            # 查询节点
-            result = self._client.run(node_query).data()
+            # 查询节点（节点类型为空列表时不过滤），直接返回 Neo4j 的 id(n)
+            result = self._client.read(
+                get_query("graph.overview_nodes"), {"labels": node_types or [], "limit": limit}
+            )
             neo4j_node_ids = []  # 存储 Neo4j 的节点 ID（整数）
             
             for record in result:
@@ -138,14 +261,9 @@ class Neo4jService:
             
             # 查询这些节点之间的关系
             if neo4j_node_ids:
-                rel_query = f"""
-                MATCH (n)-[r]->(m)
-                WHERE id(n) IN {neo4j_node_ids} AND id(m) IN {neo4j_node_ids}
-                RETURN id(n) as source_id, id(m) as target_id, type(r) as rel_type
-                LIMIT {limit * 2}
-                """
-                
-                rel_result = self._client.run(rel_query).data()
+                rel_result = self._client.read(
+                    get_query("graph.edges_between"), {"ids": neo4j_node_ids, "limit": limit * 2}
+                )
                 for record in rel_result:
                     edges.append({
                         "from": str(record["source_id"]),
@@ -185,15 +303,7 @@ class Neo4jService:
             node_id_set = set()  # 用于去重
             
             # 第一步：搜索匹配关键词的中心节点（不限类型）
-            search_query = f"""
-            MATCH (n)
-            WHERE n.名称 CONTAINS $query
-            RETURN id(n) as node_id, n, labels(n) as node_labels
-            LIMIT {limit}
-            """
-            
-            # 执行搜索
-            result = self._client.run(search_query, query=query).data()
+            result = self._search_center_nodes(query, limit)
             center_node_ids = []  # Neo4j 整数 ID
             center_node_map = {}  # 暂存中心节点数据，稍后根据是否有邻居来决定是否添加
             
@@ -221,25 +331,10 @@ class Neo4jService:
             # 第二步：查询这些节点的一级邻居
             # 如果指定了 node_types，则只返回指定类型的邻居节点
             if center_node_ids:
-                if node_types:
-                    # 构建邻居类型过滤条件
-                    label_conditions = " OR ".join([f"'{nt}' IN labels(m)" for nt in node_types])
-                    neighbor_query = f"""
-                    MATCH (n)-[r]-(m)
-                    WHERE id(n) IN {center_node_ids} AND ({label_conditions})
-                    RETURN id(n) as source_id, id(m) as target_id, m, labels(m) as m_labels, type(r) as rel_type
-                    LIMIT {limit * 3}
-                    """
-                else:
-                    # 不过滤邻居类型
-                    neighbor_query = f"""
-                    MATCH (n)-[r]-(m)
-                    WHERE id(n) IN {center_node_ids}
-                    RETURN id(n) as source_id, id(m) as target_id, m, labels(m) as m_labels, type(r) as rel_type
-                    LIMIT {limit * 3}
-                    """
-                
-                neighbor_result = self._client.run(neighbor_query).data()
+                neighbor_result = self._client.read(
+                    get_query("graph.neighbors"),
+                    {"ids": center_node_ids, "labels": node_types or [], "limit": limit * 3},
+                )
                 center_nodes_with_neighbors = set()  # 记录有符合条件邻居的中心节点
                 
                 for record in neighbor_result:
@@ -305,6 +400,25 @@ class Neo4jService:
         except Exception as e:
             return {"nodes": [], "edges": [], "error": f"搜索失败: {str(e)}"}
 
+    def _search_center_nodes(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        优先使用全文索引召回名称包含关键词的节点；全文索引不存在或没有召回结果
+        （例如单字关键词无法命中二元组索引）时，退回到 CONTAINS 扫描。
+        """
+        params = {"query": query, "limit": limit}
+        if self._fulltext_available:
+            try:
+                result = self._client.read(
+                    get_query("graph.search_nodes_fulltext"), dict(params, phrase=fulltext_phrase(query))
+                )
+                if result:
+                    return result
+            except Exception as e:
+                # 全文索引尚未创建：本次连接内不再尝试；其他错误（如超时）只对本次查询退回扫描
+                if _is_missing_fulltext_index(e):
+                    self._fulltext_available = False
+        return self._client.read(get_query("graph.search_nodes"), params)
+
     def get_node_details(self, node_id: str) -> Dict[str, Any]:
         """
         获取单个节点的详细信息。
@@ -319,13 +433,7 @@ class Neo4jService:
             return {"error": "未连接到 Neo4j"}
         
         try:
-            query = f"""
-            MATCH (n)
-            WHERE id(n) = {int(node_id)}
-            RETURN n, labels(n) as labels
-            """
-            
-            result = self._client.run(query).data()
+            result = self._client.read(get_query("graph.node_details"), {"id": int(node_id)})
             
             if not result:
                 return {"error": "节点不存在"}
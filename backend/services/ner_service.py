@@ -1,13 +1,20 @@
 import os
 import pickle
+import queue
 import sys
+import string
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
 from functools import lru_cache
-from typing import Dict, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 """
 NER 服务封装类
 负责加载预训练的命名实体识别模型，并提供查询接口。
-为了提高性能，模型实例被缓存（LRU Cache）。
+为了提高性能，模型实例被缓存（LRU Cache），并发请求会被合并为批量前向计算，
+识别结果按规范化后的查询文本缓存（LRU + TTL）。
 """
 
 # 动态添加项目根目录到 Python 路径，确保可以导入根目录下的 ner_model 模块
@@ -20,11 +27,157 @@ from transformers import BertTokenizer
 
 # 导入根目录下的 ner_model 模块（定义了模型架构和推理逻辑）
 import ner_model as zwk
+import entity_lexicon
+import lexicon_artifact
+from backend.services import metrics
+from backend.services.ttl_cache import TTLCache
+
+# 规范化时去除的标点（中英文）
+_PUNCTUATION = set(string.punctuation) | set("，。！？；：、“”‘’（）《》【】…—·～")
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询文本作为缓存键：全角转半角（NFKC）、英文转小写、去除空白与标点。
+    例如 "感冒 怎么办？" 与 "感冒怎么办" 得到相同的键。
+    """
+    query = unicodedata.normalize("NFKC", query).lower()
+    return "".join(ch for ch in query if not ch.isspace() and ch not in _PUNCTUATION)
+
+
+class _NerBatcher:
+    """
+    微批处理队列：在一个很短的时间窗口内收集并发到达的查询，合并成一次补齐后的前向计算。
+    后台线程只负责模型预测，BIO 解码、规则匹配和对齐仍由各请求线程自行完成。
+    """
+
+    def __init__(self, predict: Callable[[List[str], Dict[str, float]], List[List[str]]], max_batch_size: int,
+                 window_ms: float):
+        self._predict = predict
+        self._max_batch_size = max_batch_size
+        self._window = window_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, query: str) -> Future:
+        """
+        提交一条查询，返回的 Future 在所属批次预测完成后给出
+        (该查询的标签序列, 该批次 tokenize/forward 耗时字典, 批大小)
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ner-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        # 阻塞等待第一条请求，随后在窗口期内尽量凑满一个批次
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self._window
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            timings: Dict[str, float] = {}
+            try:
+                all_tags = self._predict([query for query, _ in batch], timings)
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), tags in zip(batch, all_tags):
+                future.set_result((tags, timings, len(batch)))
+
 
 class NerService:
-    def __init__(self, cache_model: str = "best_roberta_rnn_model_ent_aug"):
+    def __init__(
+        self,
+        cache_model: str = "best_roberta_rnn_model_ent_aug",
+        max_batch_size: int = 16,
+        batch_window_ms: float = 5.0,
+        inference_mode: str = "fp32",
+        torchscript: bool = False,
+        cache_size: int = 2048,
+        cache_ttl: Optional[float] = 3600.0,
+        version_check_interval: float = 5.0,
+    ):
         # 指定要加载的模型权重文件名（不含扩展名）
         self._cache_model = cache_model
+        # 推理模式："fp32" 为原始模型；"int8" 为 CPU 上的动态量化模型（可选 TorchScript 追踪）
+        if inference_mode not in ("fp32", "int8"):
+            raise ValueError(f"不支持的推理模式: {inference_mode}")
+        self._inference_mode = inference_mode
+        self._torchscript = torchscript
+        # 微批处理配置：max_batch_size <= 1 时退化为逐条推理
+        self._batcher: Optional[_NerBatcher] = None
+        if max_batch_size > 1:
+            self._batcher = _NerBatcher(self._predict_tags, max_batch_size, batch_window_ms)
+        # 查询级结果缓存：cache_size <= 0 时禁用
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._cache_version: Optional[tuple] = None
+        self._version_lock = threading.Lock()
+        # 检查模型/词库版本的最小间隔（秒），期间的请求（包括缓存命中）不做任何 stat
+        self._version_check_interval = version_check_interval
+        self._version_checked_at = 0.0
+
+    def _artifact_version(self) -> tuple:
+        """
+        模型权重与词库（源文件及预编译产物）的版本指纹，只做 stat，不读取文件内容。
+        任一文件被替换或重新生成时指纹改变。
+        """
+        paths = [f"model/{self._cache_model}.pt",
+                 os.path.join(lexicon_artifact.ARTIFACT_DIR, lexicon_artifact.MANIFEST_NAME)]
+        paths += [os.path.join(entity_lexicon.LEXICON_DIR, f"{ty}.txt") for ty in entity_lexicon.ENTITY_TYPES]
+        stamp = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamp.append(None)
+        return (self._inference_mode, self._torchscript, tuple(stamp))
+
+    def _version_fresh(self) -> bool:
+        return (self._cache_version is not None
+                and time.monotonic() - self._version_checked_at < self._version_check_interval)
+
+    def _check_version(self) -> None:
+        """
+        模型或词库发生变化时清空结果缓存并重新加载模型组件，最多每 version_check_interval 秒检查一次。
+        指纹在组件加载完成之后获取：首次加载时 lexicon_artifact 可能重新生成词库产物，
+        先取指纹会让下一次检查误判为版本变化而再加载一遍模型。
+        """
+        if self._version_fresh():
+            return
+        with self._version_lock:
+            if self._version_fresh():
+                return
+            if self._cache_version is None:
+                self._load_model()
+                self._cache_version = self._artifact_version()
+            elif self._artifact_version() != self._cache_version:
+                self._cache.clear()
+                NerService._load_model.cache_clear()
+                self._load_model()
+                self._cache_version = self._artifact_version()
+            self._version_checked_at = time.monotonic()
 
     @lru_cache(maxsize=1)
     def _load_model(
@@ -34,37 +187,92 @@ class NerService:
         内部方法：从磁盘加载分词器、模型权重及相关配置。
         使用 lru_cache 确保模型只被加载一次。
         """
-        # 检测可用计算设备 (GPU 或 CPU)
-        device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-        
+        # 检测可用计算设备 (GPU 或 CPU)；量化模型只能在 CPU 上运行
+        if self._inference_mode == "int8":
+            device = torch.device("cpu")
+        else:
+            device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
         # 加载标签映射表
         with open("tmp_data/tag2idx.npy", "rb") as f:
             tag2idx = pickle.load(f)
         idx2tag = list(tag2idx)
-        
+
         # 初始化辅助匹配工具（AC 自动机和 TF-IDF 对齐）
-        rule = zwk.rule_find()
-        tfidf_r = zwk.tfidf_alignment()
-        
+        # 优先加载预编译词库产物，只有词库文件内容变化时才重新构建
+        aho, tfidf_index = lexicon_artifact.load_or_build()
+        rule = zwk.rule_find(aho)
+        tfidf_r = zwk.tfidf_alignment(tfidf_index)
+
         # 加载预训练 BERT 分词器
         model_name = "model/chinese-roberta-wwm-ext"
         bert_tokenizer = BertTokenizer.from_pretrained(model_name)
-        
-        # 实例化模型架构
-        bert_model = zwk.Bert_Model(model_name, hidden_size=128, tag_num=len(tag2idx), bi=True)
-        # 加载保存的权重
-        bert_model.load_state_dict(torch.load(f"model/{self._cache_model}.pt", map_location=device))
-        bert_model = bert_model.to(device)
+
+        weight_path = f"model/{self._cache_model}.pt"
+        if self._inference_mode == "int8":
+            # 加载（或首次生成并缓存）int8 动态量化模型
+            bert_model = zwk.load_quantized_model(model_name, weight_path, len(tag2idx), self._torchscript)
+        else:
+            # 实例化模型架构
+            bert_model = zwk.Bert_Model(model_name, hidden_size=128, tag_num=len(tag2idx), bi=True)
+            # 加载保存的权重
+            bert_model.load_state_dict(torch.load(weight_path, map_location=device))
+            bert_model = bert_model.to(device)
         # 设置为评估模式
         bert_model.eval()
-        
+
         return bert_tokenizer, bert_model, idx2tag, rule, tfidf_r, device
 
+    def _predict_tags(self, queries: List[str], timings: Optional[Dict[str, float]] = None) -> List[List[str]]:
+        """内部方法：对一批查询执行一次补齐后的模型前向计算"""
+        bert_tokenizer, bert_model, idx2tag, _, _, device = self._load_model()
+        return zwk.predict_tags(bert_model, bert_tokenizer, queries, device, idx2tag, timings)
+
     def get_entities(self, query: str) -> Dict[str, str]:
         """
         对外公开接口：对输入的查询文本进行 NER 识别，返回识别出的实体字典。
+        耗时按 tokenize / forward / decode / rule / align 分别记录（见 metrics）。
         """
-        # 获取缓存的模型组件
-        bert_tokenizer, bert_model, idx2tag, rule, tfidf_r, device = self._load_model()
-        # 调用底层推理函数
-        return zwk.get_ner_result(bert_model, bert_tokenizer, query, rule, tfidf_r, device, idx2tag)
+        with metrics.span("ner") as info:
+            self._check_version()
+            key = normalize_query(query)
+            cached = self._cache.get(key)
+            if cached is not None:
+                info["cache"] = "hit"
+                return dict(cached)
+            info["cache"] = "miss"
+
+            # 获取缓存的模型组件
+            _, _, _, rule, tfidf_r, _ = self._load_model()
+            # 模型预测：开启微批处理时与其他并发请求合并为一次前向计算
+            timings: Dict[str, float] = {}
+            submitted = time.perf_counter()
+            if self._batcher is not None:
+                pre_tag, batch_timings, info["batch_size"] = self._batcher.submit(query).result()
+                timings.update(batch_timings)
+            else:
+                pre_tag = self._predict_tags([query], timings)[0]
+            predicted = time.perf_counter()
+            # 排队等待凑批的时间
+            timings["batch_wait"] = max(0.0, predicted - submitted - timings["tokenize"] - timings["forward"])
+            # BIO 解码、规则匹配与对齐逐条完成
+            result = zwk.decode_ner_result(query, pre_tag, rule, tfidf_r, timings)
+            self._cache.set(key, dict(result))
+
+            start = submitted
+            for step in ("batch_wait", "tokenize", "forward"):
+                metrics.record(f"ner.{step}", timings[step], start)
+                start += timings[step]
+            start = predicted
+            for step in ("decode", "rule", "align"):
+                metrics.record(f"ner.{step}", timings[step], start)
+                start += timings[step]
+            return result
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回查询结果缓存的统计信息（命中率、容量、内存估算等）"""
+        return self._cache.stats()
+
+    def clear_cache(self) -> None:
+        """手动清空查询结果缓存"""
+        self._cache.clear()
@@ -0,0 +1,107 @@
+import math
+import re
+from typing import Callable, List, Optional
+
+"""
+提示词长度预算
+本地模型的首字延迟主要由提示词的预填充 (prefill) 决定，知识库内容不加限制时，
+药品列表可能有几十项、疾病简介与病因可能有上千字。
+本模块估算 token 数，并在总预算内按意图优先级为各条知识分配长度、截断超出部分：
+排名靠前的意图先分配，但每条知识至少保留 min_tokens，保证每个意图都有内容。
+"""
+
+# 中日韩文字约 1 字 1 token；连续的字母数字约 4 个字符 1 token；其余符号各算 1 token
+_TOKEN_PATTERN = re.compile(r"[㐀-鿿豈-﫿]|[A-Za-z0-9]+|\S")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数（不依赖具体模型的分词器，偏保守）"""
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        count += math.ceil(len(token) / 4) if token[0].isascii() and token.isalnum() else 1
+    return count
+
+
+class KnowledgeBlock:
+    """
+    一条 <提示> 知识：head + 内容 + tail。
+    内容为 items 用 sep 连接（关系为名称列表，属性为文本）；items 为空的块（如查询失败的说明）不参与截断。
+    rank 越小越优先分配预算。
+    """
+
+    def __init__(self, head: str, items: List[str], sep: str = "", tail: str = "", rank: int = 0):
+        self.head = head
+        self.items = items
+        self.sep = sep
+        self.tail = tail
+        self.rank = rank
+        self.truncated = False
+
+    def content(self) -> str:
+        return self.sep.join(self.items)
+
+    def text(self) -> str:
+        return f"<提示>{self.head}{self.content()}{self.tail}</提示>"
+
+    def fit(self, budget: int, count: Callable[[str], int]) -> None:
+        """把内容截断到不超过 budget 个 token"""
+        if not self.items or count(self.content()) <= budget:
+            return
+        self.truncated = True
+        if self.sep:
+            # 名称列表：保留前面的若干项，并注明总数
+            total = len(self.items)
+            kept: List[str] = []
+            used = count(f"等{total}项")
+            for item in self.items:
+                cost = count(item) + count(self.sep)
+                if kept and used + cost > budget:
+                    break
+                kept.append(item)
+                used += cost
+            self.items = kept[:-1] + [f"{kept[-1]}等{total}项"] if len(kept) < total else kept
+            return
+        # 长文本：按 token 估算截断，尽量停在句末
+        text = self.content()
+        end = _cut_index(text, max(budget - 1, 1), count)
+        sentence_end = text.rfind("。", 0, end)
+        if sentence_end >= end // 2:
+            end = sentence_end + 1
+        self.items = [text[:end] + "……"]
+
+
+def _cut_index(text: str, budget: int, count: Callable[[str], int]) -> int:
+    """二分查找不超过 budget 个 token 的最长前缀长度"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def fit_blocks(blocks: List[KnowledgeBlock], budget: Optional[int], min_tokens: int = 48,
+               count: Callable[[str], int] = estimate_tokens) -> None:
+    """
+    在 budget 个 token 内为各知识块分配内容长度（原地截断）。
+    budget 为 None 时不做限制；预算连各块的 head/tail 都放不下时，每块仍保留 min_tokens 的内容。
+    """
+    if budget is None:
+        return
+    sized = [block for block in blocks if block.items]
+    fixed = sum(count(block.text()) for block in blocks if not block.items)
+    fixed += sum(count(f"<提示>{block.head}{block.tail}</提示>") for block in sized)
+    need = {id(block): count(block.content()) for block in sized}
+    remaining = budget - fixed
+    if sum(need.values()) <= remaining:
+        return
+    ordered = sorted(sized, key=lambda block: block.rank)
+    for i, block in enumerate(ordered):
+        # 为排在后面的块预留最低长度
+        reserve = sum(min(need[id(other)], min_tokens) for other in ordered[i + 1:])
+        share = max(min(need[id(block)], remaining - reserve), min(need[id(block)], min_tokens))
+        block.fit(share, count)
+        remaining -= count(block.content())
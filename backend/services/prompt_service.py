@@ -1,14 +1,300 @@
 import random
 import re
-from typing import Dict, Optional, Tuple
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.services import metrics
+from backend.services.knowledge_cache import KnowledgeCache
+from backend.services.neo4j_queries import get_query
+from backend.services.prompt_budget import KnowledgeBlock, estimate_tokens, fit_blocks
 
 """
 提示词 (Prompt) 构造服务
 该模块负责将用户查询、意图识别结果、识别出的实体以及从 Neo4j 知识图谱中检索到的实时数据，
 整合成一个最终发送给大语言模型 (LLM) 的详细 Prompt。
+一次问答所需的全部属性、关系、症状反查与生产商查询合并为一条参数化 Cypher 语句
+（neo4j_queries 中的 knowledge.retrieve 模板），只需一次往返；
+查询结果经 KnowledgeCache 缓存，已缓存的部分不再访问 Neo4j。
+提示词以固定不变的指令与注意事项开头（PROMPT_PREFIX），各请求逐字节相同，
+便于推理后端复用前缀的 KV 缓存；其后才是检索到的知识与用户问题。
+知识部分可按 token 预算截断（见 prompt_budget）。
 """
 
+# 意图关键词 -> 疾病属性查询：(触发关键词, 属性名, 意图描述)，顺序即提示词中的顺序
+SHUXING_INTENTS = [
+    (["简介"], "疾病简介", "查询疾病简介"),
+    (["病因"], "疾病病因", "查询疾病病因"),
+    (["预防"], "预防措施", "查询预防措施"),
+    (["治疗周期", "多久", "几天", "多长时间", "能好", "痊愈", "恢复"], "治疗周期", "查询治疗周期"),
+    (["治愈概率", "能治好", "治愈", "治得好"], "治愈概率", "查询治愈概率"),
+    (["易感人群"], "疾病易感人群", "查询疾病易感人群"),
+]
+# 意图关键词 -> 疾病关系查询：(触发关键词, 关系名, 目标标签, 意图描述)
+LIANXI_INTENTS = [
+    (["药品"], "疾病使用药品", "药品", "查询疾病使用药品"),
+    (["宜吃食物"], "疾病宜吃食物", "食物", "查询疾病宜吃食物"),
+    (["忌吃食物"], "疾病忌吃食物", "食物", "查询疾病忌吃食物"),
+    (["检查项目"], "疾病所需检查", "检查项目", "查询疾病所需检查"),
+    (["查询疾病所属科目"], "疾病所属科目", "科目", "查询疾病所属科目"),
+    (["症状"], "疾病的症状", "疾病症状", "查询疾病的症状"),
+    (["治疗"], "治疗的方法", "治疗方法", "查询治疗的方法"),
+    (["并发"], "疾病并发疾病", "疾病", "查询疾病并发疾病"),
+]
+
+# 所有请求共用的提示词前缀：系统指令与回答约束，不含任何随请求变化的内容
+PROMPT_PREFIX = (
+    "<指令>你是一个医疗问答机器人，你需要根据给定的提示回答用户的问题。请注意，你的全部回答必须完全基于给定的提示，不可自由发挥。如果根据提示无法给出答案，立刻回答“根据已知信息无法回答该问题”。</指令>"
+    "<指令>请你仅针对医疗类问题提供简洁和专业的回答。如果问题不是医疗相关的，你一定要回答“我只能回答医疗相关的问题。”，以明确告知你的回答限制。</指令>"
+    "<注意>你将收到给定的“<提示></提示>”和“<用户问题></用户问题>”，你要极其认真的判断提示里是否有用户问题所需的信息，如果没有相关信息，你必须直接回答“根据已知信息无法回答该问题”。</注意>"
+    "<注意>你一定要再次检查你的回答是否完全基于“<提示></提示>”的内容，不可产生提示之外的答案！换而言之，你的任务是根据用户的问题，将“<提示></提示>”整理成有条理、有逻辑的语句。你起到的作用仅仅是整合提示的功能，你一定不可以利用自身已经存在的知识进行回答，你必须从提示中找到问题的答案！</注意>"
+    "<注意>你必须充分的利用提示中的知识，不可将提示中的任何信息遗漏，你必须做到对提示信息的充分整合。你回答的任何一句话必须在提示中有所体现！如果根据提示无法给出答案，你必须回答“根据已知信息无法回答该问题”。</注意>"
+)
+
+# 检索状态：数据库未连接且缓存未命中
+NOT_CONNECTED = "未连接"
+
+
+class Retrieval:
+    """一次知识检索的结果：解析出的疾病、各查询键对应的结果，以及失败原因（None 表示成功）"""
+
+    def __init__(self, disease: Optional[str] = None):
+        self.disease = disease
+        self.results: Dict[Tuple, List[Any]] = {}
+        self.error: Optional[str] = None
+        self.round_trips = 0
+
+    def get(self, key: Tuple) -> Optional[List[Any]]:
+        return self.results.get(key)
+
+
+def _intent_rank(response: str, keywords: List[str]) -> int:
+    """意图在识别结果中首次出现的位置，越靠前越优先分配知识长度"""
+    return min(response.find(kw) for kw in keywords if kw in response)
+
+
 class PromptService:
+    def __init__(
+        self,
+        knowledge_cache: Optional[KnowledgeCache] = None,
+        token_budget: Optional[int] = None,
+        min_block_tokens: int = 48,
+    ):
+        # 知识检索缓存，可在多个服务实例之间共享
+        self._knowledge = knowledge_cache if knowledge_cache is not None else KnowledgeCache()
+        # 整个提示词的 token 预算（估算值），超出时按意图优先级截断知识；None 表示不限制
+        self.token_budget = token_budget
+        # 预算紧张时每条知识至少保留的 token 数
+        self.min_block_tokens = min_block_tokens
+
+    def retrieve(
+        self,
+        client,
+        disease: Optional[str] = None,
+        symptom: Optional[str] = None,
+        props: Optional[List[str]] = None,
+        rels: Optional[List[Tuple[str, str]]] = None,
+        drug: Optional[str] = None,
+    ) -> Retrieval:
+        """
+        检索一次问答所需的全部知识。先查缓存，所有未命中的部分合并为一条 Cypher 语句执行。
+
+        Args:
+            client: Neo4j 客户端
+            disease: 已识别的疾病；为空时尝试由 symptom 反查
+            symptom: 需要反查疾病的症状（仅在 disease 为空时使用）
+            props: 需要的疾病属性名列表
+            rels: 需要的 (关系名, 目标标签) 列表
+            drug: 需要查询生产商的药品
+        """
+        retrieval, params = self._prepare_retrieval(disease, symptom, props, rels, drug)
+        if params is None:
+            return retrieval
+        if client is None:
+            retrieval.error = NOT_CONNECTED
+            return retrieval
+        try:
+            retrieval.round_trips += 1
+            with metrics.span("neo4j.knowledge.retrieve"):
+                rows = client.run(get_query("knowledge.retrieve"), params).data()
+        except Exception as exc:
+            retrieval.error = str(exc)
+            return retrieval
+        return self._apply_rows(retrieval, params, rows)
+
+    async def retrieve_async(
+        self,
+        client,
+        disease: Optional[str] = None,
+        symptom: Optional[str] = None,
+        props: Optional[List[str]] = None,
+        rels: Optional[List[Tuple[str, str]]] = None,
+        drug: Optional[str] = None,
+    ) -> Retrieval:
+        """retrieve 的异步版本，client 为 AsyncNeo4jClient"""
+        retrieval, params = self._prepare_retrieval(disease, symptom, props, rels, drug)
+        if params is None:
+            return retrieval
+        if client is None:
+            retrieval.error = NOT_CONNECTED
+            return retrieval
+        try:
+            retrieval.round_trips += 1
+            with metrics.span("neo4j.knowledge.retrieve"):
+                rows = (await client.run(get_query("knowledge.retrieve"), params)).data()
+        except Exception as exc:
+            retrieval.error = str(exc)
+            return retrieval
+        return self._apply_rows(retrieval, params, rows)
+
+    def _prepare_retrieval(
+        self,
+        disease: Optional[str],
+        symptom: Optional[str],
+        props: Optional[List[str]],
+        rels: Optional[List[Tuple[str, str]]],
+        drug: Optional[str],
+    ) -> Tuple[Retrieval, Optional[Dict[str, Any]]]:
+        """先查缓存，返回 (检索结果, 查询参数)；全部命中缓存时查询参数为 None"""
+        props, rels = props or [], rels or []
+        retrieval = Retrieval(disease)
+
+        # 症状反查的结果已缓存时，直接确定疾病
+        symptom_key = ("反查疾病", symptom)
+        if disease is None and symptom is not None:
+            cached = self._knowledge.get(symptom_key)
+            if cached is not None:
+                retrieval.results[symptom_key] = cached
+                retrieval.disease = disease = cached[0] if cached else None
+                symptom = None
+
+        # 疾病已确定时，只检索缓存中没有的属性与关系
+        if disease is not None:
+            missing_props, missing_rels = [], []
+            for prop in props:
+                cached = self._knowledge.get(("属性", disease, prop))
+                if cached is None:
+                    missing_props.append(prop)
+                else:
+                    retrieval.results[("属性", disease, prop)] = cached
+            for rel, target in rels:
+                cached = self._knowledge.get(("关系", disease, rel, target))
+                if cached is None:
+                    missing_rels.append((rel, target))
+                else:
+                    retrieval.results[("关系", disease, rel, target)] = cached
+            props, rels = missing_props, missing_rels
+        elif symptom is None:
+            props, rels = [], []
+
+        drug_key = ("生产商", drug)
+        if drug is not None:
+            cached = self._knowledge.get(drug_key)
+            if cached is not None:
+                retrieval.results[drug_key] = cached
+                drug = None
+
+        if symptom is None and not props and not rels and drug is None:
+            return retrieval, None
+        return retrieval, {
+            "disease": disease,
+            "symptom": symptom,
+            "props": props,
+            "rels": [[rel, target] for rel, target in rels],
+            "drug": drug,
+        }
+
+    def _apply_rows(self, retrieval: Retrieval, params: Dict[str, Any], rows: List[Dict[str, Any]]) -> Retrieval:
+        """将查询结果写入检索结果与缓存"""
+        disease, symptom, drug = params["disease"], params["symptom"], params["drug"]
+        props, rels = params["props"], [tuple(rel) for rel in params["rels"]]
+        symptom_key, drug_key = ("反查疾病", symptom), ("生产商", drug)
+        row = rows[0]
+
+        if symptom is not None:
+            # 保持原有语义：只取第一个候选疾病
+            candidates = row["symptom_diseases"][:1]
+            self._store(retrieval, symptom_key, candidates)
+            retrieval.disease = disease = row["disease_name"]
+        if disease is not None:
+            # 图谱中不存在该疾病时各项结果为空，同样写入缓存，避免重复查询
+            values = row["props"] or [None] * len(props)
+            for prop, value in zip(props, values):
+                self._store(retrieval, ("属性", disease, prop), [] if value is None else [value])
+            names_list = row["rels"] or [[]] * len(rels)
+            for (rel, target), names in zip(rels, names_list):
+                self._store(retrieval, ("关系", disease, rel, target), names)
+        if drug is not None:
+            self._store(retrieval, drug_key, row["makers"][:1])
+        return retrieval
+
+    def _store(self, retrieval: Retrieval, key: Tuple, value: List[Any]) -> None:
+        retrieval.results[key] = value
+        self._knowledge.set(key, value)
+
+    def warm_up(self, client, top_n: int = 50) -> int:
+        """
+        预热知识缓存：为历史上查询最多的 top_n 个疾病预先加载全部属性和关系（每个疾病一次往返）。
+        返回实际预热的疾病数量。
+        """
+        diseases = self._knowledge.top_entities(top_n)
+        for disease in diseases:
+            self.retrieve(
+                client,
+                disease=disease,
+                props=[prop for _, prop, _ in SHUXING_INTENTS],
+                rels=[(rel, target) for _, rel, target, _ in LIANXI_INTENTS],
+            )
+        return len(diseases)
+
+    def warm_up_async(self, client, top_n: int = 50) -> threading.Thread:
+        """在后台线程中执行预热，不阻塞服务启动"""
+        thread = threading.Thread(target=self.warm_up, args=(client, top_n), name="knowledge-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def knowledge_cache_stats(self) -> Dict[str, Any]:
+        """返回知识检索缓存的统计信息"""
+        return self._knowledge.stats()
+
+    def clear_knowledge_cache(self) -> None:
+        """手动清空知识检索缓存"""
+        self._knowledge.clear()
+
+    def _shuxing_block(self, entity: str, shuxing: str, retrieval: Retrieval, rank: int = 0) -> KnowledgeBlock:
+        """根据检索结果生成某个疾病属性的知识块"""
+        res = retrieval.get(("属性", entity, shuxing))
+        if res is None and retrieval.error == NOT_CONNECTED:
+            return KnowledgeBlock(f"用户对{entity}可能有查询{shuxing}需求，但Neo4j数据库未连接，无法查询知识图谱。", [])
+        if res is None and retrieval.error is not None:
+            return KnowledgeBlock(
+                f"用户对{entity}可能有查询{shuxing}需求，但查询知识图谱时发生错误：{retrieval.error[:30]}。", [])
+        head = f"用户对{entity}可能有查询{shuxing}需求，知识库内容如下："
+        if not res:
+            return KnowledgeBlock(head + "图谱中无信息，查找失败。", [])
+        return KnowledgeBlock(head, list(res), rank=rank)
+
+    def _lianxi_block(self, entity: str, lianxi: str, target: str, retrieval: Retrieval,
+                      rank: int = 0) -> KnowledgeBlock:
+        """根据检索结果生成某个疾病关系的知识块"""
+        res = retrieval.get(("关系", entity, lianxi, target))
+        if res is None and retrieval.error == NOT_CONNECTED:
+            return KnowledgeBlock(f"用户对{entity}可能有查询{lianxi}需求，但Neo4j数据库未连接，无法查询知识图谱。", [])
+        if res is None and retrieval.error is not None:
+            return KnowledgeBlock(
+                f"用户对{entity}可能有查询{lianxi}需求，但查询知识图谱时发生错误：{retrieval.error[:30]}。", [])
+        head = f"用户对{entity}可能有查询{lianxi}需求，知识库内容如下："
+        if not res:
+            return KnowledgeBlock(head + "图谱中无信息，查找失败。", [])
+        return KnowledgeBlock(head, list(res), sep="、", rank=rank)
+
+    def _shuxing_text(self, entity: str, shuxing: str, retrieval: Retrieval) -> str:
+        """根据检索结果生成某个疾病属性的提示词"""
+        return self._shuxing_block(entity, shuxing, retrieval).text()
+
+    def _lianxi_text(self, entity: str, lianxi: str, target: str, retrieval: Retrieval) -> str:
+        """根据检索结果生成某个疾病关系的提示词"""
+        return self._lianxi_block(entity, lianxi, target, retrieval).text()
+
     def add_shuxing_prompt(self, entity: str, shuxing: str, client) -> str:
         """
         根据实体名称和属性名，从 Neo4j 中查询节点属性值并生成提示词。
@@ -18,30 +304,7 @@ class PromptService:
             shuxing: 节点属性名（如“疾病简介”）
             client: Neo4j 客户端
         """
-        add_prompt = ""
-        if client is None:
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{shuxing}需求，但Neo4j数据库未连接，无法查询知识图谱。"
-            add_prompt += "</提示>"
-            return add_prompt
-
-        try:
-            # 构造 Cypher 查询语句获取节点属性
-            sql_q = "match (a:疾病{名称:'%s'}) return a.%s" % (entity, shuxing)
-            res = client.run(sql_q).data()[0].values()
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{shuxing}需求，知识库内容如下："
-            if len(res) > 0:
-                join_res = "".join(res)
-                add_prompt += join_res
-            else:
-                add_prompt += "图谱中无信息，查找失败。"
-            add_prompt += "</提示>"
-        except Exception as exc:
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{shuxing}需求，但查询知识图谱时发生错误：{str(exc)[:30]}。"
-            add_prompt += "</提示>"
-        return add_prompt
+        return self._shuxing_text(entity, shuxing, self.retrieve(client, disease=entity, props=[shuxing]))
 
     def add_lianxi_prompt(self, entity: str, lianxi: str, target: str, client) -> str:
         """
@@ -53,31 +316,8 @@ class PromptService:
             target: 目标实体标签
             client: Neo4j 客户端
         """
-        add_prompt = ""
-        if client is None:
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{lianxi}需求，但Neo4j数据库未连接，无法查询知识图谱。"
-            add_prompt += "</提示>"
-            return add_prompt
-
-        try:
-            # 构造 Cypher 查询语句获取关联节点名称
-            sql_q = "match (a:疾病{名称:'%s'})-[r:%s]->(b:%s) return b.名称" % (entity, lianxi, target)
-            res = client.run(sql_q).data()
-            res = [list(data.values())[0] for data in res]
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{lianxi}需求，知识库内容如下："
-            if len(res) > 0:
-                join_res = "、".join(res)
-                add_prompt += join_res
-            else:
-                add_prompt += "图谱中无信息，查找失败。"
-            add_prompt += "</提示>"
-        except Exception as exc:
-            add_prompt += "<提示>"
-            add_prompt += f"用户对{entity}可能有查询{lianxi}需求，但查询知识图谱时发生错误：{str(exc)[:30]}。"
-            add_prompt += "</提示>"
-        return add_prompt
+        retrieval = self.retrieve(client, disease=entity, rels=[(lianxi, target)])
+        return self._lianxi_text(entity, lianxi, target, retrieval)
 
     def generate_prompt(
         self,
@@ -85,138 +325,147 @@ class PromptService:
         query: str,
         client,
         entities: Dict[str, str],
+        stats: Optional[Dict[str, Any]] = None,
     ) -> Tuple[str, str, Dict[str, str]]:
         """
         整合所有信息生成最终 Prompt。
         
         工作逻辑：
-        1. 设定系统角色和约束（指令）。
-        2. 如果识别到症状但未识别到具体疾病，尝试通过症状反查可能得疾病。
-        3. 根据识别出的意图关键词（response 参数），去知识图谱检索对应的属性或关系。
-        4. 整合用户原始问题。
-        5. 添加最后的质量控制注意点。
+        1. 以固定的系统角色与约束（PROMPT_PREFIX）开头。
+        2. 根据识别出的意图关键词（response 参数）确定需要检索的属性与关系，
+           与症状反查疾病、药品生产商查询一起，通过一次往返从知识图谱中取回。
+        3. 如果识别到症状但未识别到具体疾病，使用反查到的疾病。
+        4. 超出 token 预算时按意图优先级截断知识，最后整合用户原始问题。
+        传入 stats 字典时写入本次提示词的 token 统计。
         """
+        plan = self._plan_retrieval(response, entities)
+        retrieval = self.retrieve(client, **plan)
+        with metrics.span("prompt.render"):
+            return self._render_prompt(response, query, entities, plan, retrieval, stats)
+
+    async def generate_prompt_async(
+        self,
+        response: str,
+        query: str,
+        client,
+        entities: Dict[str, str],
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, str, Dict[str, str]]:
+        """generate_prompt 的异步版本，client 为 AsyncNeo4jClient"""
+        plan = self._plan_retrieval(response, entities)
+        retrieval = await self.retrieve_async(client, **plan)
+        with metrics.span("prompt.render"):
+            return self._render_prompt(response, query, entities, plan, retrieval, stats)
+
+    def _plan_retrieval(self, response: str, entities: Dict[str, str]) -> Dict[str, Any]:
+        """根据意图关键词规划本次需要的检索，返回 retrieve 的参数"""
+        symptom = entities["疾病症状"] if "疾病症状" in entities and "疾病" not in entities else None
+        return {
+            "disease": entities.get("疾病"),
+            "symptom": symptom,
+            "props": [prop for kws, prop, _ in SHUXING_INTENTS if any(kw in response for kw in kws)],
+            "rels": [(rel, target) for kws, rel, target, _ in LIANXI_INTENTS if any(kw in response for kw in kws)],
+            "drug": entities.get("药品") if "生产商" in response else None,
+        }
+
+    def _render_prompt(
+        self,
+        response: str,
+        query: str,
+        entities: Dict[str, str],
+        plan: Dict[str, Any],
+        retrieval: Retrieval,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, str, Dict[str, str]]:
+        """用检索结果拼接最终 Prompt"""
         yitu = []
-        # 系统核心指令：要求模型完全基于给定的提示回答
-        prompt = "<指令>你是一个医疗问答机器人，你需要根据给定的提示回答用户的问题。请注意，你的全部回答必须完全基于给定的提示，不可自由发挥。如果根据提示无法给出答案，立刻回答“根据已知信息无法回答该问题”。</指令>"
-        prompt += "<指令>请你仅针对医疗类问题提供简洁和专业的回答。如果问题不是医疗相关的，你一定要回答“我只能回答医疗相关的问题。”，以明确告知你的回答限制。</指令>"
-        
+        # 各条知识，按顺序拼接在固定前缀之后
+        blocks: List[KnowledgeBlock] = []
+
+        # 意图描述与检索规划一一对应，顺序即提示词中的顺序
+        shuxing_plan = [
+            (prop, desc, _intent_rank(response, kws)) for kws, prop, desc in SHUXING_INTENTS
+            if any(kw in response for kw in kws)
+        ]
+        lianxi_plan = [
+            (rel, target, desc, _intent_rank(response, kws)) for kws, rel, target, desc in LIANXI_INTENTS
+            if any(kw in response for kw in kws)
+        ]
+        symptom, drug = plan["symptom"], plan["drug"]
+
         # 症状反向推理疾病
-        if "疾病症状" in entities and "疾病" not in entities:
-            if client is not None:
-                try:
-                    sql_q = "match (a:疾病)-[r:疾病的症状]->(b:疾病症状 {名称:'%s'}) return a.名称" % (
-                        entities["疾病症状"]
-                    )
-                    res = list(client.run(sql_q).data()[0].values())
-                    if len(res) > 0:
-                        entities["疾病"] = random.choice(res)
-                        all_en = "、".join(res)
-                        prompt += f"<提示>用户有{entities['疾病症状']}的情况，知识库推测其可能是得了{all_en}。请注意这只是一个推测，你需要明确告知用户这一点。</提示>"
-                except Exception:
-                    prompt += "<提示>用户有%s的情况，但查询知识图谱时发生错误，无法推测相关疾病。</提示>" % (
-                        entities["疾病症状"]
-                    )
+        if symptom is not None:
+            res = retrieval.get(("反查疾病", symptom))
+            if res is None and retrieval.error == NOT_CONNECTED:
+                blocks.append(KnowledgeBlock("用户有%s的情况，但Neo4j数据库未连接，无法查询相关疾病信息。" % symptom, []))
+            elif res is None and retrieval.error is not None:
+                blocks.append(KnowledgeBlock("用户有%s的情况，但查询知识图谱时发生错误，无法推测相关疾病。" % symptom, []))
             else:
-                prompt += "<提示>用户有%s的情况，但Neo4j数据库未连接，无法查询相关疾病信息。</提示>" % (
-                    entities["疾病症状"]
-                )
-        
-        pre_len = len(prompt)
-        
-        # 根据意图关键词触发对应的知识库查询
-        if "简介" in response:
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "疾病简介", client)
-                yitu.append("查询疾病简介")
-        if "病因" in response:
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "疾病病因", client)
-                yitu.append("查询疾病病因")
-        if "预防" in response:
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "预防措施", client)
-                yitu.append("查询预防措施")
-        if any(kw in response for kw in ["治疗周期", "多久", "几天", "多长时间", "能好", "痊愈", "恢复"]):
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "治疗周期", client)
-                yitu.append("查询治疗周期")
-        if any(kw in response for kw in ["治愈概率", "能治好", "治愈", "治得好"]):
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "治愈概率", client)
-                yitu.append("查询治愈概率")
-        if "易感人群" in response:
-            if "疾病" in entities:
-                prompt += self.add_shuxing_prompt(entities["疾病"], "疾病易感人群", client)
-                yitu.append("查询疾病易感人群")
-        if "药品" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病使用药品", "药品", client)
-                yitu.append("查询疾病使用药品")
-        if "宜吃食物" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病宜吃食物", "食物", client)
-                yitu.append("查询疾病宜吃食物")
-        if "忌吃食物" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病忌吃食物", "食物", client)
-                yitu.append("查询疾病忌吃食物")
-        if "检查项目" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病所需检查", "检查项目", client)
-                yitu.append("查询疾病所需检查")
-        if "查询疾病所属科目" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病所属科目", "科目", client)
-                yitu.append("查询疾病所属科目")
-        if "症状" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病的症状", "疾病症状", client)
-                yitu.append("查询疾病的症状")
-        if "治疗" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "治疗的方法", "治疗方法", client)
-                yitu.append("查询治疗的方法")
-        if "并发" in response:
-            if "疾病" in entities:
-                prompt += self.add_lianxi_prompt(entities["疾病"], "疾病并发疾病", "疾病", client)
-                yitu.append("查询疾病并发疾病")
-        
+                res = res or []
+                if len(res) > 0:
+                    entities["疾病"] = random.choice(res)
+                    all_en = "、".join(res)
+                    blocks.append(KnowledgeBlock(
+                        f"用户有{symptom}的情况，知识库推测其可能是得了{all_en}。请注意这只是一个推测，你需要明确告知用户这一点。", []))
+
+        # 记录疾病查询频次，用于预热高频疾病的知识缓存
+        if "疾病" in entities:
+            self._knowledge.record(entities["疾病"])
+
+        pre_len = len(blocks)
+
+        # 按意图顺序拼接知识库查询结果
+        if "疾病" in entities:
+            for prop, desc, rank in shuxing_plan:
+                blocks.append(self._shuxing_block(entities["疾病"], prop, retrieval, rank))
+                yitu.append(desc)
+            for rel, target, desc, rank in lianxi_plan:
+                blocks.append(self._lianxi_block(entities["疾病"], rel, target, retrieval, rank))
+                yitu.append(desc)
+
         # 特殊处理：药品商查询（反向关系）
         if "生产商" in response:
-            if client is not None and "药品" in entities:
-                try:
-                    sql_q = "match (a:药品商)-[r:生产]->(b:药品{名称:'%s'}) return a.名称" % (entities["药品"])
-                    res = client.run(sql_q).data()[0].values()
-                    prompt += "<提示>"
-                    prompt += f"用户对{entities['药品']}可能有查询药品生产商的需求，知识图谱内容如下："
-                    if len(res) > 0:
-                        prompt += "".join(res)
-                    else:
-                        prompt += "图谱中无信息，查找失败"
-                    prompt += "</提示>"
-                except Exception as exc:
-                    prompt += f"<提示>查询药品生产商时发生错误：{str(exc)[:30]}</提示>"
+            res = retrieval.get(("生产商", drug))
+            if drug is None:
+                blocks.append(KnowledgeBlock("未识别到药品实体，无法查询生产商信息。", []))
+            elif res is None and retrieval.error == NOT_CONNECTED:
+                blocks.append(KnowledgeBlock(f"Neo4j数据库未连接，无法查询{drug}的生产商信息。", []))
+            elif res is None and retrieval.error is not None:
+                blocks.append(KnowledgeBlock(f"查询药品生产商时发生错误：{retrieval.error[:30]}", []))
             else:
-                if "药品" in entities:
-                    prompt += f"<提示>Neo4j数据库未连接，无法查询{entities['药品']}的生产商信息。</提示>"
-                else:
-                    prompt += "<提示>未识别到药品实体，无法查询生产商信息。</提示>"
+                res = res or []
+                head = f"用户对{drug}可能有查询药品生产商的需求，知识图谱内容如下："
+                blocks.append(KnowledgeBlock(head + ("".join(res) if len(res) > 0 else "图谱中无信息，查找失败"), []))
             yitu.append("查询药物生产商")
             
         # 如果没有查询到任何知识库信息
-        if pre_len == len(prompt):
+        if pre_len == len(blocks):
             # 处理问候或通用询问
             if any(word in query.lower() for word in ["你好", "hello", "hi", "介绍", "帮助", "什么"]):
-                prompt += "<提示>用户可能是在问候或询问系统功能。请介绍你是一个专业的医疗RAG问答系统，可以回答医疗相关问题，包括疾病简介、症状、治疗方法、药物信息等。请鼓励用户提出具体的医疗问题。</提示>"
+                blocks.append(KnowledgeBlock("用户可能是在问候或询问系统功能。请介绍你是一个专业的医疗RAG问答系统，可以回答医疗相关问题，包括疾病简介、症状、治疗方法、药物信息等。请鼓励用户提出具体的医疗问题。", []))
             else:
-                prompt += "<提示>提示：知识库异常，没有相关信息！请你直接回答“根据已知信息无法回答该问题”！</提示>"
-        
-        # 整合用户问题和最终约束
-        prompt += f"<用户问题>{query}</用户问题>"
-        prompt += "<注意>现在你已经知道给定的“<提示></提示>”和“<用户问题></用户问题>”了,你要极其认真的判断提示里是否有用户问题所需的信息，如果没有相关信息，你必须直接回答“根据已知信息无法回答该问题”。</注意>"
-        prompt += "<注意>你一定要再次检查你的回答是否完全基于“<提示></提示>”的内容，不可产生提示之外的答案！换而言之，你的任务是根据用户的问题，将“<提示></提示>”整理成有条理、有逻辑的语句。你起到的作用仅仅是整合提示的功能，你一定不可以利用自身已经存在的知识进行回答，你必须从提示中找到问题的答案！</注意>"
-        prompt += "<注意>你必须充分的利用提示中的知识，不可将提示中的任何信息遗漏，你必须做到对提示信息的充分整合。你回答的任何一句话必须在提示中有所体现！如果根据提示无法给出答案，你必须回答“根据已知信息无法回答该问题”。<注意>"
+                blocks.append(KnowledgeBlock("提示：知识库异常，没有相关信息！请你直接回答“根据已知信息无法回答该问题”！", []))
+
+        # 在 token 预算内截断知识：扣除固定前缀与用户问题后剩下的部分留给知识
+        question = f"<用户问题>{query}</用户问题>"
+        prefix_tokens, question_tokens = estimate_tokens(PROMPT_PREFIX), estimate_tokens(question)
+        knowledge_before = sum(estimate_tokens(block.text()) for block in blocks)
+        if self.token_budget is not None:
+            fit_blocks(blocks, self.token_budget - prefix_tokens - question_tokens, self.min_block_tokens)
+        knowledge = "".join(block.text() for block in blocks)
+        prompt = PROMPT_PREFIX + knowledge + question
+
+        if stats is not None:
+            knowledge_tokens = estimate_tokens(knowledge)
+            stats.update({
+                "prompt_tokens": prefix_tokens + knowledge_tokens + question_tokens,
+                "prefix_tokens": prefix_tokens,
+                "knowledge_tokens": knowledge_tokens,
+                "knowledge_tokens_before_budget": knowledge_before,
+                "question_tokens": question_tokens,
+                "truncated_blocks": sum(1 for block in blocks if block.truncated),
+                "token_budget": self.token_budget,
+            })
         return prompt, "、".join(yitu), entities
 
     def extract_knowledge(self, prompt: str) -> str:
@@ -224,4 +473,5 @@ class PromptService:
         从生成的 Prompt 中提取所有被 <提示> 标签包围的内容，用于前端展示数据来源。
         """
         knowledge = re.findall(r"<提示>(.*?)</提示>", prompt)
-        return "\n".join([f"提示{idx + 1}, {kn}" for idx, kn in enumerate(knowledge) if len(kn) >= 3])
+        knowledge = [kn for kn in knowledge if len(kn) >= 3]
+        return "\n".join([f"提示{idx + 1}, {kn}" for idx, kn in enumerate(knowledge)])
@@ -0,0 +1,93 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+"""
+线程安全的 LRU + TTL 缓存
+容量达到上限时淘汰最久未使用的条目，条目超过存活时间后视为过期。
+同时记录命中/未命中次数、淘汰数量与查找耗时，供管理接口展示以便调整缓存大小。
+"""
+
+
+def _approx_size(obj: Any, _depth: int = 0) -> int:
+    """粗略估算对象占用的内存（字节），只递归常见容器，用于监控展示而非精确统计"""
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k, _depth + 1) + _approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(item, _depth + 1) for item in obj)
+    return size
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0):
+        # maxsize <= 0 表示禁用缓存；ttl 为 None 表示条目永不过期
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lookup_seconds = 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """查找缓存，未命中或已过期时返回 default"""
+        start = time.perf_counter()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                self._expirations += 1
+                item = None
+            if item is None:
+                self._misses += 1
+                value = default
+            else:
+                self._data.move_to_end(key)
+                self._hits += 1
+                value = item[0]
+            self._lookup_seconds += time.perf_counter() - start
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """清空缓存条目（统计计数保留）"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的运行统计信息"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            memory = sum(_approx_size(k) + _approx_size(v[0]) for k, v in self._data.items())
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "avg_lookup_us": self._lookup_seconds / lookups * 1e6 if lookups else 0.0,
+                "approx_memory_bytes": memory,
+            }
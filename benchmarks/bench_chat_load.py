@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+问答接口并发压测
+启动一个本地桩服务模拟 Ollama 的流式 /api/chat（每个增量间隔固定时间），
+在同一进程中用 uvicorn 同时挂载两个接口：
+    /sync   旧实现：同步生成器，由 Starlette 的线程池逐块迭代，生成期间占用一个线程；
+    /async  新实现：ChatService.stream_chat_async，全程异步 IO。
+对两个接口各发起 N 个并发流式请求，比较总耗时、首包时间以及桩服务观测到的最大同时流数。
+
+NER 用固定耗时的桩替代（避免加载 BERT），问题命中意图关键词，不连接 Neo4j。
+
+用法（需在项目根目录运行）：
+    python benchmarks/bench_chat_load.py --concurrency 200 --chunks 20 --chunk_ms 50
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """流式 /api/chat：每隔 chunk_ms 毫秒输出一行 NDJSON"""
+
+    protocol_version = "HTTP/1.1"
+    chunks = 20
+    chunk_delay = 0.05
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        with StubOllama.lock:
+            StubOllama.active += 1
+            StubOllama.peak = max(StubOllama.peak, StubOllama.active)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(self.chunks + 1):
+                time.sleep(self.chunk_delay)
+                line = json.dumps({"model": "stub", "created_at": "2024-01-01T00:00:00Z",
+                                   "message": {"role": "assistant", "content": "" if i == self.chunks else "字"},
+                                   "done": i == self.chunks}).encode('utf-8') + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            with StubOllama.lock:
+                StubOllama.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class StubThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def one_request(client, url, started):
+    """发起一次流式请求，返回 (首包耗时, 总耗时, 增量数)"""
+    first = None
+    deltas = 0
+    async with client.stream("POST", url, json={"query": "感冒怎么办", "model_source": "local",
+                                               "model_name": "stub"}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if first is None:
+                first = time.perf_counter() - started
+            if json.loads(line)["type"] == "delta":
+                deltas += 1
+    return first, time.perf_counter() - started, deltas
+
+
+async def load(url, concurrency):
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[one_request(client, url, started) for _ in range(concurrency)])
+    return results, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="问答接口并发压测：同步生成器 vs 全异步")
+    parser.add_argument('--concurrency', type=int, default=200, help='并发流式请求数')
+    parser.add_argument('--chunks', type=int, default=20, help='每个回答的增量数')
+    parser.add_argument('--chunk_ms', type=float, default=50.0, help='桩服务每个增量的间隔（毫秒）')
+    parser.add_argument('--ner_ms', type=float, default=10.0, help='NER 桩的耗时（毫秒）')
+    args = parser.parse_args()
+
+    StubOllama.chunks = args.chunks
+    StubOllama.chunk_delay = args.chunk_ms / 1000.0
+    stub = StubThreadingServer(('127.0.0.1', 0), StubOllama)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    # 必须在导入 model_config 之前设置
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+    os.environ["NEO4J_URI"] = "bolt://127.0.0.1:1"
+
+    import uvicorn
+    from fastapi import FastAPI
+    from starlette.responses import StreamingResponse
+
+    import backend.services.chat_service as chat_module
+    from backend.routes.chat_routes import ChatRequest
+
+    class StubNer:
+        def get_entities(self, query):
+            time.sleep(args.ner_ms / 1000.0)
+            return {"疾病": "感冒"}
+
+    chat_module.ner_service = StubNer()
+    service = chat_module.ChatService()
+    app = FastAPI()
+
+    @app.post("/sync")
+    def sync_stream(payload: ChatRequest):
+        return StreamingResponse(service.stream_chat(payload.query, payload.model_source, payload.model_name,
+                                                     None, None), media_type="application/json")
+
+    @app.post("/async")
+    async def async_stream(payload: ChatRequest):
+        return StreamingResponse(service.stream_chat_async(payload.query, payload.model_source,
+                                                           payload.model_name, None, None),
+                                 media_type="application/json")
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning',
+                                           backlog=4096, timeout_keep_alive=30))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    ideal = args.chunks * args.chunk_ms / 1000.0
+    print(f"并发 {args.concurrency}，每个回答 {args.chunks} 个增量 × {args.chunk_ms:.0f} ms（单个请求理想耗时约 {ideal:.1f}s）")
+    for name in ["sync", "async"]:
+        StubOllama.peak = 0
+        results, wall = asyncio.run(load(f"http://127.0.0.1:{port}/{name}", args.concurrency))
+        firsts = sorted(r[0] for r in results)
+        totals = sorted(r[1] for r in results)
+        complete = sum(1 for r in results if r[2] == args.chunks + 1)
+        print(f"/{name:<6} 总耗时 {wall:6.2f}s  首包 p50 {statistics.median(firsts):5.2f}s "
+              f"p95 {firsts[int(len(firsts) * 0.95) - 1]:5.2f}s  完成 p95 {totals[int(len(totals) * 0.95) - 1]:5.2f}s  "
+              f"最大同时流数 {StubOllama.peak}  完整回答 {complete}/{len(results)}")
+    server.should_exit = True
+    stub.shutdown()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+"""
+医疗语料解析基准
+对比旧方式（整文件读入 + 逐行 eval）、json.loads 流式解析、进程池并行解析，
+以及从列式缓存重新加载（全部字段 / 仅 NER 所需的 3 个文本字段）的耗时，并校验各方式得到的记录一致。
+
+不指定 --data 时生成一份与 medical.json 结构相近的合成语料。
+
+用法（需在项目根目录运行）：
+    python benchmarks/bench_corpus_loader.py --records 20000 --workers 4
+    python benchmarks/bench_corpus_loader.py --data data/medical.json
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import corpus_loader
+
+
+def make_corpus(path, num_records, seed=0):
+    """生成合成语料：每行一条 JSON 记录，行尾带逗号（与 medical_new_2.json 相同）"""
+    rng = random.Random(seed)
+    chars = "感冒发热咳嗽头痛腹泻胃炎高血压糖尿病药物治疗手术饮食休息注意预防病毒细菌感染症状检查"
+    text = lambda n: "".join(rng.choice(chars) for _ in range(n))
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_records):
+            record = {
+                "name": f"疾病{i}", "desc": text(400), "cause": text(300), "prevent": text(200),
+                "cure_lasttime": "7天", "cured_prob": "90%", "easy_get": text(10),
+                "symptom": [text(4) for _ in range(6)], "common_drug": [text(6) for _ in range(4)],
+                "do_eat": [text(3) for _ in range(5)], "not_eat": [text(3) for _ in range(5)],
+                "check": [text(5) for _ in range(4)], "cure_way": [text(6) for _ in range(3)],
+                "drug_detail": [f"{text(6)},{text(4)}" for _ in range(5)],
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + ',\n')
+
+
+def legacy_load(path):
+    """旧实现：整文件读入后逐行 eval"""
+    with open(path, 'r', encoding='utf-8') as f:
+        all_data = f.read().split('\n')
+    return [eval(data[:-1]) for data in all_data if len(data) >= 3]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语料解析：eval vs json 流式 vs 并行 vs 缓存")
+    parser.add_argument('--data', type=str, default=None, help='语料文件，不指定时生成合成语料')
+    parser.add_argument('--records', type=int, default=10000, help='合成语料的记录数')
+    parser.add_argument('--workers', type=int, default=4, help='并行解析的进程数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.data
+        if path is None:
+            path = os.path.join(tmp_dir, 'medical.json')
+            make_corpus(path, args.records)
+        print(f"语料: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        cache_dir = os.path.join(tmp_dir, 'cache')
+
+        baseline, cost = timed(lambda: legacy_load(path))
+        print(f"{'eval 逐行':<14} {cost:6.2f}s")
+        runs = [
+            ("json 流式", lambda: list(corpus_loader.iter_records(path, use_cache=False))),
+            (f"json {args.workers} 进程", lambda: list(
+                corpus_loader.iter_records(path, workers=args.workers, use_cache=False))),
+            ("解析并写缓存", lambda: list(corpus_loader.iter_records(path, cache_dir=cache_dir))),
+            ("读取缓存", lambda: list(corpus_loader.iter_records(path, cache_dir=cache_dir))),
+        ]
+        for name, fn in runs:
+            records, cost = timed(fn)
+            print(f"{name:<14} {cost:6.2f}s  记录一致: {records == baseline}")
+
+        # ner_data.py 只需要 desc/prevent/cause 三个字段
+        fields = ["desc", "prevent", "cause"]
+        expected = [{k: r[k] for k in fields if k in r} for r in baseline]
+        records, cost = timed(lambda: list(corpus_loader.iter_records(path, fields=fields, cache_dir=cache_dir)))
+        print(f"{'读取缓存(3字段)':<14} {cost:6.2f}s  记录一致: {records == expected}")
+        column_dir = corpus_loader.cache_path(path, cache_dir)
+        size = sum(os.path.getsize(os.path.join(column_dir, name)) for name in os.listdir(column_dir))
+        print(f"缓存大小: {size / 1e6:.1f} MB")
@@ -0,0 +1,180 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+"""
+知识检索往返次数基准
+对比 PromptService 逐项查询（每个属性/关系、症状反查、生产商各一次往返）与
+合并为单条参数化 Cypher 语句的往返次数和每次问答的检索耗时。
+
+默认使用内存中的模拟图谱（每次往返固定 sleep 模拟网络延迟）；
+指定 --uri 时连接真实 Neo4j（需已运行 build_up_graph.py 导入数据）。
+
+用法（需在项目根目录运行）：
+    python benchmarks/bench_knowledge_retrieval.py --rtt_ms 2 --repeat 50
+    python benchmarks/bench_knowledge_retrieval.py --uri bolt://localhost:7687 --password 12345678
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.services.intent_service import IntentService
+from backend.services.knowledge_cache import KnowledgeCache
+from backend.services.neo4j_queries import get_query
+from backend.services.neo4j_service import Neo4jService
+from backend.services.prompt_service import PromptService, Retrieval
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def data(self):
+        return self._rows
+
+
+class SimulatedGraph:
+    """
+    模拟的 Neo4j 客户端：只支持 knowledge.retrieve 模板，按参数在内存字典中求值，
+    每次 run 调用固定等待 rtt_ms 毫秒以模拟一次网络往返。
+    """
+
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000.0
+        self.round_trips = 0
+        self.props = {
+            "感冒": {"疾病简介": "感冒是常见的上呼吸道感染。", "疾病病因": "病毒感染。", "预防措施": "勤洗手。",
+                     "治疗周期": "7天", "治愈概率": "99%", "疾病易感人群": "所有人群"},
+            "糖尿病": {"疾病简介": "糖尿病是一组代谢性疾病。", "疾病病因": "胰岛素分泌缺陷。", "预防措施": "控制饮食。",
+                       "治疗周期": "终身", "治愈概率": "不能根治", "疾病易感人群": "肥胖人群"},
+        }
+        self.rels = {
+            ("感冒", "疾病使用药品", "药品"): ["感冒灵颗粒", "布洛芬"],
+            ("感冒", "疾病宜吃食物", "食物"): ["梨", "白萝卜"],
+            ("感冒", "疾病忌吃食物", "食物"): ["辣椒"],
+            ("感冒", "疾病所需检查", "检查项目"): ["血常规"],
+            ("感冒", "疾病的症状", "疾病症状"): ["发热", "咳嗽", "流涕"],
+            ("感冒", "治疗的方法", "治疗方法"): ["药物治疗", "支持性治疗"],
+            ("感冒", "疾病并发疾病", "疾病"): ["肺炎"],
+            ("糖尿病", "疾病使用药品", "药品"): ["二甲双胍"],
+            ("糖尿病", "疾病的症状", "疾病症状"): ["多饮", "多尿"],
+            ("糖尿病", "治疗的方法", "治疗方法"): ["药物治疗"],
+        }
+        self.makers = {"布洛芬": ["某某制药有限公司"]}
+        self.symptom_of = {"咳嗽": ["感冒"], "多尿": ["糖尿病"]}
+
+    def run(self, query, params):
+        assert query == get_query("knowledge.retrieve")
+        time.sleep(self.rtt)
+        self.round_trips += 1
+        symptom_diseases = self.symptom_of.get(params["symptom"], [])
+        disease = params["disease"] if params["disease"] is not None else (
+            symptom_diseases[0] if symptom_diseases else None)
+        found = disease in self.props
+        return _Result([{
+            "symptom_diseases": symptom_diseases,
+            "disease_name": disease,
+            "props": [self.props[disease].get(p) for p in params["props"]] if found else [],
+            "rels": [self.rels.get((disease, r, t), []) for r, t in params["rels"]] if found else [],
+            "makers": self.makers.get(params["drug"], []),
+        }])
+
+
+class CountingClient:
+    """包装真实的 Neo4j 连接池客户端，统计往返次数"""
+
+    def __init__(self, client):
+        self._client = client
+        self.round_trips = 0
+
+    def run(self, query, params):
+        self.round_trips += 1
+        return self._client.run(query, params)
+
+
+class PerLookupPromptService(PromptService):
+    """基线：按旧实现的方式逐项检索，每个属性/关系、症状反查、生产商各一次往返"""
+
+    def retrieve(self, client, disease=None, symptom=None, props=None, rels=None, drug=None):
+        merged = Retrieval(disease)
+        if disease is None and symptom is not None:
+            part = super().retrieve(client, symptom=symptom)
+            merged.results.update(part.results)
+            merged.error = merged.error or part.error
+            candidates = part.get(("反查疾病", symptom)) or []
+            merged.disease = disease = candidates[0] if candidates else None
+        if disease is not None:
+            for prop in props or []:
+                part = super().retrieve(client, disease=disease, props=[prop])
+                merged.results.update(part.results)
+                merged.error = merged.error or part.error
+            for rel in rels or []:
+                part = super().retrieve(client, disease=disease, rels=[rel])
+                merged.results.update(part.results)
+                merged.error = merged.error or part.error
+        if drug is not None:
+            part = super().retrieve(client, drug=drug)
+            merged.results.update(part.results)
+            merged.error = merged.error or part.error
+        return merged
+
+
+CASES = [
+    ("感冒怎么办", {"疾病": "感冒"}),
+    ("感冒吃什么", {"疾病": "感冒"}),
+    ("糖尿病能治好吗", {"疾病": "糖尿病"}),
+    ("一直咳嗽是什么症状", {"疾病症状": "咳嗽"}),
+    ("布洛芬是哪里生产的", {"药品": "布洛芬"}),
+    ("感冒多久能好", {"疾病": "感冒"}),
+]
+
+
+def run_cases(service, client, repeat):
+    intent_service = IntentService()
+    prompts = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        prompts = []
+        for query, entities in CASES:
+            # 只使用关键词意图，不调用大模型
+            response = intent_service.recognize(query, "", "local", None)
+            prompts.append(service.generate_prompt(response, query, client, dict(entities))[0])
+    cost = time.perf_counter() - start
+    return prompts, cost / (repeat * len(CASES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="知识检索：逐项查询 vs 单条 Cypher 往返次数与耗时")
+    parser.add_argument('--rtt_ms', type=float, default=2.0, help='模拟图谱每次往返的延迟（毫秒）')
+    parser.add_argument('--repeat', type=int, default=20, help='每组问题重复次数')
+    parser.add_argument('--uri', type=str, default=None, help='真实 Neo4j 地址，不指定时使用模拟图谱')
+    parser.add_argument('--user', type=str, default='neo4j', help='Neo4j 用户名')
+    parser.add_argument('--password', type=str, default='neo4j', help='Neo4j 密码')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def make_service(cls):
+            # 关闭知识缓存（maxsize=0），只比较往返次数本身
+            cache = KnowledgeCache(maxsize=0, version_path=os.path.join(tmp_dir, 'graph_version'),
+                                   frequency_path=os.path.join(tmp_dir, 'frequency.json'))
+            return cls(cache)
+
+        results = {}
+        for name, cls in [("逐项查询", PerLookupPromptService), ("单条 Cypher", PromptService)]:
+            if args.uri:
+                neo4j_service = Neo4jService(uri=args.uri, user=args.user)
+                if not neo4j_service.connect(custom_password=args.password):
+                    raise SystemExit(f"Neo4j 连接失败: {neo4j_service.status()['error']}")
+                client = CountingClient(neo4j_service.client)
+            else:
+                client = SimulatedGraph(args.rtt_ms)
+            prompts, per_request = run_cases(make_service(cls), client, args.repeat)
+            trips = client.round_trips / (args.repeat * len(CASES))
+            results[name] = prompts
+            print(f"{name:<10} 每次问答往返 {trips:5.2f} 次，检索耗时 {per_request * 1000:7.2f} ms")
+
+        same = sum(a == b for a, b in zip(results["逐项查询"], results["单条 Cypher"]))
+        print(f"生成的 Prompt 一致: {same}/{len(CASES)}")
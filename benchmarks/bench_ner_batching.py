@@ -0,0 +1,115 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+NER 批量推理吞吐基准
+在 CPU 上比较不同批大小（默认 1/4/16/32）下 Bert_Model 的推理吞吐，
+并测量 NerService 微批处理队列在并发请求下的整体吞吐。
+测吞吐前先检查补齐后的批量预测与逐条预测的标签是否完全一致，
+以及 NerService 开启与关闭微批处理时 get_entities 返回的实体是否一致，任一不一致时退出码为 1。
+（int8 动态量化按整批输入计算激活的量化参数，批量结果可能与逐条略有差异，一致性检查以 fp32 为准。）
+
+用法（需在项目根目录运行，且 model/ 下已有预训练模型与权重）：
+    python benchmarks/bench_ner_batching.py --num-queries 256 --batch-sizes 1 4 16 32
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import torch
+
+import ner_model as zwk
+from backend.services.ner_service import NerService
+
+
+def make_queries(num_queries, seed=0):
+    """用实体库中的疾病名和常见问法拼出测试查询"""
+    rng = random.Random(seed)
+    with open(os.path.join('data', 'ent_aug', '疾病.txt'), encoding='utf-8') as f:
+        diseases = [x for x in f.read().split('\n') if x]
+    templates = ['{}怎么办', '{}吃什么药好', '得了{}不能吃什么', '{}有哪些症状', '{}需要做什么检查', '{}多久能好']
+    return [rng.choice(templates).format(rng.choice(diseases)) for _ in range(num_queries)]
+
+
+def check_batch_consistency(service, queries, batch_size):
+    """返回批量预测与逐条预测标签不一致的查询列表"""
+    bert_tokenizer, bert_model, idx2tag, _, _, device = service._load_model()
+    mismatched = []
+    for i in range(0, len(queries), batch_size):
+        batch = queries[i:i + batch_size]
+        batched = zwk.predict_tags(bert_model, bert_tokenizer, batch, device, idx2tag)
+        for query, tags in zip(batch, batched):
+            if tags != zwk.predict_tags(bert_model, bert_tokenizer, [query], device, idx2tag)[0]:
+                mismatched.append(query)
+    return mismatched
+
+
+def check_service_consistency(queries, max_batch_size, concurrency):
+    """返回 NerService 开启微批处理（并发提交）与逐条推理时 get_entities 结果不一致的查询列表"""
+    unbatched = NerService(max_batch_size=1, cache_size=0)
+    batched = NerService(max_batch_size=max_batch_size, cache_size=0)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        batched_results = list(pool.map(batched.get_entities, queries))
+    return [query for query, result in zip(queries, batched_results) if result != unbatched.get_entities(query)]
+
+
+def bench_batch_sizes(service, queries, batch_sizes):
+    bert_tokenizer, bert_model, idx2tag, _, _, device = service._load_model()
+    # 预热，避免首次分配内存的开销计入结果
+    zwk.predict_tags(bert_model, bert_tokenizer, queries[:4], device, idx2tag)
+    print(f"{'batch':>6} {'queries/s':>12} {'ms/query':>10}")
+    for bs in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(queries), bs):
+            zwk.predict_tags(bert_model, bert_tokenizer, queries[i:i + bs], device, idx2tag)
+        cost = time.perf_counter() - start
+        print(f"{bs:>6} {len(queries) / cost:>12.1f} {cost * 1000 / len(queries):>10.2f}")
+
+
+def bench_concurrent(queries, concurrency, max_batch_size, window_ms):
+    service = NerService(max_batch_size=max_batch_size, batch_window_ms=window_ms)
+    service.get_entities(queries[0])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(service.get_entities, queries))
+    cost = time.perf_counter() - start
+    print(f"并发={concurrency} max_batch_size={max_batch_size} window={window_ms}ms: "
+          f"{len(queries) / cost:.1f} queries/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NER 批量推理吞吐基准")
+    parser.add_argument('--num-queries', type=int, default=256, help='测试查询条数')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16, 32], help='待比较的批大小')
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU 线程数')
+    parser.add_argument('--concurrency', type=int, default=32, help='微批处理测试的并发请求数')
+    parser.add_argument('--window-ms', type=float, default=5.0, help='微批处理收集窗口（毫秒）')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    queries = make_queries(args.num_queries)
+
+    service = NerService(max_batch_size=1)
+    mismatched = check_batch_consistency(service, queries, max(args.batch_sizes))
+    print(f"== 批量/逐条一致性: {len(queries) - len(mismatched)}/{len(queries)} 条标签一致 ==")
+    for query in mismatched[:10]:
+        print(f"  不一致: {query}")
+    service_mismatched = check_service_consistency(queries, max(args.batch_sizes), args.concurrency)
+    print(f"== NerService 微批/逐条一致性: {len(queries) - len(service_mismatched)}/{len(queries)} 条实体一致 ==")
+    for query in service_mismatched[:10]:
+        print(f"  不一致: {query}")
+    if mismatched or service_mismatched:
+        sys.exit(1)
+
+    print("== 直接批量前向 ==")
+    bench_batch_sizes(service, queries, args.batch_sizes)
+
+    print("== NerService 并发请求 ==")
+    bench_concurrent(queries, args.concurrency, 1, args.window_ms)
+    bench_concurrent(queries, args.concurrency, max(args.batch_sizes), args.window_ms)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+
+"""
+NER 训练补齐策略基准
+比较固定补齐到 max_len（原实现）与"长度分桶 + 按批次动态补齐"两种方式下，
+一个训练 epoch（前向 + 反向 + 参数更新）的耗时以及实际参与计算的 token 数。
+
+用法（需在项目根目录运行，且 model/ 下已有预训练模型）：
+    python benchmarks/bench_ner_padding.py --data data/ner_data_aug.txt --max-samples 2000 --batch-size 32
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import torch
+from torch.utils.data import DataLoader
+from transformers import BertTokenizer
+
+import ner_model as zwk
+
+
+def run_epoch(model, loader, opt, device):
+    model.train()
+    tokens = 0
+    start = time.perf_counter()
+    for text_idx, label_idx, _ in loader:
+        text_idx, label_idx = text_idx.to(device), label_idx.to(device)
+        tokens += text_idx.numel()
+        loss = model(text_idx, label_idx)
+        loss.backward()
+        opt.step()
+        opt.zero_grad()
+    return time.perf_counter() - start, tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NER 训练补齐策略基准")
+    parser.add_argument('--data', type=str, default=os.path.join('data', 'ner_data_aug.txt'), help='标注数据路径')
+    parser.add_argument('--max-samples', type=int, default=2000, help='参与测试的样本数')
+    parser.add_argument('--batch-size', type=int, default=32, help='批大小')
+    parser.add_argument('--max-len', type=int, default=128, help='固定补齐长度')
+    args = parser.parse_args()
+
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    all_text, all_tag = zwk.get_data(args.data, args.max_samples)
+    with open(os.path.join('tmp_data', 'tag2idx.npy'), 'rb') as f:
+        tag2idx = pickle.load(f)
+    model_name = os.path.join('model', 'chinese-roberta-wwm-ext')
+    tokenizer = BertTokenizer.from_pretrained(model_name)
+
+    fixed_ds = zwk.Nerdataset(all_text, all_tag, tokenizer, args.max_len, tag2idx)
+    fixed_loader = DataLoader(fixed_ds, batch_size=args.batch_size, shuffle=True)
+
+    dynamic_ds = zwk.Nerdataset(all_text, all_tag, tokenizer, args.max_len, tag2idx, dynamic_padding=True)
+    sampler = zwk.LengthBucketSampler(dynamic_ds.lengths(), args.batch_size, seed=0)
+    dynamic_loader = DataLoader(dynamic_ds, batch_sampler=sampler, collate_fn=zwk.ner_collate_fn)
+
+    real_tokens = sum(dynamic_ds.lengths())
+    print(f"样本数: {len(all_text)}, 有效 token 数: {real_tokens}")
+    for name, loader in [('固定补齐', fixed_loader), ('分桶+动态补齐', dynamic_loader)]:
+        model = zwk.Bert_Model(model_name, hidden_size=128, tag_num=len(tag2idx), bi=True).to(device)
+        opt = torch.optim.AdamW(model.parameters(), lr=1e-5)
+        cost, tokens = run_epoch(model, loader, opt, device)
+        print(f"{name}: epoch 耗时 {cost:.1f}s, 计算 token 数 {tokens} (补齐占比 {1 - real_tokens / tokens:.1%})")
@@ -0,0 +1,92 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+
+"""
+NER int8 量化精度与延迟报告
+在 ner_data_aug.txt 的留出集上比较 fp32、int8 动态量化、int8 + TorchScript 三种推理方式的
+实体级 F1（seqeval）与 CPU 推理延迟，并检查 F1 下降是否在容忍范围内。
+
+用法（需在项目根目录运行，且 model/ 下已有预训练模型与权重）：
+    python benchmarks/bench_ner_quantization.py --data data/ner_data_aug.txt --max-samples 2000
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import torch
+from seqeval.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from transformers import BertTokenizer
+
+import ner_model as zwk
+
+
+def evaluate(model, tokenizer, texts, tags, idx2tag, batch_size):
+    """返回 (实体级 F1, 单条平均延迟 ms, 批量吞吐 句/秒)"""
+    device = torch.device('cpu')
+    pred = []
+    for i in range(0, len(texts), batch_size):
+        pred.extend(zwk.predict_tags(model, tokenizer, texts[i:i + batch_size], device, idx2tag))
+    f1 = f1_score(tags, pred)
+
+    sample = texts[:200]
+    start = time.perf_counter()
+    for text in sample:
+        zwk.predict_tags(model, tokenizer, [text], device, idx2tag)
+    latency = (time.perf_counter() - start) * 1000 / len(sample)
+
+    start = time.perf_counter()
+    for i in range(0, len(sample), batch_size):
+        zwk.predict_tags(model, tokenizer, sample[i:i + batch_size], device, idx2tag)
+    throughput = len(sample) / (time.perf_counter() - start)
+    return f1, latency, throughput
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NER int8 量化精度与延迟报告")
+    parser.add_argument('--data', type=str, default=os.path.join('data', 'ner_data_aug.txt'), help='标注数据路径')
+    parser.add_argument('--model', type=str, default=zwk.cache_model, help='模型权重名（不含扩展名）')
+    parser.add_argument('--test-size', type=float, default=0.1, help='留出集比例')
+    parser.add_argument('--max-samples', type=int, default=2000, help='留出集最多评估的句子数')
+    parser.add_argument('--batch-size', type=int, default=16, help='批量推理大小')
+    parser.add_argument('--max-len', type=int, default=500, help='句子最大字符数')
+    parser.add_argument('--tolerance', type=float, default=0.005, help='允许的 F1 下降幅度')
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU 线程数')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    all_text, all_tag = zwk.get_data(args.data)
+    _, dev_text, _, dev_tag = train_test_split(all_text, all_tag, test_size=args.test_size, random_state=42)
+    dev_text = [text[:args.max_len] for text in dev_text[:args.max_samples]]
+    dev_tag = [tag[:args.max_len] for tag in dev_tag[:args.max_samples]]
+
+    with open(os.path.join('tmp_data', 'tag2idx.npy'), 'rb') as f:
+        tag2idx = pickle.load(f)
+    idx2tag = list(tag2idx)
+    model_name = os.path.join('model', 'chinese-roberta-wwm-ext')
+    weight_path = os.path.join('model', f'{args.model}.pt')
+    tokenizer = BertTokenizer.from_pretrained(model_name)
+
+    fp32 = zwk.Bert_Model(model_name, hidden_size=128, tag_num=len(tag2idx), bi=True)
+    fp32.load_state_dict(torch.load(weight_path, map_location='cpu'))
+    models = {
+        'fp32': fp32.eval(),
+        'int8': zwk.load_quantized_model(model_name, weight_path, len(tag2idx)).eval(),
+        'int8+torchscript': zwk.load_quantized_model(model_name, weight_path, len(tag2idx), torchscript=True),
+    }
+
+    print(f"留出集: {len(dev_text)} 句")
+    print(f"{'mode':<18} {'F1':>8} {'ms/句(bs=1)':>12} {f'句/秒(bs={args.batch_size})':>14}")
+    base_f1 = None
+    for name, model in models.items():
+        f1, latency, throughput = evaluate(model, tokenizer, dev_text, dev_tag, idx2tag, args.batch_size)
+        if base_f1 is None:
+            base_f1 = f1
+        flag = '' if base_f1 - f1 <= args.tolerance else '  <-- 超出容忍范围'
+        print(f"{name:<18} {f1:>8.4f} {latency:>12.2f} {throughput:>14.1f}{flag}")
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+LLM 抽取流水线基准
+启动一个本地桩服务模拟 Ollama 的 /api/generate（固定延迟后返回确定性结果），
+对比旧实现的串行逐条请求与 data/processjson.py 的并发 + 记忆化流水线的耗时和请求数，
+并验证中途中断后续跑得到的输出与一次跑完完全一致。
+
+用法（需在项目根目录运行）：
+    python benchmarks/bench_processjson.py --records 200 --latency_ms 20 --concurrency 8
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import ollama
+
+from data import processjson
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """按提示词中的"问题输入"返回确定性的抽取结果"""
+
+    latency = 0.02
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['prompt']
+        problem = prompt.split('问题输入: "')[1].split('"')[0]
+        if prompt.startswith(processjson.CURE_WAY_PROMPT[:30]):
+            response = str([part for part in problem.split('，') if part])
+        else:
+            response = f"{problem},未知"
+        time.sleep(self.latency)
+        with StubHandler.lock:
+            StubHandler.requests += 1
+        payload = json.dumps({"model": body['model'], "created_at": "2024-01-01T00:00:00Z",
+                              "response": response, "done": True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_corpus(path, num_records, seed=0):
+    """生成与 medical.json 格式相同的语料，药品与治疗方法在记录间大量重复"""
+    rng = random.Random(seed)
+    drugs = [f"药企{i}药品{i}片(药品{i}片)" for i in range(60)]
+    cures = [f"药物治疗，方法{i}，对症治疗" for i in range(40)]
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_records):
+            record = {"name": f"疾病{i}", "cure_way": rng.sample(cures, 3), "drug_detail": rng.sample(drugs, 5)}
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def legacy_run(input_path, output_path, client):
+    """旧实现：逐条、逐项串行请求，不做记忆化"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if len(line) >= 3]
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for line in lines:
+            data = json.loads(line)
+            cure_way_all = []
+            for x in data['cure_way']:
+                response = client.generate(model='stub', prompt=processjson.CURE_WAY_PROMPT.format(problem=x))
+                cure_way_all.extend(processjson.parse_cure_way(response['response'], x))
+            data['cure_way'] = cure_way_all
+            data['drug_detail'] = [client.generate(model='stub', prompt=processjson.DRUG_DETAIL_PROMPT.format(
+                problem=x))['response'] for x in data['drug_detail']]
+            out.write(json.dumps(data, ensure_ascii=False) + ',\n')
+
+
+def pipeline_run(input_path, output_path, client, concurrency, memo_path, cache_dir, stop_after=None):
+    """运行新流水线；stop_after 不为 None 时在写出该数量的记录后模拟崩溃"""
+    memo = processjson.Memo(memo_path)
+    extractor = processjson.Extractor(client, 'stub', memo, concurrency)
+    checkpoint = processjson.Checkpoint(output_path + '.checkpoint')
+    if stop_after is not None:
+        original = processjson.finish_record
+        calls = [0]
+
+        def crashing_finish(*args):
+            calls[0] += 1
+            if calls[0] > stop_after:
+                raise KeyboardInterrupt
+            return original(*args)
+        processjson.finish_record = crashing_finish
+    try:
+        processjson.run(input_path, output_path, extractor, checkpoint, flush_every=7, cache_dir=cache_dir)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stop_after is not None:
+            processjson.finish_record = original
+        extractor.shutdown()
+        memo.close()
+    return extractor.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 抽取：串行逐条 vs 并发 + 记忆化流水线")
+    parser.add_argument('--records', type=int, default=200, help='语料记录数')
+    parser.add_argument('--latency_ms', type=float, default=20.0, help='桩服务每次请求的延迟（毫秒）')
+    parser.add_argument('--concurrency', type=int, default=8, help='流水线并发请求数')
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency_ms / 1000.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ollama.Client(host=f"http://127.0.0.1:{server.server_address[1]}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'medical.json')
+        make_corpus(input_path, args.records)
+        cache_dir = os.path.join(tmp_dir, 'cache')
+
+        def read(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        StubHandler.requests = 0
+        start = time.perf_counter()
+        legacy_run(input_path, os.path.join(tmp_dir, 'legacy.json'), client)
+        print(f"串行逐条      {time.perf_counter() - start:6.2f}s  请求 {StubHandler.requests}")
+
+        for name, concurrency in [("流水线 1 并发", 1), (f"流水线 {args.concurrency} 并发", args.concurrency)]:
+            StubHandler.requests = 0
+            output = os.path.join(tmp_dir, f'out_{concurrency}.json')
+            start = time.perf_counter()
+            stats = pipeline_run(input_path, output, client, concurrency, output + '.memo.jsonl', cache_dir)
+            print(f"{name:<12} {time.perf_counter() - start:6.2f}s  请求 {StubHandler.requests}  {stats}  "
+                  f"输出一致: {read(output) == read(os.path.join(tmp_dir, 'legacy.json'))}")
+
+        # 中途崩溃后续跑：记忆文件保留已完成的请求，输出从断点继续
+        output = os.path.join(tmp_dir, 'resume.json')
+        StubHandler.requests = 0
+        pipeline_run(input_path, output, client, args.concurrency, output + '.memo.jsonl', cache_dir,
+                     stop_after=args.records // 3)
+        first = StubHandler.requests
+        pipeline_run(input_path, output, client, args.concurrency, output + '.memo.jsonl', cache_dir)
+        print(f"中断后续跑     请求 {first} + {StubHandler.requests - first}  "
+              f"输出一致: {read(output) == read(os.path.join(tmp_dir, 'legacy.json'))}")
+    server.shutdown()
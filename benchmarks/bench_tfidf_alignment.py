@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+"""
+TF-IDF 实体对齐内存与延迟基准
+对比旧实现（稠密 float64 矩阵 + 逐实体 cosine_similarity）与当前实现
+（稀疏 float32 CSR 矩阵 + 精确命中短路 + 按类型批量稀疏矩阵乘法）。
+
+用法（需在项目根目录运行）：
+    python benchmarks/bench_tfidf_alignment.py --num-queries 500
+"""
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+import ner_model as zwk
+
+
+class dense_tfidf_alignment():
+    """优化前的实现，仅用于对比"""
+    def __init__(self):
+        eneities_path = os.path.join('data/ent_aug')
+        files = [docu for docu in os.listdir(eneities_path) if '.py' not in docu]
+        self.tag_2_embs = {}
+        self.tag_2_tfidf_model = {}
+        self.tag_2_entity = {}
+        for ty in files:
+            with open(os.path.join(eneities_path, ty), 'r', encoding='utf-8') as f:
+                entities = f.read().split('\n')
+                entities = [ent for ent in entities if len(ent.split(' ')[0]) <= 15 and len(ent.split(' ')[0]) >= 1]
+                en_name = [ent.split(' ')[0] for ent in entities]
+                ty = ty.strip('.txt')
+                self.tag_2_entity[ty] = en_name
+                tfidf_model = TfidfVectorizer(analyzer="char")
+                self.tag_2_embs[ty] = tfidf_model.fit_transform(en_name).toarray()
+                self.tag_2_tfidf_model[ty] = tfidf_model
+
+    def align(self, ent_list):
+        new_result = {}
+        for s, e, cls, ent in ent_list:
+            if cls not in self.tag_2_tfidf_model:
+                continue
+            ent_emb = self.tag_2_tfidf_model[cls].transform([ent])
+            sim_score = cosine_similarity(ent_emb, self.tag_2_embs[cls])
+            max_idx = sim_score[0].argmax()
+            if sim_score[0][max_idx] >= 0.5:
+                new_result[cls] = self.tag_2_entity[cls][max_idx]
+        return new_result
+
+
+def matrix_bytes(embs):
+    if hasattr(embs, 'indptr'):
+        return embs.data.nbytes + embs.indices.nbytes + embs.indptr.nbytes
+    return embs.nbytes
+
+
+def build(cls):
+    tracemalloc.start()
+    start = time.perf_counter()
+    aligner = cls()
+    build_cost = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = sum(matrix_bytes(embs) for embs in aligner.tag_2_embs.values())
+    return aligner, build_cost, peak, total
+
+
+def make_entity_lists(aligner, num_queries, seed=0):
+    """
+    构造对齐输入：一半实体与词库完全一致（对应 rule_find 命中），
+    另一半随机删掉一个字（对应模型识别出的不完整实体）。
+    """
+    rng = random.Random(seed)
+    types = list(aligner.tag_2_entity)
+    lists = []
+    for _ in range(num_queries):
+        ents = []
+        for ty in rng.sample(types, 3):
+            name = rng.choice(aligner.tag_2_entity[ty])
+            if rng.random() < 0.5 and len(name) > 2:
+                i = rng.randrange(len(name))
+                name = name[:i] + name[i + 1:]
+            ents.append((0, len(name) - 1, ty, name))
+        lists.append(ents)
+    return lists
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TF-IDF 实体对齐内存与延迟基准")
+    parser.add_argument('--num-queries', type=int, default=500, help='测试的实体列表条数')
+    args = parser.parse_args()
+
+    results = {}
+    for name, cls in [('dense(旧)', dense_tfidf_alignment), ('sparse(新)', zwk.tfidf_alignment)]:
+        aligner, build_cost, peak, total = build(cls)
+        results[name] = aligner
+        print(f"{name}: 构建 {build_cost:.2f}s, 矩阵占用 {total / 2 ** 20:.1f} MB, 构建峰值内存 {peak / 2 ** 20:.1f} MB")
+        for ty, embs in aligner.tag_2_embs.items():
+            print(f"    {ty}: shape={embs.shape} {matrix_bytes(embs) / 2 ** 20:.2f} MB")
+
+    ent_lists = make_entity_lists(results['sparse(新)'], args.num_queries)
+    outputs = {}
+    for name, aligner in results.items():
+        start = time.perf_counter()
+        outputs[name] = [aligner.align(ents) for ents in ent_lists]
+        cost = time.perf_counter() - start
+        print(f"{name}: align 平均 {cost * 1000 / len(ent_lists):.3f} ms/query")
+
+    same = sum(a == b for a, b in zip(*outputs.values()))
+    print(f"结果一致: {same}/{len(ent_lists)}")
@@ -1,17 +1,51 @@
+import csv
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from neo4j import GraphDatabase
 from tqdm import tqdm
 import argparse
 
+import corpus_loader
+
 """
 知识图谱构建模块
 该脚本负责从 JSON 数据文件中读取医疗信息，并将其导入到 Neo4j 图数据库中。
 包含实体的创建（疾病、药品、食物、检查项目等）以及它们之间关系的建立。
 """
 
+# 按批次切分数据
+def iter_batches(rows, batch_size):
+    """将行列表按 batch_size 切分为若干批次"""
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+# 在一个会话中以显式事务分批执行 UNWIND 写入
+def write_batches(driver, order, rows, batch_size, desc):
+    """
+    通用批量写入函数：整个导入过程复用同一个会话，每个批次在一个显式事务中通过 UNWIND $rows 写入，
+    进度条按"行/秒"显示写入速度。
+
+    Args:
+        driver: Neo4j 驱动实例
+        order: 以 UNWIND $rows AS row 开头的 Cypher 语句
+        rows: 待写入的行
+        batch_size: 每个事务写入的行数
+        desc: 进度条描述
+    """
+    with driver.session() as session, tqdm(total=len(rows), desc=desc, unit='行', unit_scale=True) as bar:
+        for batch in iter_batches(rows, batch_size):
+            tx = session.begin_transaction()
+            try:
+                tx.run(order, rows=batch)
+                tx.commit()
+            finally:
+                tx.close()
+            bar.update(len(batch))
+
 # 导入普通实体（如药品、食物等，仅包含名称属性）
-def import_entity(driver, type, entity):
+def import_entity(driver, type, entity, batch_size=5000):
     """
     通用实体导入函数
     
@@ -19,105 +53,152 @@ def import_entity(driver, type, entity):
         driver: Neo4j 驱动实例
         type: 节点标签类型 (例如 '药品', '食物')
         entity: 实体名称列表
+        batch_size: 每个事务写入的实体数
     """
-    def create_node(driver, type, name):
-        # 使用 Cypher 语句创建节点
-        order = """create (n:%s{名称:"%s"})""" % (type, name)
-        with driver.session() as session:
-            session.run(order)
-
-    print(f'正在导入{type}类数据')
-    for en in tqdm(entity):
-        create_node(driver, type, en)
+    # 标签无法参数化，来源为固定的实体类型；实体名称通过参数传入
+    order = "UNWIND $rows AS name CREATE (n:`%s` {名称: name})" % type
+    write_batches(driver, order, entity, batch_size, f'导入{type}')
 
 # 导入疾病类实体（包含详细的属性信息）
-def import_disease_data(driver, type, entity):
+def import_disease_data(driver, type, entity, batch_size=5000):
     """
     疾病实体导入函数，包含更多描述性属性
     
     Args:
         driver: Neo4j 驱动实例
         type: 节点标签类型 (通常为 '疾病')
-        entity: 包含疾病详细信息的字典列表
-    """
-    print(f'正在导入{type}类数据')
-    for disease in tqdm(entity):
-        order = """
-        CREATE (n:%s {
-            名称: $name,
-            疾病简介: $desc,
-            疾病病因: $cause,
-            预防措施: $prevent,
-            治疗周期: $cure_lasttime,
-            治愈概率: $cured_prob,
-            疾病易感人群: $easy_get
-        })
-        """ % type
-        with driver.session() as session:
-            session.run(order,
-                       name=disease["名称"],
-                       desc=disease["疾病简介"],
-                       cause=disease["疾病病因"],
-                       prevent=disease["预防措施"],
-                       cure_lasttime=disease["治疗周期"],
-                       cured_prob=disease["治愈概率"],
-                       easy_get=disease["疾病易感人群"])
+        entity: 包含疾病详细信息的字典列表（键即节点属性名：名称、疾病简介、疾病病因、预防措施、治疗周期、治愈概率、疾病易感人群）
+        batch_size: 每个事务写入的疾病数
+    """
+    order = "UNWIND $rows AS row CREATE (n:`%s`) SET n = row" % type
+    write_batches(driver, order, entity, batch_size, f'导入{type}')
+
+# 并行导入全部实体
+def import_all_entity(driver, all_entity, batch_size=5000, workers=1):
+    """
+    按标签划分写入任务：每个标签由一个线程（各自的会话）负责，
+    不同标签的节点互不相交，多个写线程之间不会产生锁竞争。
+    """
+    def import_one(k):
+        if k != "疾病":
+            import_entity(driver, k, all_entity[k], batch_size)
+        else:
+            import_disease_data(driver, k, all_entity[k], batch_size)
+
+    if workers <= 1:
+        for k in all_entity:
+            import_one(k)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 逐个取结果，使任一线程中的异常能够抛出
+        for _ in executor.map(import_one, all_entity):
+            pass
+
+# 更新图谱版本文件
+def write_graph_version(path=os.path.join('tmp_data', 'graph_version')):
+    """
+    记录图谱的构建时间。后端知识检索缓存 (backend/services/knowledge_cache.py)
+    通过该文件的修改时间判断图谱是否被重新构建，从而使缓存失效。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(str(time.time()))
+
+# 实体名称全文索引名，后端 backend/services/neo4j_queries.py 中的名称搜索使用同一名称
+FULLTEXT_INDEX = 'entity_name_fulltext'
+
+# 创建索引
+def create_schema(driver, labels):
+    """
+    在导入前为每个标签的"名称"属性创建索引，并为名称搜索创建全文索引，随后等待索引全部上线。
+    关系导入时的 MATCH 与后端的按名称查询由标签扫描变为索引查找。
+    同一标签下允许出现重名实体（如数据中重复的疾病），因此使用普通索引而非唯一约束。
+
+    Args:
+        driver: Neo4j 驱动实例
+        labels: 节点标签列表
+    """
+    start = time.perf_counter()
+    with driver.session() as session:
+        for label in labels:
+            session.run("CREATE INDEX `idx_%s_名称` IF NOT EXISTS FOR (n:`%s`) ON (n.名称)" % (label, label))
+        # cjk 分析器按二元组切分中文，适合中文名称的子串搜索
+        session.run(
+            "CREATE FULLTEXT INDEX `%s` IF NOT EXISTS FOR (n:%s) ON EACH [n.名称] "
+            "OPTIONS {indexConfig: {`fulltext.analyzer`: 'cjk'}}"
+            % (FULLTEXT_INDEX, "|".join(f"`{label}`" for label in labels))
+        )
+        session.run("CALL db.awaitIndexes(600)")
+    print(f"索引已就绪，用时 {time.perf_counter() - start:.1f}s")
+
+# 删除索引
+def drop_schema(driver, labels):
+    """
+    删除 create_schema 创建的名称索引与全文索引。
+    索引不会随 detach delete 删除，--no-index 对比前需先删除，否则导入与查询仍会走上次创建的索引。
+    """
+    with driver.session() as session:
+        for label in labels:
+            session.run("DROP INDEX `idx_%s_名称` IF EXISTS" % label)
+        session.run("DROP INDEX `%s` IF EXISTS" % FULLTEXT_INDEX)
+    print("已删除名称索引与全文索引")
+
+# 统计常用查询耗时
+def time_queries(driver, all_entity, relationship, sample=200):
+    """
+    使用导入的数据抽样执行后端常用的几类查询，打印平均耗时，用于对比有无索引的效果。
+    """
+    diseases = [d['名称'] for d in all_entity['疾病'][:sample]]
+    symptoms = [rel[4] for rel in relationship if rel[2] == '疾病的症状'][:sample]
+    queries = [
+        ("按名称查疾病属性", "MATCH (a:疾病 {名称: $name}) RETURN a.疾病简介", diseases),
+        ("查疾病关联药品", "MATCH (a:疾病 {名称: $name})-[:疾病使用药品]->(b:药品) RETURN b.名称", diseases),
+        ("症状反查疾病", "MATCH (a:疾病)-[:疾病的症状]->(b:疾病症状 {名称: $name}) RETURN a.名称", symptoms),
+        ("名称子串搜索", "MATCH (n) WHERE n.名称 CONTAINS $name RETURN n.名称 LIMIT 50", diseases),
+    ]
+    with driver.session() as session:
+        for desc, order, names in queries:
+            if not names:
+                continue
+            start = time.perf_counter()
+            for name in names:
+                session.run(order, name=name).consume()
+            cost = (time.perf_counter() - start) / len(names)
+            print(f"{desc}: 平均 {cost * 1000:.2f} ms/次（{len(names)} 次）")
 
 # 创建所有实体间的关系
-def create_all_relationship(driver, all_relationship):
+def create_all_relationship(driver, all_relationship, batch_size=5000):
     """
-    建立节点之间的关联关系
+    建立节点之间的关联关系。
+    标签与关系类型无法参数化，因此先按 (源标签, 关系类型, 目标标签) 分组，每组使用一条 UNWIND 语句分批写入。
+    关系写入会同时锁住两端节点，不同分组之间可能共享节点（如同一种药品），因此关系始终由单个会话顺序写入。
     
     Args:
         driver: Neo4j 驱动实例
         all_relationship: 关系列表，每个元素为 (源节点标签, 源节点名称, 关系类型, 目标节点标签, 目标节点名称)
+        batch_size: 每个事务写入的关系数
     """
-    def create_relationship(driver, type1, name1, relation, type2, name2):
-        # 匹配两个节点并创建指定类型的关系
-        order = """match (a:%s{名称:"%s"}),(b:%s{名称:"%s"}) create (a)-[r:%s]->(b)""" % (type1, name1, type2, name2, relation)
-        with driver.session() as session:
-            session.run(order)
+    groups = {}
+    for type1, name1, relation, type2, name2 in all_relationship:
+        groups.setdefault((type1, relation, type2), []).append([name1, name2])
     print("正在导入关系.....")
-    for type1, name1, relation, type2, name2 in tqdm(all_relationship):
-        create_relationship(driver, type1, name1, relation, type2, name2)
-
-if __name__ == "__main__":
-    # 配置命令行参数，用于连接数据库
-    parser = argparse.ArgumentParser(description="通过 medical.json 文件创建一个医疗知识图谱")
-    parser.add_argument('--website', type=str, default='http://localhost:7474', help='Neo4j 浏览器访问地址')
-    parser.add_argument('--user', type=str, default='neo4j', help='Neo4j 用户名')
-    parser.add_argument('--password', type=str, default='asd2528836683', help='Neo4j 密码')
-    parser.add_argument('--dbname', type=str, default='MedRAG', help='数据库名称')
-    args = parser.parse_args()
+    for (type1, relation, type2), rows in groups.items():
+        order = """UNWIND $rows AS row
+        MATCH (a:`%s` {名称: row[0]}), (b:`%s` {名称: row[1]})
+        CREATE (a)-[r:`%s`]->(b)""" % (type1, type2, relation)
+        write_batches(driver, order, rows, batch_size, f'导入关系 {relation}')
 
-    # 初始化 Neo4j 数据库连接
-    try:
-        # 使用 bolt 协议连接数据库
-        from neo4j import GraphDatabase
-        driver = GraphDatabase.driver("bolt://localhost:7687", auth=(args.user, args.password))
-        # 测试连接是否可用
-        with driver.session() as session:
-            session.run("RETURN 1")
-        print("Neo4j 连接成功!")
-        client = driver
-    except Exception as e:
-        print(f"Neo4j 连接失败: {e}")
-        print("请检查:")
-        print("1. Neo4j 服务是否已在 localhost:7687 端口启动")
-        print("2. 提供的用户名和密码是否正确")
-        exit(1)
-
-    # 询问是否清空数据库，防止数据重复
-    is_delete = input('注意: 是否删除 Neo4j 上的所有实体? (y/n):')
-    if is_delete == 'y':
-        with client.session() as session:
-            # 清空所有节点及其关系
-            session.run("match (n) detach delete (n)")
+# 从医疗数据文件中提取实体与关系
+def extract_graph(path='./data/medical_new_2.json', parse_workers=1):
+    """
+    解析医疗数据文件，提取各类实体与实体间关系，并完成去重。
+    记录由 corpus_loader 流式解析（首次解析后写入缓存，再次运行直接读取缓存）。
 
-    # 读取清洗后的医疗数据文件
-    with open('./data/medical_new_2.json','r',encoding='utf-8') as f:
-        all_data = f.read().split('\n')
-    
+    Returns:
+        tuple: (all_entity, relationship)
+            all_entity: {实体类型: 实体列表}，疾病为属性字典列表，其余为名称列表
+            relationship: [(源节点标签, 源节点名称, 关系类型, 目标节点标签, 目标节点名称), ...]
+    """
     # 初始化实体分类字典
     all_entity = {
         "疾病": [],
@@ -132,12 +213,7 @@ if __name__ == "__main__":
     
     # 解析数据并提取实体和关系
     relationship = []
-    for i, data in enumerate(all_data):
-        if (len(data) < 3):
-            continue
-        # 使用 eval 解析 JSON 行（注：由于数据格式原因，这里采用了特殊处理）
-        data = eval(data[:-1])
-
+    for data in tqdm(corpus_loader.iter_records(path, workers=parse_workers), desc='解析数据'):
         disease_name = data.get("name","")
         # 提取疾病详情
         all_entity["疾病"].append({
@@ -216,7 +292,88 @@ if __name__ == "__main__":
     # 数据去重
     relationship = list(set(relationship))
     all_entity = {k: (list(set(v)) if k != "疾病" else v) for k, v in all_entity.items()}
-    
+    return all_entity, relationship
+
+# 导出 neo4j-admin 离线导入所需的 CSV 文件
+def export_csv(all_entity, relationship, out_dir):
+    """
+    按标签写出节点文件、按 (源标签, 关系类型, 目标标签) 写出关系文件，表头采用 neo4j-admin database import 的格式：
+        节点：名称:ID(标签)[,疾病属性...],:LABEL   （每个标签一个 ID 空间，名称即稳定 ID）
+        关系：:START_ID(源标签),:END_ID(目标标签),:TYPE
+    直接遍历已提取的实体与关系逐行写入磁盘，不在内存中另建副本。
+
+    Returns:
+        tuple: (节点文件列表 [(标签, 路径)], 关系文件列表 [(关系类型, 路径)])
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    disease_props = ["疾病简介", "疾病病因", "预防措施", "治疗周期", "治愈概率", "疾病易感人群"]
+    node_files = []
+    for label, entities in all_entity.items():
+        path = os.path.join(out_dir, f'nodes_{label}.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if label == "疾病":
+                writer.writerow([f"名称:ID({label})"] + disease_props + [":LABEL"])
+                # 疾病数据中存在重名，同一 ID 空间内只保留第一条
+                seen = set()
+                for disease in entities:
+                    if disease["名称"] in seen:
+                        continue
+                    seen.add(disease["名称"])
+                    writer.writerow([disease["名称"]] + [disease[p] for p in disease_props] + [label])
+            else:
+                writer.writerow([f"名称:ID({label})", ":LABEL"])
+                for name in entities:
+                    writer.writerow([name, label])
+        node_files.append((label, path))
+
+    # 关系按分组写入各自的文件，所有文件同时打开，遍历一次关系列表即可
+    handles, writers, rel_files = {}, {}, []
+    try:
+        for type1, name1, relation, type2, name2 in tqdm(relationship, desc='导出关系'):
+            key = (type1, relation, type2)
+            if key not in writers:
+                path = os.path.join(out_dir, f'rels_{type1}_{relation}_{type2}.csv')
+                handles[key] = open(path, 'w', encoding='utf-8', newline='')
+                writers[key] = csv.writer(handles[key])
+                writers[key].writerow([f":START_ID({type1})", f":END_ID({type2})", ":TYPE"])
+                rel_files.append((relation, path))
+            writers[key].writerow([name1, name2, relation])
+    finally:
+        for f in handles.values():
+            f.close()
+    return node_files, rel_files
+
+# 生成 neo4j-admin 导入命令
+def admin_import_command(node_files, rel_files, database='neo4j'):
+    """拼接 neo4j-admin database import full 命令（需在 Neo4j 停止状态下执行）"""
+    parts = ["neo4j-admin database import full"]
+    parts += [f'--nodes={label}="{os.path.abspath(path)}"' for label, path in node_files]
+    parts += [f'--relationships={relation}="{os.path.abspath(path)}"' for relation, path in rel_files]
+    # 描述字段可能包含换行；关系中引用了数据中不存在的节点时跳过该关系（与在线导入的 MATCH 行为一致）
+    parts += ["--multiline-fields=true", "--skip-bad-relationships=true", "--skip-duplicate-nodes=true",
+              "--overwrite-destination=true", database]
+    return " \\\n    ".join(parts)
+
+if __name__ == "__main__":
+    # 配置命令行参数，用于连接数据库
+    parser = argparse.ArgumentParser(description="通过 medical.json 文件创建一个医疗知识图谱")
+    parser.add_argument('--website', type=str, default='http://localhost:7474', help='Neo4j 浏览器访问地址')
+    parser.add_argument('--user', type=str, default='neo4j', help='Neo4j 用户名')
+    parser.add_argument('--password', type=str, default='asd2528836683', help='Neo4j 密码')
+    parser.add_argument('--dbname', type=str, default='MedRAG', help='数据库名称')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每个事务批量写入的行数')
+    parser.add_argument('--workers', type=int, default=1, help='并行写入节点的线程数（按标签划分）')
+    parser.add_argument('--no-index', action='store_true', help='不创建并删除已有的名称索引（用于对比导入与查询耗时）')
+    parser.add_argument('--data', type=str, default='./data/medical_new_2.json', help='清洗后的医疗数据文件')
+    parser.add_argument('--parse-workers', type=int, default=1, help='解析数据文件的进程数')
+    parser.add_argument('--export-csv', type=str, default=None, metavar='DIR',
+                        help='不连接数据库，导出 neo4j-admin 离线导入所需的 CSV 文件到指定目录')
+    args = parser.parse_args()
+
+    # 读取清洗后的医疗数据文件，提取实体与关系
+    all_entity, relationship = extract_graph(args.data, args.parse_workers)
+
     # 将提取的关系保存到本地文件，方便核对
     with open("./data/rel_aug.txt", 'w', encoding='utf-8') as f:
         for rel in relationship:
@@ -235,14 +392,58 @@ if __name__ == "__main__":
                 for i, ent in enumerate(v):
                     f.write(ent['名称']+('\n' if i != len(v)-1 else ''))
 
+    # 离线导出模式：写出 CSV 并打印 neo4j-admin 导入命令
+    if args.export_csv:
+        node_files, rel_files = export_csv(all_entity, relationship, args.export_csv)
+        print(f"CSV 已导出到 {args.export_csv}，停止 Neo4j 后执行以下命令导入：")
+        print(admin_import_command(node_files, rel_files))
+        exit(0)
+
+    # 初始化 Neo4j 数据库连接
+    try:
+        # 使用 bolt 协议连接数据库
+        from neo4j import GraphDatabase
+        driver = GraphDatabase.driver("bolt://localhost:7687", auth=(args.user, args.password))
+        # 测试连接是否可用
+        with driver.session() as session:
+            session.run("RETURN 1")
+        print("Neo4j 连接成功!")
+        client = driver
+    except Exception as e:
+        print(f"Neo4j 连接失败: {e}")
+        print("请检查:")
+        print("1. Neo4j 服务是否已在 localhost:7687 端口启动")
+        print("2. 提供的用户名和密码是否正确")
+        exit(1)
+
+    # 询问是否清空数据库，防止数据重复
+    is_delete = input('注意: 是否删除 Neo4j 上的所有实体? (y/n):')
+    if is_delete == 'y':
+        with client.session() as session:
+            # 清空所有节点及其关系
+            session.run("match (n) detach delete (n)")
+        write_graph_version()
+
+    # 导入前创建索引，使关系导入时的节点匹配走索引；--no-index 时删除已有索引
+    if args.no_index:
+        drop_schema(client, list(all_entity))
+    else:
+        create_schema(client, list(all_entity))
+
     # 执行导入操作
-    for k in all_entity:
-        if k != "疾病":
-            import_entity(client, k, all_entity[k])
-        else:
-            import_disease_data(client, k, all_entity[k])
+    start = time.perf_counter()
+    import_all_entity(client, all_entity, args.batch_size, args.workers)
+    node_cost = time.perf_counter() - start
     # 创建关系
-    create_all_relationship(client, relationship)
+    create_all_relationship(client, relationship, args.batch_size)
+    total_cost = time.perf_counter() - start
+    node_rows = sum(len(v) for v in all_entity.values())
+    print(f"导入完成：节点 {node_rows} 个，用时 {node_cost:.1f}s；"
+          f"关系 {len(relationship)} 条，用时 {total_cost - node_cost:.1f}s；总用时 {total_cost:.1f}s")
+    # 图谱已变化，通知后端的知识检索缓存失效
+    write_graph_version()
+    # 常用查询耗时（配合 --no-index 对比有无索引）
+    time_queries(client, all_entity, relationship)
 
     
 
@@ -0,0 +1,254 @@
+import argparse
+import ast
+import gc
+import hashlib
+import json
+import marshal
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+医疗语料加载模块
+medical.json / medical_new_2.json 均为"每行一条记录"的格式（后者行尾带逗号），
+本模块以生成器方式逐行解析（json.loads，少量非标准行退回 ast.literal_eval，不再使用 eval），
+可选地按块分发到进程池并行解析，并在首次解析时把结果按字段写入列式缓存（marshal），
+之后 build_up_graph.py 与 ner_data.py 直接从缓存逐块读取，且只加载各自需要的字段，无需再次解析文本。
+
+预先生成缓存（需在项目根目录运行）：
+    python corpus_loader.py data/medical.json --workers 4
+"""
+
+# 缓存格式版本，存储结构变化时递增
+CACHE_VERSION = 1
+# 缓存默认存放目录
+CACHE_DIR = os.path.join('tmp_data', 'corpus_cache')
+
+
+def parse_line(line):
+    """
+    解析一行记录，返回字典；空行或无法解析的行返回 None。
+    兼容行尾逗号，以及早期脚本写出的 Python 字面量格式。
+    """
+    line = line.strip()
+    if line.endswith(','):
+        line = line[:-1]
+    if len(line) < 2:
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        try:
+            record = ast.literal_eval(line)
+        except (ValueError, SyntaxError):
+            return None
+    return record if isinstance(record, dict) else None
+
+
+def _parse_chunk(lines):
+    """子进程任务：解析一块文本行"""
+    return [record for record in map(parse_line, lines) if record is not None]
+
+
+def _iter_chunks(path, chunk_size):
+    """逐行读取文件，按 chunk_size 行分块"""
+    chunk = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_parsed_chunks(path, workers, chunk_size):
+    """按块产出解析结果；workers > 1 时并行解析，同时在途的块数有上限，结果保持原始顺序"""
+    if workers <= 1:
+        for chunk in _iter_chunks(path, chunk_size):
+            yield _parse_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _iter_chunks(path, chunk_size):
+            pending.append(executor.submit(_parse_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION, 'source': os.path.abspath(path),
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    """源文件对应的缓存目录"""
+    digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f'{os.path.basename(path)}.{digest}')
+
+
+class _ColumnWriter:
+    """
+    按列写出缓存：每个字段一个文件，依次写入每块记录在该字段上的取值列表（marshal），
+    块中没有出现的字段不写。meta.json 记录各块长度以及每个字段的 [块序号, 字节数] 列表，最后写入。
+    """
+
+    def __init__(self, out_dir, stamp):
+        self.out_dir = out_dir
+        self.stamp = stamp
+        self.files = {}
+        self.segments = {}
+        self.chunk_lengths = []
+        os.makedirs(out_dir)
+
+    def write(self, chunk):
+        idx = len(self.chunk_lengths)
+        self.chunk_lengths.append(len(chunk))
+        fields = {}
+        for record in chunk:
+            for key in record:
+                fields.setdefault(key, None)
+        for key in fields:
+            if key not in self.files:
+                self.files[key] = open(os.path.join(self.out_dir, f'{len(self.files)}.col'), 'wb')
+                self.segments[key] = []
+            data = marshal.dumps([record.get(key) for record in chunk])
+            self.files[key].write(data)
+            self.segments[key].append([idx, len(data)])
+
+    def close(self, completed):
+        fields = {key: {'file': os.path.basename(f.name), 'segments': self.segments[key]}
+                  for key, f in self.files.items()}
+        for f in self.files.values():
+            f.close()
+        if completed:
+            meta = dict(self.stamp, chunk_lengths=self.chunk_lengths, fields=fields)
+            with open(os.path.join(self.out_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+
+def _read_column(f, segments, num_chunks):
+    """按块顺序产出某字段的取值列表，该字段在某块中未出现时产出 None"""
+    # 按记录的字节数整段读取后 marshal.loads，比直接对文件对象 marshal.load 快得多
+    segments = iter(segments)
+    pending = next(segments, None)
+    for idx in range(num_chunks):
+        if pending is not None and pending[0] == idx:
+            yield marshal.loads(f.read(pending[1]))
+            pending = next(segments, None)
+        else:
+            yield None
+
+
+def _iter_cache(cache_dir, stamp, fields=None):
+    """
+    从列式缓存逐块读取记录，只加载 fields 指定的字段（None 表示全部字段）。
+    缓存不存在或与源文件不一致时返回 None。
+    """
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if any(meta.get(k) != v for k, v in stamp.items()):
+        return None
+
+    keys = [key for key in meta['fields'] if fields is None or key in fields]
+    chunk_lengths = meta['chunk_lengths']
+
+    def records():
+        handles = [open(os.path.join(cache_dir, meta['fields'][key]['file']), 'rb') for key in keys]
+        try:
+            columns = [_read_column(f, meta['fields'][key]['segments'], len(chunk_lengths))
+                       for key, f in zip(keys, handles)]
+            for n in chunk_lengths:
+                # 大量创建小对象时关闭循环垃圾回收，可明显加快反序列化
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    values = [next(column) or [None] * n for column in columns]
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+                for row in zip(*values) if values else [()] * n:
+                    yield {key: value for key, value in zip(keys, row) if value is not None}
+        finally:
+            for f in handles:
+                f.close()
+    return records()
+
+
+def iter_records(path, fields=None, workers=1, chunk_size=1000, use_cache=True, cache_dir=CACHE_DIR):
+    """
+    逐条产出语料记录（字典）。
+
+    Args:
+        path: 语料文件路径
+        fields: 只需要的字段列表，None 表示全部字段；从缓存读取时只加载这些字段的列
+        workers: 解析进程数，1 表示在当前进程中解析
+        chunk_size: 每块的行数
+        use_cache: 是否读写列式缓存。缓存有效时直接读取；否则边解析边写缓存，
+                   完整遍历一遍后缓存才生效（中途退出不会留下不完整的缓存）
+        cache_dir: 缓存目录
+    注意：值为 null 的字段与缺失字段等同，产出的记录中不包含该键。
+    """
+    stamp = _source_stamp(path)
+    column_dir = cache_path(path, cache_dir)
+    if use_cache:
+        cached = _iter_cache(column_dir, stamp, fields)
+        if cached is not None:
+            yield from cached
+            return
+
+    def project(chunk):
+        # 与从缓存读取时一致：去掉值为 null 的字段
+        if fields is None:
+            return [{key: value for key, value in record.items() if value is not None} for record in chunk]
+        return [{key: record[key] for key in fields if record.get(key) is not None} for record in chunk]
+
+    if not use_cache:
+        for chunk in _iter_parsed_chunks(path, workers, chunk_size):
+            yield from project(chunk)
+        return
+
+    tmp_dir = f'{column_dir}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    writer = _ColumnWriter(tmp_dir, stamp)
+    completed = False
+    try:
+        for chunk in _iter_parsed_chunks(path, workers, chunk_size):
+            writer.write(chunk)
+            yield from project(chunk)
+        completed = True
+    finally:
+        writer.close(completed)
+        if completed:
+            if os.path.exists(column_dir):
+                shutil.rmtree(column_dir)
+            os.replace(tmp_dir, column_dir)
+        else:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="解析医疗语料并生成列式缓存")
+    parser.add_argument('path', type=str, help='语料文件路径，如 data/medical.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='解析进程数')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='每块的行数')
+    parser.add_argument('--output', type=str, default=CACHE_DIR, help='缓存目录')
+    args = parser.parse_args()
+
+    column_dir = cache_path(args.path, args.output)
+    if os.path.exists(column_dir):
+        shutil.rmtree(column_dir)
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_records(args.path, workers=args.workers, chunk_size=args.chunk_size,
+                                        cache_dir=args.output))
+    print(f"解析完成: {count} 条记录，用时 {time.perf_counter() - start:.2f}s，缓存: {column_dir}")
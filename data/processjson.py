@@ -1,10 +1,42 @@
-import os
-from tqdm import tqdm
+"""
+医疗数据 LLM 抽取脚本
+对 medical.json 中每条记录的 cure_way（治疗方法）与 drug_detail（药品详情）调用大模型抽取实体，
+结果写入 medical_new_2.json（每行一条记录，行尾带逗号），供 build_up_graph.py 使用。
+
+- 并发：最多 --concurrency 个请求同时发往 LLM 后端，输出仍按原始记录顺序写出；
+- 记忆化：相同任务、相同输入只请求一次（药品名在不同疾病间大量重复），结果持久化到 JSONL 文件，
+  重新运行时直接复用；
+- 断点续跑：定期记录已写出的记录数与输出文件偏移量，崩溃或中断后重新运行即从断点继续，
+  输出文件中断点之后不完整的内容会被截断；没有断点文件而输出文件已有内容时拒绝启动（需 --restart），
+  避免覆盖已有结果；
+- 单项请求失败时该项保留原文（与逐条实现一致），失败结果不写入记忆，下次运行会重新请求；
+- --host 可指向任意实现 /api/generate 的服务（如本地桩服务），便于离线测试。
+
+用法（需在项目根目录运行）：
+    python data/processjson.py --concurrency 4
+    python data/processjson.py --host http://127.0.0.1:11434 --model qwen:32b --restart
+"""
+
+import argparse
+import ast
 import json
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from itertools import islice
+
 import ollama
+from tqdm import tqdm
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import corpus_loader
 
-def get_cure_way_result(problem):
-    prompt = f"""
+CURE_WAY_PROMPT = """
 请根据任务说明和两个实例,模仿着解决"问题输入"中的问题。
 任务说明：
 对于给定的文本，识别并提取所有提及的“治疗方法”实体。这包括具体的治疗措施、药物名称、手术方法等。
@@ -40,12 +72,8 @@ def get_cure_way_result(problem):
 
 【仅输出如下格式的答案，不要包含任何其他文本或说明。】
     """
-    response = ollama.generate(model='qwen:32b', prompt=prompt)['response']
-    # print(response)
-    return eval(response)
 
-def get_drug_detail_result(problem):
-    prompt = f"""
+DRUG_DETAIL_PROMPT = """
 请根据任务说明和两个实例,模仿着解决"问题输入"中的问题。
 任务说明：
 对于给定的文本，识别并提取具体的药物名称和药品商名称,并输出。中间用逗号(英文)分隔，如果不知道厂商，请输出“未知”。
@@ -85,41 +113,273 @@ def get_drug_detail_result(problem):
 对于给定的文本，识别并提取具体的药物名称和药品商名称,并输出。中间用逗号(英文)分隔，如果不知道厂商，请输出“未知”。
 【仅输出如下格式的答案，不要包含任何其他文本或说明。】
 """
-    response = ollama.generate(model='qwen:32b', prompt=prompt)['response']
-    # print(response)
-    return response
-    response = ollama.generate(model='qwen:32b', prompt=prompt)['response']
-    # print(response)
+
+
+def parse_cure_way(response, problem):
+    """解析治疗方法抽取结果（一维列表），格式不符时保留原文"""
+    try:
+        result = ast.literal_eval(response.strip())
+    except (ValueError, SyntaxError):
+        return [problem]
+    return list(result) if isinstance(result, (list, tuple)) else [problem]
+
+
+def parse_drug_detail(response, problem):
+    """药品详情直接保留模型输出（"药物名称,药品商"）"""
     return response
 
-with open('./data/medical.json','r',encoding='utf-8') as f:
-    all_data = f.read().split('\n')
-    for i,data in enumerate(tqdm(all_data[2855:])):
-        if (len(data) < 3):
-            continue
-        data = eval(data)
-
-        
-        if 'cure_way' in data:
-            cure = data['cure_way']
-            cure_way_all = []
-            for x in cure:
-                try:
-                    modified_way = get_cure_way_result(x)
-                    cure_way_all.extend(modified_way)
-                except:
-                    cure_way_all.extend([x])
-            data['cure_way'] = cure_way_all
-
-        drug_detail = data.get("drug_detail",[])
-        if drug_detail:
-            for t,detail in enumerate(drug_detail):
-                drug_detail[t] = get_drug_detail_result(drug_detail[t])
-            data['drug_detail'] = drug_detail
-                
-        
-        json_str = json.dumps(data,ensure_ascii=False)
-        
-        with open('./data/medical_new_2.json', 'a',encoding='utf8') as f:
-            # 确保内容从新的一行开始
-            f.write(json_str+',\n')
\ No newline at end of file
+
+def fallback_cure_way(problem):
+    return [problem]
+
+
+def fallback_drug_detail(problem):
+    return problem
+
+
+# 任务名 -> (提示词模板, 结果解析函数, 请求失败时的回退结果)
+TASKS = {
+    "cure_way": (CURE_WAY_PROMPT, parse_cure_way, fallback_cure_way),
+    "drug_detail": (DRUG_DETAIL_PROMPT, parse_drug_detail, fallback_drug_detail),
+}
+
+
+class Memo:
+    """
+    抽取结果的持久化记忆：每行一条 {"task", "input", "output"}，启动时全部载入，
+    新结果追加写入并立即 flush，进程崩溃也不会丢失已完成的请求。
+    path 为 None 时只在内存中记忆。
+    """
+
+    def __init__(self, path):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时可能留下半行，跳过即可
+                        continue
+                    self._data[(item["task"], item["input"])] = item["output"]
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, task, text, default=None):
+        return self._data.get((task, text), default)
+
+    def put(self, task, text, output):
+        with self._lock:
+            self._data[(task, text)] = output
+            if self._file is not None:
+                self._file.write(json.dumps({"task": task, "input": text, "output": output}, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Extractor:
+    """
+    并发抽取器：请求提交到大小为 concurrency 的线程池，因此同时发往 LLM 后端的请求数有上限。
+    命中记忆时直接返回已完成的 Future；相同输入正在请求中时复用同一个 Future。
+    请求或解析出错时返回该任务的回退结果（原文），并计入 errors。
+    """
+
+    def __init__(self, client, model, memo, concurrency=4):
+        self.client = client
+        self.model = model
+        self.memo = memo
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.memo_hits = 0
+        self.deduplicated = 0
+        self.errors = 0
+
+    def submit(self, task, text):
+        key = (task, text)
+        with self._lock:
+            missing = object()
+            output = self.memo.get(task, text, missing)
+            if output is not missing:
+                self.memo_hits += 1
+                future = Future()
+                future.set_result(output)
+                return future
+            future = self._inflight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+            self.requests += 1
+            future = self.executor.submit(self._call, task, text)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._discard(key))
+        return future
+
+    def _discard(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _call(self, task, text):
+        template, parse, fallback = TASKS[task]
+        try:
+            response = self.client.generate(model=self.model, prompt=template.format(problem=text))['response']
+            output = parse(response, text)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            tqdm.write(f"{task} 抽取失败，保留原文: {text[:30]} ({e})")
+            return fallback(text)
+        # 先写入记忆再移出在途表，期间提交的相同输入会直接命中记忆
+        self.memo.put(task, text, output)
+        return output
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return {"requests": self.requests, "memo_hits": self.memo_hits, "deduplicated": self.deduplicated,
+                "errors": self.errors}
+
+
+def submit_record(extractor, data):
+    """为一条记录提交全部抽取请求，返回 (记录, 治疗方法 Future 列表, 药品详情 Future 列表)"""
+    cure_futures = [extractor.submit("cure_way", x) for x in data.get('cure_way', [])]
+    drug_futures = [extractor.submit("drug_detail", x) for x in data.get('drug_detail', [])]
+    return data, cure_futures, drug_futures
+
+
+def finish_record(data, cure_futures, drug_futures):
+    """等待该记录的抽取结果并写回记录；某一项出错时该项保留原文"""
+    def result(future, task, text):
+        try:
+            return future.result()
+        except CancelledError:
+            raise
+        except Exception:
+            return TASKS[task][2](text)
+
+    if 'cure_way' in data:
+        cure_way_all = []
+        for future, text in zip(cure_futures, data['cure_way']):
+            cure_way_all.extend(result(future, "cure_way", text))
+        data['cure_way'] = cure_way_all
+    if data.get('drug_detail'):
+        data['drug_detail'] = [result(future, "drug_detail", text)
+                               for future, text in zip(drug_futures, data['drug_detail'])]
+    return data
+
+
+class Checkpoint:
+    """断点文件：记录已写出的记录数与输出文件的字节偏移量，原子替换写入"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """返回 (已写出记录数, 字节偏移量)；断点文件不存在或损坏时返回 None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state["done"], state["offset"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def save(self, done, offset):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"done": done, "offset": offset}, f)
+        os.replace(tmp_path, self.path)
+
+
+def run(input_path, output_path, extractor, checkpoint, window=64, flush_every=20, restart=False,
+        cache_dir=corpus_loader.CACHE_DIR):
+    """
+    逐条读取记录并抽取，按原始顺序写出。
+
+    Args:
+        window: 同时在处理中的记录数上限（提交请求后等待写出的记录）
+        flush_every: 每写出多少条记录刷新一次输出并保存断点
+        restart: 忽略已有断点，从头开始并清空输出文件
+        cache_dir: corpus_loader 解析缓存目录
+    Returns:
+        int: 本次写出的记录数
+    Raises:
+        FileExistsError: 没有断点而输出文件已有内容（且未指定 restart）
+    """
+    state = None if restart else checkpoint.load()
+    if restart or state is not None:
+        done, offset = state or (0, 0)
+        if not os.path.exists(output_path):
+            done, offset = 0, 0
+        # 截断断点之后（上次中断时未记入断点）的内容，保证续跑不会重复写出
+        with open(output_path, 'ab') as f:
+            f.truncate(offset)
+    elif os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        raise FileExistsError(f"{output_path} 已有内容但没有断点文件 {checkpoint.path}，"
+                              f"如需重新生成请使用 --restart")
+    else:
+        done = 0
+
+    written = 0
+    pending = deque()
+    with open(output_path, 'ab', buffering=1 << 20) as out:
+        def write_next():
+            nonlocal done, written
+            data = finish_record(*pending.popleft())
+            out.write((json.dumps(data, ensure_ascii=False) + ',\n').encode('utf-8'))
+            done += 1
+            written += 1
+            if done % flush_every == 0:
+                out.flush()
+                checkpoint.save(done, out.tell())
+
+        try:
+            records = islice(corpus_loader.iter_records(input_path, cache_dir=cache_dir), done, None)
+            for data in tqdm(records, initial=done, desc='抽取'):
+                pending.append(submit_record(extractor, data))
+                while len(pending) >= window:
+                    write_next()
+            while pending:
+                write_next()
+        finally:
+            # 出错或中断时，已写出的完整记录仍记入断点，下次从这里继续
+            out.flush()
+            checkpoint.save(done, out.tell())
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="调用大模型抽取治疗方法与药品详情")
+    parser.add_argument('--input', type=str, default='./data/medical.json', help='原始医疗数据文件')
+    parser.add_argument('--output', type=str, default='./data/medical_new_2.json', help='输出文件')
+    parser.add_argument('--model', type=str, default='qwen:32b', help='Ollama 模型名')
+    parser.add_argument('--host', type=str, default=None, help='LLM 服务地址，默认使用 Ollama 默认地址')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时发往 LLM 后端的请求数上限')
+    parser.add_argument('--window', type=int, default=64, help='同时在处理中的记录数上限')
+    parser.add_argument('--flush_every', type=int, default=20, help='每写出多少条记录保存一次断点')
+    parser.add_argument('--memo', type=str, default=None, help='记忆文件，默认为 <output>.memo.jsonl')
+    parser.add_argument('--checkpoint', type=str, default=None, help='断点文件，默认为 <output>.checkpoint')
+    parser.add_argument('--restart', action='store_true', help='忽略断点，从头开始并清空输出文件')
+    args = parser.parse_args()
+
+    memo = Memo(args.memo or args.output + '.memo.jsonl')
+    extractor = Extractor(ollama.Client(host=args.host), args.model, memo, args.concurrency)
+    try:
+        count = run(args.input, args.output, extractor, Checkpoint(args.checkpoint or args.output + '.checkpoint'),
+                    window=args.window, flush_every=args.flush_every, restart=args.restart)
+    except FileExistsError as e:
+        sys.exit(str(e))
+    finally:
+        extractor.shutdown()
+        memo.close()
+    print(f"写出 {count} 条记录，LLM 请求统计: {extractor.stats()}，记忆条目: {len(memo)}")
@@ -0,0 +1,96 @@
+import os
+from functools import lru_cache
+
+import ahocorasick
+
+"""
+医疗实体词库模块
+将 data/ent_aug 下 8 类实体库合并为一个 AC 自动机（payload 为 (实体名, 所属类型元组)），
+供规则匹配 (ner_model.rule_find) 与训练数据标注 (ner_data.Build_Ner_data) 共用，
+一次扫描即可得到所有类型的命中，再按"长词优先"一次性消解重叠。
+"""
+
+# 支持的实体类型
+ENTITY_TYPES = ["疾病", "疾病症状", "检查项目", "科目", "食物", "药品商", "治疗方法", "药品"]
+# 实体库所在目录
+LEXICON_DIR = os.path.join('data', 'ent_aug')
+
+
+def read_lexicon(lexicon_dir=LEXICON_DIR):
+    """
+    读取各类型实体库文件。
+
+    Returns:
+        dict: {实体类型: [实体名, ...]}，缺失的类型文件会被跳过
+    """
+    lexicon = {}
+    for type in ENTITY_TYPES:
+        file_path = os.path.join(lexicon_dir, f'{type}.txt')
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding='utf-8') as f:
+            lexicon[type] = f.read().split('\n')
+    return lexicon
+
+
+def build_automaton(lexicon):
+    """
+    构建合并后的 AC 自动机。
+    每行取第一个空格前的部分作为实体名，长度小于 2 的忽略；
+    同名实体出现在多个类型中时，payload 中按 ENTITY_TYPES 顺序记录全部类型。
+    """
+    word_types = {}
+    for type in ENTITY_TYPES:
+        for en in lexicon.get(type, []):
+            en = en.split(' ')[0]
+            if len(en) < 2:
+                continue
+            types = word_types.setdefault(en, [])
+            if type not in types:
+                types.append(type)
+
+    aho = ahocorasick.Automaton()
+    for en, types in word_types.items():
+        aho.add_word(en, (en, tuple(types)))
+    aho.make_automaton()
+    return aho
+
+
+@lru_cache(maxsize=None)
+def get_automaton(lexicon_dir=LEXICON_DIR):
+    """获取（进程内只构建一次的）合并自动机"""
+    return build_automaton(read_lexicon(lexicon_dir))
+
+
+def find_longest(aho, text, type2idx):
+    """
+    在文本中查找实体并消解重叠：长词优先，等长时按 type2idx 中的类型顺序优先，再按出现位置。
+    使用占用位图判断冲突，不再逐字符写字典。
+
+    Args:
+        aho: build_automaton 构建的自动机
+        text: 待匹配文本
+        type2idx: 调用方关心的实体类型及其优先级，不在其中的类型会被忽略
+    Returns:
+        list: [(起始位置, 结束位置, 实体类型, 实体文本), ...]，按被采纳的先后顺序排列
+    """
+    candidates = []
+    for ed, (name, types) in aho.iter(text):
+        ranks = [type2idx[t] for t in types if t in type2idx]
+        if not ranks:
+            continue
+        rank = min(ranks)
+        candidates.append((-len(name), rank, ed, name))
+    candidates.sort()
+
+    idx2type = {idx: type for type, idx in type2idx.items()}
+    occupied = bytearray(len(text))
+    result = []
+    for neg_len, rank, ed, name in candidates:
+        be = ed + neg_len + 1
+        # 候选按长度降序处理，已采纳的区间不短于当前区间，只需检查两个端点
+        if occupied[be] or occupied[ed]:
+            continue
+        occupied[be:ed + 1] = b'\x01' * (ed - be + 1)
+        result.append((be, ed, idx2type[rank], name))
+    return result
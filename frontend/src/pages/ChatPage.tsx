@@ -82,15 +82,24 @@ export default function ChatPage() {
    * 副作用：组件挂载后拉取所有可用模型
    */
   useEffect(() => {
-    fetchModels().then((data) => {
-      setModels(data);
-      // 如果还没有设置模型名，默认选第一个可用的
-      if (data.local.length > 0 && !modelName) {
-        setModelName(data.local[0]);
-      } else if (data.siliconflow.length > 0 && !modelName) {
-        setModelName(data.siliconflow[0]);
-      }
-    });
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    const load = () =>
+      fetchModels().then((data) => {
+        setModels(data);
+        // 服务刚启动时本地模型列表尚未发现完成，稍后重新获取
+        if (data.refreshing && data.cache_age == null) {
+          retry = setTimeout(load, 1000);
+          return;
+        }
+        // 如果还没有设置模型名，默认选第一个可用的
+        if (data.local.length > 0 && !modelName) {
+          setModelName(data.local[0]);
+        } else if (data.siliconflow.length > 0 && !modelName) {
+          setModelName(data.siliconflow[0]);
+        }
+      });
+    load();
+    return () => clearTimeout(retry);
   }, [modelName]);
 
   /**
@@ -178,6 +187,23 @@ export default function ChatPage() {
         neo4j_password: auth?.role === "admin" ? neo4jPassword || undefined : undefined
       },
       {
+        // 收到阶段事件：实体、意图、检索到的知识各自就绪时立即展示，无需等待完整元数据
+        onStage: (stage) => {
+          updateAssistant((msg) => {
+            if (stage.type === "entities") {
+              return { ...msg, ent: JSON.stringify(stage.entities) };
+            }
+            if (stage.type === "intent") {
+              return { ...msg, intent: stage.intent };
+            }
+            return {
+              ...msg,
+              ent: JSON.stringify(stage.entities),
+              intent: stage.intent,
+              knowledge: stage.knowledge
+            };
+          });
+        },
         // 收到元数据（实体、意图等）：更新助手消息的扩展属性
         onMeta: (meta) => {
           updateAssistant((msg) => ({
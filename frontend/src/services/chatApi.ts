@@ -12,6 +12,7 @@ export interface ChatStreamPayload {
   model_name: string;                           // 模型名称
   api_key?: string;                             // 硅基流动 API Key
   neo4j_password?: string;                      // Neo4j 数据库密码
+  trace?: boolean;                              // 是否在 done 事件中返回各阶段耗时明细
 }
 
 // 助手消息关联的元数据接口
@@ -22,8 +23,21 @@ export interface ChatMeta {
   knowledge: string;                            // 检索到的知识片段
 }
 
+// 阶段事件：实体识别、意图识别、知识检索各自完成时由后端立即发送，早于完整的 meta
+export type ChatStage =
+  | { type: "entities"; entities: Record<string, string>; elapsed_ms: number }
+  | { type: "intent"; intent: string; elapsed_ms: number }
+  | {
+      type: "knowledge";
+      intent: string;
+      entities: Record<string, string>;
+      knowledge: string;
+      elapsed_ms: number;
+    };
+
 // 流式处理的回调函数接口
 export interface StreamCallbacks {
+  onStage?: (stage: ChatStage) => void;         // 收到阶段事件时的回调（用于渐进展示）
   onMeta: (meta: ChatMeta) => void;             // 收到元数据时的回调
   onDelta: (delta: string) => void;             // 收到新的文本块时的回调
   onError: (message: string) => void;           // 发生错误时的回调
@@ -73,7 +87,9 @@ export async function streamChat(payload: ChatStreamPayload, callbacks: StreamCa
           try {
             const data = JSON.parse(line);
             // 根据数据包类型调用不同的回调函数
-            if (data.type === "meta") {
+            if (data.type === "entities" || data.type === "intent" || data.type === "knowledge") {
+              callbacks.onStage?.(data as ChatStage);
+            } else if (data.type === "meta") {
               callbacks.onMeta({
                 intent: data.intent ?? "",
                 entities: data.entities ?? {},
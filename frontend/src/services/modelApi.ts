@@ -3,6 +3,10 @@ const API_BASE = import.meta.env.VITE_API_BASE ?? "";
 export interface ModelListResponse {
   local: string[];
   siliconflow: string[];
+  cache_age?: number | null;   // 本地模型列表距上次刷新的秒数
+  source?: string | null;      // 本地模型列表来源：http / cli
+  error?: string | null;       // 最近一次刷新失败的原因
+  refreshing?: boolean;        // 后台正在刷新本地模型列表
 }
 
 export async function fetchModels(): Promise<ModelListResponse> {
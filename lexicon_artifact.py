@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+import sklearn
+from scipy.sparse import csr_matrix
+
+import entity_lexicon
+import ner_model as zwk
+
+"""
+词库预编译产物模块
+将合并后的 AC 自动机、各类型已拟合的 TfidfVectorizer 及其稀疏矩阵序列化到磁盘，
+NER 服务启动时直接加载（矩阵以内存映射方式打开），只有当实体库文件内容变化时才重新构建。
+
+构建命令（需在项目根目录运行）：
+    python lexicon_artifact.py
+"""
+
+# 产物格式版本，序列化结构变化时递增
+ARTIFACT_VERSION = 1
+# 产物默认存放目录
+ARTIFACT_DIR = os.path.join('tmp_data', 'lexicon_artifact')
+MANIFEST_NAME = 'manifest.json'
+
+
+def lexicon_hash(lexicon_dir=entity_lexicon.LEXICON_DIR):
+    """计算实体库目录下所有词库文件（文件名 + 内容）的 SHA-256"""
+    sha = hashlib.sha256()
+    for name in sorted(os.listdir(lexicon_dir)):
+        if '.py' in name:
+            continue
+        sha.update(name.encode('utf-8'))
+        with open(os.path.join(lexicon_dir, name), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def read_manifest(artifact_dir=ARTIFACT_DIR):
+    """读取产物清单，不存在或损坏时返回 None"""
+    try:
+        with open(os.path.join(artifact_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_artifact(aho, tfidf_index, content_hash, artifact_dir=ARTIFACT_DIR):
+    """
+    写出预编译产物。清单文件最后写入，只有清单存在时产物才被视为完整。
+    """
+    if os.path.exists(artifact_dir):
+        shutil.rmtree(artifact_dir)
+    os.makedirs(artifact_dir)
+
+    with open(os.path.join(artifact_dir, 'automaton.pkl'), 'wb') as f:
+        pickle.dump(aho, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    types = {}
+    for i, (ty, (en_name, tfidf_model, embs)) in enumerate(tfidf_index.items()):
+        prefix = f'tfidf_{i}'
+        with open(os.path.join(artifact_dir, f'{prefix}.pkl'), 'wb') as f:
+            pickle.dump((en_name, tfidf_model), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # CSR 的三个数组分别存为 .npy，加载时可直接内存映射
+        np.save(os.path.join(artifact_dir, f'{prefix}_data.npy'), embs.data)
+        np.save(os.path.join(artifact_dir, f'{prefix}_indices.npy'), embs.indices)
+        np.save(os.path.join(artifact_dir, f'{prefix}_indptr.npy'), embs.indptr)
+        types[ty] = {'prefix': prefix, 'shape': list(embs.shape)}
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'lexicon_hash': content_hash,
+        'sklearn_version': sklearn.__version__,
+        'types': types,
+    }
+    with open(os.path.join(artifact_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def load_artifact(content_hash, artifact_dir=ARTIFACT_DIR):
+    """
+    加载预编译产物。版本、词库哈希或 sklearn 版本不一致时返回 None。
+
+    Returns:
+        tuple | None: (AC 自动机, TF-IDF 索引)
+    """
+    manifest = read_manifest(artifact_dir)
+    if (manifest is None or manifest.get('version') != ARTIFACT_VERSION
+            or manifest.get('lexicon_hash') != content_hash
+            or manifest.get('sklearn_version') != sklearn.__version__):
+        return None
+
+    with open(os.path.join(artifact_dir, 'automaton.pkl'), 'rb') as f:
+        aho = pickle.load(f)
+
+    tfidf_index = {}
+    for ty, info in manifest['types'].items():
+        prefix = os.path.join(artifact_dir, info['prefix'])
+        with open(f'{prefix}.pkl', 'rb') as f:
+            en_name, tfidf_model = pickle.load(f)
+        data = np.load(f'{prefix}_data.npy', mmap_mode='r')
+        indices = np.load(f'{prefix}_indices.npy', mmap_mode='r')
+        indptr = np.load(f'{prefix}_indptr.npy', mmap_mode='r')
+        embs = csr_matrix((data, indices, indptr), shape=tuple(info['shape']), copy=False)
+        tfidf_index[ty] = (en_name, tfidf_model, embs)
+    return aho, tfidf_index
+
+
+def build(lexicon_dir=entity_lexicon.LEXICON_DIR):
+    """从词库文本重新构建自动机与 TF-IDF 索引"""
+    aho = entity_lexicon.build_automaton(entity_lexicon.read_lexicon(lexicon_dir))
+    tfidf_index = zwk.build_tfidf_index(lexicon_dir)
+    return aho, tfidf_index
+
+
+def load_or_build(lexicon_dir=entity_lexicon.LEXICON_DIR, artifact_dir=ARTIFACT_DIR):
+    """
+    优先加载预编译产物；产物缺失或词库内容已变化时重新构建并写回。
+
+    Returns:
+        tuple: (AC 自动机, TF-IDF 索引)
+    """
+    content_hash = lexicon_hash(lexicon_dir)
+    loaded = load_artifact(content_hash, artifact_dir)
+    if loaded is not None:
+        return loaded
+    aho, tfidf_index = build(lexicon_dir)
+    try:
+        save_artifact(aho, tfidf_index, content_hash, artifact_dir)
+    except OSError as exc:
+        # 产物目录不可写时仍然使用内存中的构建结果
+        print(f"写入词库预编译产物失败: {exc}")
+    return aho, tfidf_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预编译实体词库（AC 自动机 + TF-IDF 索引）")
+    parser.add_argument('--output', type=str, default=ARTIFACT_DIR, help='产物输出目录')
+    args = parser.parse_args()
+
+    aho, tfidf_index = build()
+    save_artifact(aho, tfidf_index, lexicon_hash(), args.output)
+    manifest = read_manifest(args.output)
+    print(f"词库预编译完成: {args.output} (version={manifest['version']}, hash={manifest['lexicon_hash'][:12]})")
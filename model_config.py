@@ -6,32 +6,319 @@
 它提供了统一的接口来获取可用模型列表以及进行同步或流式的模型调用。
 """
 
+import asyncio
+import inspect
+import json
 import subprocess
+import threading
+import time
 import requests
 import os
+import weakref
+
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 本地 Ollama 服务地址。显式指定 127.0.0.1，避免在 Windows 上因 0.0.0.0 导致的网络连接错误 (WinError 10049)
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+# 硅基流动对话接口
+SILICONFLOW_URL = "https://api.siliconflow.cn/v1/chat/completions"
+
+# 连接池与重试配置
+# 每个后端的最大连接数，即同时进行的生成数上限（httpx 默认只有 100）
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "1000"))
+# 空闲时保留的 keep-alive 连接数
+LLM_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_KEEPALIVE_CONNECTIONS", "100"))
+# 建立连接的超时时间与读取超时时间（秒）；流式生成时读取超时为相邻两个增量之间的最长间隔
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+# 建立连接失败时的重试次数与退避基数（秒），第 n 次重试前等待 backoff * 2^(n-1) 秒
+LLM_CONNECT_RETRIES = int(os.environ.get("LLM_CONNECT_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", "0.5"))
+
+# 建立连接阶段的错误：请求尚未发出，重试是安全的
+_CONNECT_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def _httpx_pool_stats(client):
+    """httpx 客户端连接池中的连接数与空闲连接数（依赖 httpcore 内部结构，取不到时返回 None）"""
+    try:
+        connections = list(client._transport._pool.connections)
+        return {"connections": len(connections), "idle": sum(1 for c in connections if c.is_idle())}
+    except AttributeError:
+        return None
+
+
+class LLMClientRegistry:
+    """
+    进程级 LLM 客户端注册表。
+    每个后端只创建一次客户端并复用其 keep-alive 连接池，避免每次调用都重新建立 TCP（及 TLS）连接：
+    - Ollama：一个同步 ollama.Client（线程安全），以及每个事件循环一个 ollama.AsyncClient；
+    - 硅基流动：一个 requests.Session，以及每个事件循环一个 httpx.AsyncClient。
+    异步客户端的连接池只能在创建它的事件循环中使用，因此按事件循环分别创建。
+    建立连接失败时按指数退避重试，并统计各后端的请求数、错误数、重试次数与进行中的流式生成数。
+    """
+
+    BACKENDS = ("ollama", "siliconflow")
+
+    def __init__(
+        self,
+        ollama_host=OLLAMA_BASE_URL,
+        max_connections=LLM_MAX_CONNECTIONS,
+        keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        connect_timeout=LLM_CONNECT_TIMEOUT,
+        read_timeout=LLM_READ_TIMEOUT,
+        connect_retries=LLM_CONNECT_RETRIES,
+        retry_backoff=LLM_RETRY_BACKOFF,
+    ):
+        self.ollama_host = ollama_host
+        self.max_connections = max_connections
+        self.keepalive_connections = keepalive_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.connect_retries = connect_retries
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._ollama = None
+        self._session = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stats = {backend: {"requests": 0, "errors": 0, "connect_retries": 0, "active_streams": 0}
+                       for backend in self.BACKENDS}
+
+    def _count(self, backend, key, delta=1):
+        with self._lock:
+            self._stats[backend][key] += delta
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.keepalive_connections)
+
+    def _timeout(self):
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    # ========== 客户端 ==========
+
+    def ollama(self):
+        """同步 Ollama 客户端"""
+        with self._lock:
+            if self._ollama is None:
+                from ollama import Client
+                self._ollama = Client(host=self.ollama_host, timeout=self._timeout(), limits=self._limits())
+            return self._ollama
+
+    def session(self):
+        """硅基流动使用的 requests.Session，建立连接失败时由 urllib3 按退避重试"""
+        with self._lock:
+            if self._session is None:
+                registry = self
+
+                class _CountingRetry(Retry):
+                    def increment(self, *args, **kwargs):
+                        # 重试次数用尽时 super().increment 会直接抛出异常，不计入重试
+                        retry = super().increment(*args, **kwargs)
+                        registry._count("siliconflow", "connect_retries")
+                        return retry
+
+                retry = _CountingRetry(total=self.connect_retries, connect=self.connect_retries, read=0,
+                                       status=0, other=0, backoff_factor=self.retry_backoff, raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def _loop_clients(self):
+        return self._async_clients.setdefault(asyncio.get_running_loop(), {})
+
+    def async_ollama(self):
+        """当前事件循环中的异步 Ollama 客户端"""
+        clients = self._loop_clients()
+        if "ollama" not in clients:
+            from ollama import AsyncClient
+            clients["ollama"] = AsyncClient(host=self.ollama_host, timeout=self._timeout(), limits=self._limits())
+        return clients["ollama"]
+
+    def async_http(self):
+        """当前事件循环中的 httpx.AsyncClient（用于硅基流动）"""
+        clients = self._loop_clients()
+        if "http" not in clients:
+            clients["http"] = httpx.AsyncClient(timeout=self._timeout(), limits=self._limits())
+        return clients["http"]
+
+    # ========== 带重试的调用 ==========
+
+    def _backoff(self, attempt):
+        return self.retry_backoff * (2 ** attempt)
+
+    def call(self, backend, fn):
+        """同步调用 fn()，建立连接失败时按退避重试"""
+        self._count(backend, "requests")
+        for attempt in range(self.connect_retries + 1):
+            try:
+                return fn()
+            except _CONNECT_ERRORS:
+                if attempt == self.connect_retries:
+                    self._count(backend, "errors")
+                    raise
+                self._count(backend, "connect_retries")
+                time.sleep(self._backoff(attempt))
+            except Exception:
+                self._count(backend, "errors")
+                raise
+
+    async def acall(self, backend, make):
+        """异步调用 await make()，建立连接失败时按退避重试"""
+        self._count(backend, "requests")
+        for attempt in range(self.connect_retries + 1):
+            try:
+                return await make()
+            except _CONNECT_ERRORS:
+                if attempt == self.connect_retries:
+                    self._count(backend, "errors")
+                    raise
+                self._count(backend, "connect_retries")
+                await asyncio.sleep(self._backoff(attempt))
+            except Exception:
+                self._count(backend, "errors")
+                raise
+
+    def stream(self, backend, make):
+        """
+        同步流式调用：make() 返回增量迭代器。流式请求在取第一个增量时才建立连接，
+        因此对第一个增量做连接重试；之后的错误直接抛出。
+        """
+        iterator = self.call(backend, lambda: self._first(make()))
+        self._count(backend, "active_streams")
+        try:
+            yield from iterator
+        except Exception:
+            self._count(backend, "errors")
+            raise
+        finally:
+            self._count(backend, "active_streams", -1)
+
+    @staticmethod
+    def _first(iterator):
+        """取出第一个增量（触发建立连接），返回包含它的完整迭代器"""
+        iterator = iter(iterator)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            return iter(())
+
+        def chained():
+            yield first
+            yield from iterator
+        return chained()
+
+    async def astream(self, backend, make):
+        """stream 的异步版本：make() 返回异步迭代器，或返回异步迭代器的协程"""
+        async def first_item():
+            iterator = make()
+            if inspect.isawaitable(iterator):
+                iterator = await iterator
+            iterator = iterator.__aiter__()
+            try:
+                return iterator, [await iterator.__anext__()]
+            except StopAsyncIteration:
+                return iterator, []
+
+        iterator, head = await self.acall(backend, first_item)
+        self._count(backend, "active_streams")
+        try:
+            for item in head:
+                yield item
+            async for item in iterator:
+                yield item
+        except Exception:
+            self._count(backend, "errors")
+            raise
+        finally:
+            self._count(backend, "active_streams", -1)
+
+    # ========== 监控 ==========
+
+    def stats(self):
+        """各后端的调用统计与连接池状态"""
+        with self._lock:
+            backends = {backend: dict(stats) for backend, stats in self._stats.items()}
+            ollama_client, session = self._ollama, self._session
+            loop_clients = list(self._async_clients.values())
+        backends["ollama"]["sync_pool"] = _httpx_pool_stats(ollama_client._client) if ollama_client else None
+        pools = []
+        if session is not None:
+            adapter = session.get_adapter(SILICONFLOW_URL)
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    pools.append({"host": pool.host, "connections_created": pool.num_connections,
+                                  "requests": pool.num_requests, "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0})
+        backends["siliconflow"]["sync_pool"] = pools
+        backends["ollama"]["async_pools"] = [
+            _httpx_pool_stats(clients["ollama"]._client) for clients in loop_clients if "ollama" in clients]
+        backends["siliconflow"]["async_pools"] = [
+            _httpx_pool_stats(clients["http"]) for clients in loop_clients if "http" in clients]
+        return {
+            "config": {
+                "ollama_host": self.ollama_host,
+                "max_connections": self.max_connections,
+                "keepalive_connections": self.keepalive_connections,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "connect_retries": self.connect_retries,
+                "retry_backoff": self.retry_backoff,
+            },
+            "backends": backends,
+        }
+
+
+# 进程级客户端注册表，所有模型调用共享
+llm_clients = LLMClientRegistry()
+
+def _ollama_models_http(timeout):
+    """通过 Ollama 的 HTTP 接口 /api/tags 获取已安装的模型名称"""
+    response = httpx.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=timeout)
+    response.raise_for_status()
+    return [model['name'] for model in response.json().get('models', [])]
+
+def _ollama_models_cli(timeout):
+    """执行 'ollama list' 命令并解析输出获取模型名称"""
+    result = subprocess.run(['ollama', 'list'], capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ollama list 退出码 {result.returncode}")
+    lines = result.stdout.strip().split('\n')[1:]  # 跳过第一行标题 (NAME, ID, SIZE, MODIFIED)
+    models = []
+    for line in lines:
+        if line.strip():
+            parts = line.split()
+            if parts:
+                models.append(parts[0])
+    return models
+
+def discover_ollama_models(timeout=5):
+    """
+    获取本地 Ollama 已安装的模型列表。
+    优先使用 HTTP 接口（无需启动子进程，通常只需几毫秒），失败时回退到 'ollama list' 命令。
+
+    Returns:
+        tuple: (模型名称列表, 来源 'http' 或 'cli')；两种方式都失败时抛出最后一个异常。
+    """
+    try:
+        return _ollama_models_http(timeout), 'http'
+    except Exception:
+        return _ollama_models_cli(timeout), 'cli'
 
 def get_ollama_models():
     """
     获取本地 Ollama 服务中已安装的模型列表。
-    通过执行 'ollama list' 命令并解析输出来获取模型名称。
     
     Returns:
         list: 包含本地可用模型名称的列表，如果获取失败则返回空列表。
     """
     try:
-        # 执行 ollama list 命令，设置 5 秒超时
-        result = subprocess.run(['ollama', 'list'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')[1:]  # 跳过第一行标题 (NAME, ID, SIZE, MODIFIED)
-            models = []
-            for line in lines:
-                if line.strip():
-                    parts = line.split()
-                    if parts:
-                        model_name = parts[0]
-                        models.append(model_name)
-            return models
-        return []
+        return discover_ollama_models()[0]
     except Exception as e:
         print(f"获取 Ollama 模型失败: {e}")
         return []
@@ -49,15 +336,29 @@ def call_ollama(model, prompt, stream=False):
         str/generator: 如果 stream 为 False，返回生成的完整文本；
                       如果 stream 为 True，返回一个生成器对象。
     """
-    from ollama import Client
-    # 显式指定连接地址为 127.0.0.1，避免在 Windows 上因 0.0.0.0 导致的网络连接错误 (WinError 10049)
-    client = Client(host='http://127.0.0.1:11434')
+    client = llm_clients.ollama()
     if stream:
         # 使用聊天接口进行流式响应
-        return client.chat(model=model, messages=[{'role': 'user', 'content': prompt}], stream=True)
+        return llm_clients.stream(
+            "ollama", lambda: client.chat(model=model, messages=[{'role': 'user', 'content': prompt}], stream=True))
     else:
         # 使用生成接口获取完整结果
-        return client.generate(model=model, prompt=prompt)['response']
+        return llm_clients.call("ollama", lambda: client.generate(model=model, prompt=prompt))['response']
+
+def _siliconflow_payload(model, prompt, api_key, stream):
+    """构造硅基流动请求的请求头与请求体"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": stream,
+        "max_tokens": 2048,
+        "temperature": 0.7
+    }
+    return headers, data
 
 def call_siliconflow(model, prompt, api_key, stream=False):
     """
@@ -77,36 +378,64 @@ def call_siliconflow(model, prompt, api_key, stream=False):
     Raises:
         Exception: 当 API 调用返回错误或网络异常时抛出。
     """
-    url = "https://api.siliconflow.cn/v1/chat/completions"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": stream,
-        "max_tokens": 2048,
-        "temperature": 0.7
-    }
-    
+    url = SILICONFLOW_URL
+    headers, data = _siliconflow_payload(model, prompt, api_key, stream)
+
+    session = llm_clients.session()
+    timeout = (llm_clients.connect_timeout, llm_clients.read_timeout)
+
+    def post():
+        response = session.post(url, headers=headers, json=data, stream=stream, timeout=timeout)
+        response.raise_for_status()
+        return response
+
     try:
         if stream:
             # 流式请求
-            response = requests.post(url, headers=headers, json=data, stream=True, timeout=60)
-            response.raise_for_status()
-            return response
+            return llm_clients.call("siliconflow", post)
         else:
             # 非流式请求
-            response = requests.post(url, headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+            result = llm_clients.call("siliconflow", post).json()
             return result['choices'][0]['message']['content']
     except Exception as e:
         raise Exception(f"硅基流动 API 调用失败: {str(e)}")
 
+def parse_siliconflow_line(line):
+    """
+    解析硅基流动 SSE 流中的一行。
+    Returns:
+        None 表示流结束；空字符串表示该行没有增量内容；否则为增量文本。
+    """
+    if not line.startswith("data: "):
+        return ""
+    data_str = line[6:]
+    if data_str.strip() == "[DONE]":
+        return None
+    try:
+        chunk = json.loads(data_str)
+    except json.JSONDecodeError:
+        return ""
+    if chunk.get("choices"):
+        return chunk["choices"][0].get("delta", {}).get("content", "") or ""
+    return ""
+
+def stream_siliconflow(model, prompt, api_key):
+    """同步流式调用硅基流动 API，逐段产出增量文本"""
+    def deltas():
+        with call_siliconflow(model, prompt, api_key, stream=True) as response:
+            for line in response.iter_lines():
+                delta = parse_siliconflow_line(line.decode("utf-8")) if line else ""
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+    # 建立连接的重试已在 call_siliconflow 中完成，这里只统计进行中的流
+    llm_clients._count("siliconflow", "active_streams")
+    try:
+        yield from deltas()
+    finally:
+        llm_clients._count("siliconflow", "active_streams", -1)
+
 # 硅基流动平台当前支持的部分热门模型列表
 SILICONFLOW_MODELS = [
     "deepseek-ai/DeepSeek-V3",
@@ -155,3 +484,63 @@ def call_model(model_name, prompt, model_type='local', api_key=None, stream=Fals
         return call_siliconflow(model_name, prompt, api_key, stream)
     else:
         raise ValueError(f"不支持的模型类型: {model_type}")
+
+# ========== 异步调用（供异步问答流程使用，不占用线程） ==========
+
+async def acall_ollama(model, prompt):
+    """call_ollama(stream=False) 的异步版本，返回生成的完整文本"""
+    client = llm_clients.async_ollama()
+    return (await llm_clients.acall("ollama", lambda: client.generate(model=model, prompt=prompt)))['response']
+
+async def astream_ollama(model, prompt):
+    """异步流式调用本地 Ollama 聊天接口，逐段产出增量文本"""
+    client = llm_clients.async_ollama()
+    chunks = llm_clients.astream(
+        "ollama", lambda: client.chat(model=model, messages=[{'role': 'user', 'content': prompt}], stream=True))
+    async for chunk in chunks:
+        yield chunk['message']['content']
+
+async def acall_siliconflow(model, prompt, api_key):
+    """call_siliconflow(stream=False) 的异步版本"""
+    headers, data = _siliconflow_payload(model, prompt, api_key, False)
+    client = llm_clients.async_http()
+
+    async def post():
+        response = await client.post(SILICONFLOW_URL, headers=headers, json=data)
+        response.raise_for_status()
+        return response
+
+    try:
+        response = await llm_clients.acall("siliconflow", post)
+        return response.json()['choices'][0]['message']['content']
+    except Exception as e:
+        raise Exception(f"硅基流动 API 调用失败: {str(e)}")
+
+async def astream_siliconflow(model, prompt, api_key):
+    """异步流式调用硅基流动 API，解析 SSE 数据行，逐段产出增量文本"""
+    headers, data = _siliconflow_payload(model, prompt, api_key, True)
+    client = llm_clients.async_http()
+
+    async def lines():
+        async with client.stream("POST", SILICONFLOW_URL, headers=headers, json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                yield line
+
+    async for line in llm_clients.astream("siliconflow", lines):
+        delta = parse_siliconflow_line(line)
+        if delta is None:
+            break
+        if delta:
+            yield delta
+
+async def acall_model(model_name, prompt, model_type='local', api_key=None):
+    """call_model(stream=False) 的异步版本"""
+    if model_type == 'local':
+        return await acall_ollama(model_name, prompt)
+    elif model_type == 'siliconflow':
+        if not api_key:
+            raise ValueError("使用硅基流动 API 需要提供 API Key")
+        return await acall_siliconflow(model_name, prompt, api_key)
+    else:
+        raise ValueError(f"不支持的模型类型: {model_type}")
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import pickle
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from tqdm import tqdm
+from transformers import BertTokenizer
+
+import ner_model as zwk
+
+"""
+NER 训练语料预处理缓存模块
+一次性将 ner_data_aug.txt 解析并转换为扁平的 NumPy 数组（token id、标签 id、偏移索引），
+训练时以 np.memmap 方式打开，DataLoader 的多个 worker 共享同一份页缓存，无需复制或重复分词。
+
+构建命令（需在项目根目录运行）：
+    python ner_corpus.py --data data/ner_data_aug.txt
+同时离线预生成 K 轮增强语料：
+    python ner_corpus.py --data data/ner_data_aug.txt --augment_epochs 4
+"""
+
+# 缓存格式版本，存储结构变化时递增
+CORPUS_VERSION = 1
+# 缓存默认存放目录
+CORPUS_DIR = os.path.join('tmp_data', 'ner_corpus')
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def build_corpus_cache(path, tokenizer, tag2idx, cache_dir=CORPUS_DIR):
+    """
+    解析标注数据并写出缓存：
+        tokens.npy   int32，所有句子逐字 token id 首尾相接（不含 [CLS]/[SEP]）
+        tags.npy     int16，与 tokens 一一对应的标签 id
+        offsets.npy  int64，第 i 句位于 [offsets[i], offsets[i+1])
+        meta.json    版本、源文件指纹、tag2idx 及特殊 token id
+    """
+    all_text, all_tag = zwk.get_data(path)
+    tokens, tags, offsets = array('i'), array('h'), array('q', [0])
+    for text, tag in tqdm(zip(all_text, all_tag), total=len(all_text), desc='预处理 NER 语料'):
+        # 逐字转换为 token id，与 Nerdataset 中 tokenizer.encode(字列表) 的结果一致
+        tokens.extend(tokenizer.convert_tokens_to_ids(text))
+        tags.extend(tag2idx[t] for t in tag)
+        offsets.append(len(tokens))
+
+    meta = {
+        'version': CORPUS_VERSION,
+        'stamp': _source_stamp(path),
+        'tag2idx': tag2idx,
+        'cls_id': tokenizer.cls_token_id,
+        'sep_id': tokenizer.sep_token_id,
+    }
+    return _write_corpus(cache_dir, tokens, tags, offsets, meta)
+
+
+def _write_corpus(cache_dir, tokens, tags, offsets, meta):
+    """将扁平数组与元信息写入缓存目录，meta.json 最后写入，作为缓存完整的标志"""
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, 'tokens.npy'), np.frombuffer(tokens, dtype=np.int32))
+    np.save(os.path.join(cache_dir, 'tags.npy'), np.frombuffer(tags, dtype=np.int16))
+    np.save(os.path.join(cache_dir, 'offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
+    meta = dict(meta, num_samples=len(offsets) - 1)
+    with open(os.path.join(cache_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def read_corpus_meta(cache_dir=CORPUS_DIR):
+    """读取缓存元信息，不存在或损坏时返回 None"""
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def load_or_build_corpus_cache(path, tokenizer, tag2idx, cache_dir=CORPUS_DIR):
+    """缓存缺失、版本不符或源文件已变化时重新构建，返回缓存目录"""
+    meta = read_corpus_meta(cache_dir)
+    if (meta is None or meta.get('version') != CORPUS_VERSION
+            or meta.get('stamp') != _source_stamp(path) or meta.get('tag2idx') != tag2idx):
+        build_corpus_cache(path, tokenizer, tag2idx, cache_dir)
+    return cache_dir
+
+
+class MemmapNerDataset(Dataset):
+    """
+    基于内存映射缓存的 NER Dataset，接口与 Nerdataset 保持一致（返回 text_idx, label_idx, x_len）。
+    数据增强时沿用 Entity_Extend：未改动的字直接复用缓存中的 token id，
+    只有增强引入的新字符（实体替换/拼接的片段）才需要经过 tokenizer 转换。
+    """
+    def __init__(self, cache_dir, max_len, tokenizer=None, is_dev=False, enhance_data=False,
+                 dynamic_padding=False, entity_extend=None):
+        meta = read_corpus_meta(cache_dir)
+        if meta is None:
+            raise FileNotFoundError(f"未找到 NER 语料缓存: {cache_dir}")
+        if enhance_data and tokenizer is None:
+            raise ValueError("开启数据增强时需要提供 tokenizer")
+        self.tokens = np.load(os.path.join(cache_dir, 'tokens.npy'), mmap_mode='r')
+        self.tags = np.load(os.path.join(cache_dir, 'tags.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(cache_dir, 'offsets.npy'), mmap_mode='r')
+        self.tag2idx = meta['tag2idx']
+        self.idx2tag = list(self.tag2idx)
+        self.cls_id = meta['cls_id']
+        self.sep_id = meta['sep_id']
+        self.tokenizer = tokenizer
+        self.max_len = max_len
+        self.is_dev = is_dev
+        self.enhance_data = enhance_data
+        self.dynamic_padding = dynamic_padding
+        self.entity_extend = entity_extend if entity_extend is not None else (
+            zwk.Entity_Extend() if enhance_data else None)
+
+    def _augment(self, ids, tag_ids):
+        label = [self.idx2tag[t] for t in tag_ids]
+        ents = zwk.find_entities(label)
+        ids, label = self.entity_extend.entities_extend(ids, label, ents)
+        # 增强后的序列中，原有位置仍是 int 型 token id，新引入的字符为 str
+        new_chars = [t for t in ids if isinstance(t, str)]
+        if new_chars:
+            new_ids = iter(self.tokenizer.convert_tokens_to_ids(new_chars))
+            ids = [next(new_ids) if isinstance(t, str) else t for t in ids]
+        return ids, [self.tag2idx[t] for t in label]
+
+    def __getitem__(self, x):
+        start, end = int(self.offsets[x]), int(self.offsets[x + 1])
+        ids = self.tokens[start:end].tolist()
+        tag_ids = self.tags[start:end].tolist()
+        if self.is_dev:
+            # 验证集不进行数据增强
+            max_len = min(len(ids) + 2, 500)
+        else:
+            # 训练集按概率进行增强
+            if self.enhance_data and self.entity_extend.rng.random() > 0.5:
+                ids, tag_ids = self._augment(ids, tag_ids)
+            max_len = self.max_len
+
+        ids, tag_ids = ids[:max_len - 2], tag_ids[:max_len - 2]
+        x_len = len(ids)
+        pad = self.tag2idx['<PAD>']
+        text_idx = [self.cls_id] + ids + [self.sep_id]
+        label_idx = [pad] + tag_ids + [pad]
+        if not self.dynamic_padding:
+            text_idx += [0] * (max_len - len(text_idx))
+            label_idx += [pad] * (max_len - len(label_idx))
+        return torch.tensor(text_idx), torch.tensor(label_idx), x_len
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        """每个样本（含 [CLS]/[SEP]）补齐前的长度，供 LengthBucketSampler 分桶使用"""
+        max_len = 500 if self.is_dev else self.max_len
+        return (np.minimum(np.diff(self.offsets), max_len - 2) + 2).tolist()
+
+
+def _augment_epoch(cache_dir, out_dir, tokenizer_path, seed):
+    """子进程任务：对整份缓存语料做一轮增强，结果按缓存格式写入 out_dir"""
+    tokenizer = BertTokenizer.from_pretrained(tokenizer_path)
+    dataset = MemmapNerDataset(cache_dir, max_len=0, tokenizer=tokenizer, enhance_data=True,
+                               entity_extend=zwk.Entity_Extend(seed))
+    rng = dataset.entity_extend.rng
+    tokens, tags, offsets = array('i'), array('h'), array('q', [0])
+    for x in range(len(dataset)):
+        start, end = int(dataset.offsets[x]), int(dataset.offsets[x + 1])
+        ids = dataset.tokens[start:end].tolist()
+        tag_ids = dataset.tags[start:end].tolist()
+        # 与在线增强保持相同的触发概率
+        if rng.random() > 0.5:
+            ids, tag_ids = dataset._augment(ids, tag_ids)
+        tokens.extend(ids)
+        tags.extend(tag_ids)
+        offsets.append(len(tokens))
+
+    meta = read_corpus_meta(cache_dir)
+    meta.update(augmented=True, seed=seed)
+    return _write_corpus(out_dir, tokens, tags, offsets, meta)
+
+
+def pregenerate_augmented_epochs(cache_dir, out_dir, num_epochs, tokenizer_path, num_workers=None, seed=0):
+    """
+    离线预生成 num_epochs 轮增强后的语料，每轮写入 out_dir/epoch_{e}/（格式与语料缓存相同）。
+    各轮在独立进程中并行生成，种子为 seed + e，结果可复现；训练时按轮次直接流式读取，
+    __getitem__ 中不再进行任何增强计算。
+    """
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(_augment_epoch, cache_dir, os.path.join(out_dir, f'epoch_{e}'), tokenizer_path, seed + e)
+            for e in range(num_epochs)
+        ]
+        return [future.result() for future in futures]
+
+
+def open_augmented_epoch(out_dir, epoch, max_len, dynamic_padding=False):
+    """打开第 epoch 轮训练使用的预生成语料，轮次超过预生成数量时循环复用"""
+    num_epochs = len([d for d in os.listdir(out_dir) if d.startswith('epoch_')]) if os.path.isdir(out_dir) else 0
+    if num_epochs == 0:
+        raise FileNotFoundError(f"未找到预生成的增强语料: {out_dir}/epoch_*，"
+                                f"请先运行 python ner_corpus.py --augment_epochs N --augment_output {out_dir}")
+    epoch_dir = os.path.join(out_dir, f'epoch_{epoch % num_epochs}')
+    return MemmapNerDataset(epoch_dir, max_len, dynamic_padding=dynamic_padding)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预处理 NER 训练语料为内存映射缓存")
+    parser.add_argument('--data', type=str, default=os.path.join('data', 'ner_data_aug.txt'), help='标注数据路径')
+    parser.add_argument('--output', type=str, default=CORPUS_DIR, help='缓存输出目录')
+    parser.add_argument('--model', type=str, default=os.path.join('model', 'chinese-roberta-wwm-ext'), help='分词器路径')
+    parser.add_argument('--augment_epochs', type=int, default=0, help='预生成的增强轮数，0 表示不生成')
+    parser.add_argument('--augment_output', type=str, default=os.path.join('tmp_data', 'ner_corpus_aug'), help='增强语料输出目录')
+    parser.add_argument('--workers', type=int, default=None, help='并行生成增强语料的进程数')
+    parser.add_argument('--seed', type=int, default=0, help='增强随机种子')
+    args = parser.parse_args()
+
+    with open(os.path.join('tmp_data', 'tag2idx.npy'), 'rb') as f:
+        tag2idx = pickle.load(f)
+    tokenizer = BertTokenizer.from_pretrained(args.model)
+    meta = build_corpus_cache(args.data, tokenizer, tag2idx, args.output)
+    print(f"NER 语料缓存完成: {args.output}，共 {meta['num_samples']} 条样本")
+
+    if args.augment_epochs > 0:
+        pregenerate_augmented_epochs(args.output, args.augment_output, args.augment_epochs,
+                                     args.model, args.workers, args.seed)
+        print(f"增强语料预生成完成: {args.augment_output}，共 {args.augment_epochs} 轮")
@@ -1,10 +1,12 @@
 import os
 import random
-import ahocorasick
 import re
 from tqdm import tqdm
 import sys
 
+import corpus_loader
+import entity_lexicon
+
 """
 NER 数据构造模块
 该模块负责从原始的 medical.json 数据中提取文本，并利用 AC 自动机进行实体匹配，
@@ -25,22 +27,8 @@ class Build_Ner_data():
         self.max_len = 30
         # 定义常见的标点符号，用于文本分割
         self.p = ['，', '。' , '！' , '；' , '：' , ',' ,'.','?','!',';']
-        # 为每种实体类型初始化 AC 自动机
-        self.ahos = [ahocorasick.Automaton() for i in range(len(idx2type))]
-
-        # 从本地实体库加载词条到自动机
-        for type in idx2type:
-            file_path = os.path.join('data','ent_aug',f'{type}.txt')
-            if os.path.exists(file_path):
-                with open(file_path, encoding='utf-8') as f:
-                    all_en = f.read().split('\n')
-                for en in all_en:
-                    if len(en) >= 2:
-                        self.ahos[type2idx[type]].add_word(en, en)
-        
-        # 构建自动机
-        for i in range(len(self.ahos)):
-            self.ahos[i].make_automaton()
+        # 所有类型共用一个合并后的 AC 自动机
+        self.aho = entity_lexicon.get_automaton()
 
     def split_text(self, text):
         """
@@ -102,28 +90,12 @@ class Build_Ner_data():
                    match_count: 匹配到的实体总数
         """
         label = ['O'] * len(text)
-        flag = 0
-        mp = {}
-        # 遍历所有类型的自动机进行匹配
-        for type in self.idx2type:
-            li = list(self.ahos[self.type2idx[type]].iter(text))
-            if len(li) == 0:
-                continue
-            # 按匹配文本长度降序排列，优先保留长实体
-            li = sorted(li, key=lambda x: len(x[1]), reverse=True)
-            for en in li:
-                ed, name = en
-                st = ed - len(name) + 1
-                # 检查该范围是否已被占用
-                if st in mp or ed in mp:
-                    continue
-                # 打上 BIO 标签
-                label[st:ed+1] = ['B-' + type] + ['I-' + type] * (ed - st)
-                flag = flag + 1
-                # 记录已占用的索引
-                for i in range(st, ed + 1):
-                    mp[i] = 1
-        return label, flag
+        # 一次扫描得到所有类型的命中，长词优先消解重叠
+        matches = entity_lexicon.find_longest(self.aho, text, self.type2idx)
+        for st, ed, type, name in matches:
+            # 打上 BIO 标签
+            label[st:ed+1] = ['B-' + type] + ['I-' + type] * (ed - st)
+        return label, len(matches)
 
 def build_file(all_text, all_label):
     """
@@ -143,21 +115,12 @@ if __name__ == "__main__":
         print(f"找不到数据文件: {json_path}")
         sys.exit(1)
         
-    with open(json_path, 'r', encoding='utf-8') as f:
-        all_data = f.read().split('\n')
-    
     build_ner_data = Build_Ner_data()
     all_text, all_label = [], []
 
     print("开始构造 NER 标注数据...")
-    for data in tqdm(all_data):
-        if len(data) < 2:
-            continue
-        try:
-            data = eval(data)
-        except:
-            continue
-            
+    # 逐条流式解析（无法解析的行会被跳过），首次运行后直接从列式缓存读取所需的三个字段
+    for data in tqdm(corpus_loader.iter_records(json_path, fields=["desc", "prevent", "cause"])):
         # 提取描述、预防和病因字段进行文本增强和标注
         data_text = [data.get("desc", ""), data.get("prevent", ""), data.get("cause", "")]
 
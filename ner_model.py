@@ -1,17 +1,21 @@
 import random
+import bisect
+import itertools
+import numpy as np
 import torch
 from torch import nn
 import os
 import pickle
+import time
 
 from sklearn.model_selection import train_test_split
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
 from transformers import BertModel, BertTokenizer
 from tqdm import tqdm
 from seqeval.metrics import f1_score
-import ahocorasick
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+import entity_lexicon
 
 """
 命名实体识别 (NER) 模型模块
@@ -51,53 +55,21 @@ class rule_find:
     基于 AC 自动机 (Aho-Corasick) 的规则匹配类。
     用于在文本中快速搜索已知的医疗实体。
     """
-    def __init__(self):
-        # 定义支持的实体类型及其索引
+    def __init__(self, aho=None):
+        # 定义支持的实体类型及其索引（索引同时决定等长冲突时的优先级）
         self.idx2type = idx2type = ["食物", "药品商", "治疗方法", "药品","检查项目","疾病","疾病症状","科目"]
         self.type2idx = type2idx = {"食物": 0, "药品商": 1, "治疗方法": 2, "药品": 3,"检查项目":4,"疾病":5,"疾病症状":6,"科目":7}
-        # 为每种类型初始化一个 AC 自动机
-        self.ahos = [ahocorasick.Automaton() for i in range(len(self.type2idx))]
-
-        # 从本地文件中加载实体库并构建自动机
-        for type in idx2type:
-            with open(os.path.join('data','ent_aug',f'{type}.txt'), encoding='utf-8') as f:
-                all_en = f.read().split('\n')
-            for en in all_en:
-                en = en.split(' ')[0]
-                if len(en) >= 2:
-                    self.ahos[type2idx[type]].add_word(en, en)
-        for i in range(len(self.ahos)):
-            self.ahos[i].make_automaton()
+        # 所有类型共用一个合并后的 AC 自动机（可直接传入从预编译产物加载的自动机）
+        self.aho = aho if aho is not None else entity_lexicon.get_automaton()
 
     def find(self, sen):
         """
-        在句子中搜索匹配的实体。
+        在句子中搜索匹配的实体，按匹配长度从长到短处理包含关系。
         
         Returns:
             list: 包含匹配结果的列表 [(起始位置, 结束位置, 实体类型, 实体文本), ...]
         """
-        rule_result = []
-        mp = {}
-        all_res = []
-        all_ty = []
-        for i in range(len(self.ahos)):
-            now = list(self.ahos[i].iter(sen))
-            all_res.extend(now)
-            for j in range(len(now)):
-                all_ty.append(self.idx2type[i])
-        
-        if len(all_res) != 0:
-            # 按匹配长度从长到短排序，处理包含关系
-            all_res = sorted(all_res, key=lambda x: len(x[1]), reverse=True)
-            for i, res in enumerate(all_res):
-                be = res[0] - len(res[1]) + 1
-                ed = res[0]
-                if be in mp or ed in mp:
-                    continue
-                rule_result.append((be, ed, all_ty[i], res[1]))
-                for t in range(be, ed + 1):
-                    mp[t] = 1
-        return rule_result
+        return entity_lexicon.find_longest(self.aho, sen, self.type2idx)
 
 
 def find_entities(tag):
@@ -125,48 +97,86 @@ def find_entities(tag):
     return result
 
 
+def build_tfidf_index(lexicon_dir=entity_lexicon.LEXICON_DIR):
+    """
+    为每种实体类型拟合字符级 TF-IDF 模型。
+
+    Args:
+        lexicon_dir: 实体词表目录（每种类型一个 .txt 文件）
+    Returns:
+        dict: {实体类型: (实体名列表, TfidfVectorizer, 稀疏 CSR 向量矩阵)}
+    """
+    eneities_path = lexicon_dir
+    files = os.listdir(eneities_path)
+    files = [docu for docu in files if '.py' not in docu]
+
+    index = {}
+    for ty in files:
+        with open(os.path.join(eneities_path, ty), 'r', encoding='utf-8') as f:
+            entities = f.read().split('\n')
+            entities = [ent for ent in entities if len(ent.split(' ')[0]) <= 15 and len(ent.split(' ')[0]) >= 1]
+            en_name = [ent.split(' ')[0] for ent in entities]
+            ty = ty.strip('.txt')
+            # 保持稀疏 CSR 格式并使用 float32；TfidfVectorizer 默认做 L2 归一化，余弦相似度即为点积
+            tfidf_model = TfidfVectorizer(analyzer="char", dtype=np.float32)
+            embs = tfidf_model.fit_transform(en_name).tocsr()
+            index[ty] = (en_name, tfidf_model, embs)
+    return index
+
+
 class tfidf_alignment():
     """
     基于 TF-IDF 和余弦相似度的实体对齐类。
     用于将模型识别出的实体归一化到标准库中的已知实体。
     """
-    def __init__(self):
-        eneities_path = os.path.join('data/ent_aug')
-        files = os.listdir(eneities_path)
-        files = [docu for docu in files if '.py' not in docu]
+    def __init__(self, index=None):
+        # 可直接传入从预编译产物加载的索引，否则现场拟合
+        if index is None:
+            index = build_tfidf_index()
 
         self.tag_2_embs = {}
         self.tag_2_tfidf_model = {}
         self.tag_2_entity = {}
-        # 为每种实体类型预先计算 TF-IDF 向量
-        for ty in files:
-            with open(os.path.join(eneities_path, ty), 'r', encoding='utf-8') as f:
-                entities = f.read().split('\n')
-                entities = [ent for ent in entities if len(ent.split(' ')[0]) <= 15 and len(ent.split(' ')[0]) >= 1]
-                en_name = [ent.split(' ')[0] for ent in entities]
-                ty = ty.strip('.txt')
-                self.tag_2_entity[ty] = en_name
-                tfidf_model = TfidfVectorizer(analyzer="char")
-                embs = tfidf_model.fit_transform(en_name).toarray()
-                self.tag_2_embs[ty] = embs
-                self.tag_2_tfidf_model[ty] = tfidf_model
+        self.tag_2_entity_idx = {}
+        for ty, (en_name, tfidf_model, embs) in index.items():
+            self.tag_2_entity[ty] = en_name
+            # 名称 -> 首次出现的下标，用于精确命中时跳过相似度计算
+            name_idx = {}
+            for i, name in enumerate(en_name):
+                name_idx.setdefault(name, i)
+            self.tag_2_entity_idx[ty] = name_idx
+            self.tag_2_embs[ty] = embs
+            self.tag_2_tfidf_model[ty] = tfidf_model
 
     def align(self, ent_list):
         """
         对实体列表进行模糊匹配对齐。
+        与词库完全一致的实体直接命中；其余实体按类型分组，每组只做一次稀疏矩阵乘法。
         """
-        new_result = {}
-        for s, e, cls, ent in ent_list:
+        # 每个位置的对齐结果，最终按原顺序写入，保证同类型实体"后者覆盖前者"的语义不变
+        aligned = [None] * len(ent_list)
+        pending = {}
+        for pos, (s, e, cls, ent) in enumerate(ent_list):
             if cls not in self.tag_2_tfidf_model:
                 continue
-            ent_emb = self.tag_2_tfidf_model[cls].transform([ent])
-            sim_score = cosine_similarity(ent_emb, self.tag_2_embs[cls])
-            max_idx = sim_score[0].argmax()
-            max_score = sim_score[0][max_idx]
-
-            # 只有相似度超过阈值才认为对齐成功
-            if max_score >= 0.5:
-                new_result[cls] = self.tag_2_entity[cls][max_idx]
+            if ent in self.tag_2_entity_idx[cls]:
+                aligned[pos] = (cls, ent)
+            else:
+                pending.setdefault(cls, []).append(pos)
+
+        for cls, positions in pending.items():
+            ent_embs = self.tag_2_tfidf_model[cls].transform([ent_list[pos][3] for pos in positions])
+            sim_score = (ent_embs @ self.tag_2_embs[cls].T).toarray()
+            max_idx = sim_score.argmax(axis=1)
+            for row, pos in enumerate(positions):
+                # 只有相似度超过阈值才认为对齐成功
+                if sim_score[row, max_idx[row]] >= 0.5:
+                    aligned[pos] = (cls, self.tag_2_entity[cls][max_idx[row]])
+
+        new_result = {}
+        for res in aligned:
+            if res is not None:
+                new_result[res[0]] = res[1]
         return new_result
 
 
@@ -174,16 +184,19 @@ class Entity_Extend:
     """
     数据增强类，包含实体替换、掩盖、拼接等策略。
     用于提高模型在少样本或长尾实体上的泛化能力。
+    所有随机操作使用实例自带的随机数生成器，便于按 DataLoader worker 分别设定种子。
     """
-    def __init__(self):
+    def __init__(self, seed=None):
         eneities_path = os.path.join('data','ent')
         if not os.path.exists(eneities_path):
              eneities_path = os.path.join('data','ent_aug')
         files = os.listdir(eneities_path)
         files = [docu for docu in files if '.py' not in docu]
 
+        self.rng = random.Random(seed)
         self.type2entity = {}
         self.type2weight = {}
+        self.type2cum_weight = {}
         for type in files:
             with open(os.path.join(eneities_path, type), 'r', encoding='utf-8') as f:
                 entities = f.read().split('\n')
@@ -192,13 +205,25 @@ class Entity_Extend:
                 type = type.strip('.txt')
                 self.type2entity[type] = en_name
                 self.type2weight[type] = en_weight
+                # 预先计算累积权重，采样时二分查找即可，无需每次遍历整个权重列表
+                self.type2cum_weight[type] = list(itertools.accumulate(en_weight))
+
+    def reseed(self, seed):
+        """重新设定随机种子（供 DataLoader worker 初始化时调用）"""
+        self.rng.seed(seed)
+
+    def sample_entity(self, type):
+        """按权重从实体库中抽取一个同类型实体，O(log n)"""
+        cum_weight = self.type2cum_weight[type]
+        idx = bisect.bisect_right(cum_weight, self.rng.random() * cum_weight[-1])
+        return self.type2entity[type][min(idx, len(cum_weight) - 1)]
 
     def no_work(self, te, tag, type):
         return te, tag
 
     # 策略 1: 实体替换（用库中同类型的其他实体替换）
     def entity_replace(self, te, ta, type):
-        choice_ent = random.choices(self.type2entity[type], weights=self.type2weight[type], k=1)[0]
+        choice_ent = self.sample_entity(type)
         ta = ["B-"+type] + ["I-"+type] * (len(choice_ent)-1)
         return list(choice_ent), ta
 
@@ -207,18 +232,18 @@ class Entity_Extend:
         if(len(te) <= 3):
             return te, ta
         elif(len(te) <= 5):
-            te.pop(random.randint(0, len(te)-1))
+            te.pop(self.rng.randint(0, len(te)-1))
         else:
-            te.pop(random.randint(0, len(te)-1))
-            te.pop(random.randint(0, len(te)-1))
+            te.pop(self.rng.randint(0, len(te)-1))
+            te.pop(self.rng.randint(0, len(te)-1))
         ta = ["B-" + type] + ["I-" + type] * (len(te)-1)
         return te, ta
 
     # 策略 3: 实体拼接（增加同类实体的并列出现频率）
     def entity_union(self, te, ta, type):
         words = ['和', '与', '以及']
-        wor = random.choice(words)
-        choice_ent = random.choices(self.type2entity[type], weights=self.type2weight[type], k=1)[0]
+        wor = self.rng.choice(words)
+        choice_ent = self.sample_entity(type)
         te = te + list(wor) + list(choice_ent)
         ta = ta + ['O'] * len(wor) + ["B-" + type] + ["I-" + type] * (len(choice_ent)-1)
         return te, ta
@@ -229,7 +254,7 @@ class Entity_Extend:
         new_tag = tag.copy()
         sign = 0
         for ent in ents:
-            p = random.choice(cho)
+            p = self.rng.choice(cho)
             te, ta = p(text[ent[0]:ent[1]+1], tag[ent[0]:ent[1]+1], ent[2])
             new_text[ent[0] + sign:ent[1] + 1 + sign], new_tag[ent[0] + sign:ent[1] + 1 + sign] = te, ta
             sign += len(te) - (ent[1] - ent[0] + 1)
@@ -240,8 +265,10 @@ class Entity_Extend:
 class Nerdataset(Dataset):
     """
     NER 任务的 PyTorch Dataset 类。
+    dynamic_padding=True 时不在样本级别补齐，需配合 ner_collate_fn 按批次最长样本补齐。
     """
-    def __init__(self, all_text, all_label, tokenizer, max_len, tag2idx, is_dev=False, enhance_data=False):
+    def __init__(self, all_text, all_label, tokenizer, max_len, tag2idx, is_dev=False, enhance_data=False,
+                 dynamic_padding=False):
         self.all_text = all_text
         self.all_label = all_label
         self.tokenizer = tokenizer
@@ -250,6 +277,7 @@ class Nerdataset(Dataset):
         self.is_dev = is_dev
         self.entity_extend = Entity_Extend()
         self.enhance_data = enhance_data
+        self.dynamic_padding = dynamic_padding
 
     def __getitem__(self, x):
         text, label = self.all_text[x], self.all_label[x]
@@ -258,7 +286,7 @@ class Nerdataset(Dataset):
             max_len = min(len(self.all_text[x]) + 2, 500)
         else:
             # 训练集按概率进行增强
-            if self.enhance_data and random.random() > 0.5:
+            if self.enhance_data and self.entity_extend.rng.random() > 0.5:
                 ents = find_entities(label)
                 text, label = self.entity_extend.entities_extend(text, label, ents)
             max_len = self.max_len
@@ -270,14 +298,83 @@ class Nerdataset(Dataset):
         text_idx = self.tokenizer.encode(text, add_special_tokens=True)
         label_idx = [self.tag2idx['<PAD>']] + [self.tag2idx[i] for i in label] + [self.tag2idx['<PAD>']]
 
-        # 填充到固定长度
-        text_idx += [0] * (max_len - len(text_idx))
-        label_idx += [self.tag2idx['<PAD>']] * (max_len - len(label_idx))
+        # 填充到固定长度（动态补齐模式下交给 collate 函数处理）
+        if not self.dynamic_padding:
+            text_idx += [0] * (max_len - len(text_idx))
+            label_idx += [self.tag2idx['<PAD>']] * (max_len - len(label_idx))
         return torch.tensor(text_idx), torch.tensor(label_idx), x_len
 
     def __len__(self):
         return len(self.all_text)
 
+    def lengths(self):
+        """每个样本（含 [CLS]/[SEP]）补齐前的长度，供 LengthBucketSampler 分桶使用"""
+        max_len = 500 if self.is_dev else self.max_len
+        return [min(len(text), max_len - 2) + 2 for text in self.all_text]
+
+
+def seed_augment_worker(worker_id):
+    """
+    DataLoader 的 worker_init_fn：为每个 worker 设定独立的随机种子，
+    避免多个 worker 复制同一个随机状态而产生完全相同的增强样本。
+    """
+    info = torch.utils.data.get_worker_info()
+    seed = info.seed % 2 ** 32
+    random.seed(seed)
+    np.random.seed(seed)
+    entity_extend = getattr(info.dataset, 'entity_extend', None)
+    if entity_extend is not None:
+        entity_extend.reseed(seed)
+
+
+def ner_collate_fn(batch):
+    """
+    动态补齐：将一个批次内的样本补齐到该批次最长样本的长度。
+    文本补齐值为 0（与 attention_mask=(x > 0) 一致），标签补齐值为 <PAD>=0（被 CrossEntropyLoss 忽略）。
+    """
+    texts, labels, x_lens = zip(*batch)
+    text_idx = nn.utils.rnn.pad_sequence(texts, batch_first=True, padding_value=0)
+    label_idx = nn.utils.rnn.pad_sequence(labels, batch_first=True, padding_value=0)
+    return text_idx, label_idx, torch.tensor(x_lens)
+
+
+class LengthBucketSampler(Sampler):
+    """
+    按长度分桶的批采样器。
+    先打乱全部样本，再以 bucket_size 个样本为一桶在桶内按长度排序并切分批次，最后打乱批次顺序。
+    同一批次内的样本长度相近，配合 ner_collate_fn 可大幅减少补齐带来的无效计算。
+    """
+    def __init__(self, lengths, batch_size, bucket_size=None, shuffle=True, drop_last=False, seed=None):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size or batch_size * 50
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.rng = random.Random(seed)
+
+    def __iter__(self):
+        indices = list(range(len(self.lengths)))
+        if self.shuffle:
+            self.rng.shuffle(indices)
+        batches = []
+        for i in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[i:i + self.bucket_size], key=lambda idx: self.lengths[idx])
+            for j in range(0, len(bucket), self.batch_size):
+                batch = bucket[j:j + self.batch_size]
+                if len(batch) < self.batch_size and self.drop_last:
+                    continue
+                batches.append(batch)
+        if self.shuffle:
+            self.rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self):
+        total = 0
+        for i in range(0, len(self.lengths), self.bucket_size):
+            size = min(self.bucket_size, len(self.lengths) - i)
+            total += size // self.batch_size if self.drop_last else (size + self.batch_size - 1) // self.batch_size
+        return total
+
 
 def build_tag2idx(all_tag):
     """构建标签到索引的映射表"""
@@ -305,8 +402,14 @@ class Bert_Model(nn.Module):
         self.loss_fn = nn.CrossEntropyLoss(ignore_index=0)
 
     def forward(self, x, label=None):
-        bert_0, _ = self.bert(x, attention_mask=(x > 0), return_dict=False)
-        gru_0, _ = self.gru(bert_0)
+        mask = x > 0
+        bert_0, _ = self.bert(x, attention_mask=mask, return_dict=False)
+        # attention_mask 只作用于 BERT；双向 RNN 需按真实长度打包，否则反向会从补齐位置开始，
+        # 同一句话在批内补齐与单独预测时得到的标签可能不同
+        lengths = mask.sum(dim=1).cpu()
+        packed = nn.utils.rnn.pack_padded_sequence(bert_0, lengths, batch_first=True, enforce_sorted=False)
+        gru_0, _ = self.gru(packed)
+        gru_0, _ = nn.utils.rnn.pad_packed_sequence(gru_0, batch_first=True, total_length=x.shape[1])
         pre = self.classifier(gru_0)
         if label is not None:
             # 训练模式，返回损失
@@ -316,6 +419,50 @@ class Bert_Model(nn.Module):
             # 预测模式，返回预测标签索引
             return torch.argmax(pre, dim=-1).squeeze(0)
 
+def quantize_model(model):
+    """
+    动态量化：将模型中所有 nn.Linear 层的权重转换为 int8，激活在推理时动态量化。
+    量化后的模型只能在 CPU 上运行。
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def load_quantized_model(model_name, weight_path, tag_num, torchscript=False):
+    """
+    加载 int8 动态量化模型，量化结果会缓存到与原权重同目录的独立文件中。
+    缓存早于原始权重文件时视为过期并重新生成。
+
+    Args:
+        model_name: 预训练 BERT 路径
+        weight_path: 原始 fp32 权重路径，例如 model/best_roberta_rnn_model_ent_aug.pt
+        tag_num: 标签数量
+        torchscript: 是否对量化模型做 torch.jit.trace，以降低 Python 调用开销
+    """
+    base = weight_path[:-3] if weight_path.endswith('.pt') else weight_path
+    cache_path = base + ('.int8.ts.pt' if torchscript else '.int8.pt')
+    fresh = os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(weight_path)
+
+    if fresh and torchscript:
+        return torch.jit.load(cache_path, map_location='cpu')
+
+    model = Bert_Model(model_name, hidden_size=128, tag_num=tag_num, bi=True)
+    if fresh:
+        model = quantize_model(model.eval())
+        model.load_state_dict(torch.load(cache_path, map_location='cpu', weights_only=False))
+        return model.eval()
+
+    model.load_state_dict(torch.load(weight_path, map_location='cpu'))
+    model = quantize_model(model.eval())
+    if torchscript:
+        # 以一条示例输入追踪；序列长度与批大小在追踪图中保持动态
+        example = torch.randint(1, model.bert.config.vocab_size, (2, 8))
+        example[1, 5:] = 0
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+        torch.jit.save(model, cache_path)
+    else:
+        torch.save(model.state_dict(), cache_path)
+    return model
+
 def merge(model_result_word, rule_result):
     """
     合并模型预测结果和规则匹配结果。
@@ -333,30 +480,68 @@ def merge(model_result_word, rule_result):
             mp[i] = 1
     return check_result
 
-def get_ner_result(model, tokenizer, sen, rule, tfidf_r, device, idx2tag):
-    """
-    NER 任务的完整推理流程：模型预测 -> 规则匹配 -> 合并 -> TF-IDF 对齐。
+def predict_tags(model, tokenizer, sens, device, idx2tag, timings=None):
     """
-    sen_to = tokenizer.encode(sen, add_special_tokens=True, return_tensors='pt').to(device)
-    pre = model(sen_to).tolist()
+    批量模型预测：将多条句子补齐到同一长度后执行一次前向计算，再按句拆分出 BIO 标签序列。
+    补齐值为 0，与 Bert_Model.forward 中按 x > 0 计算 attention_mask 与 RNN 打包长度的约定保持一致，
+    因此批量预测与逐条预测的结果相同。
+    传入 timings 字典时写入 tokenize / forward 两步的耗时（秒）。
 
-    pre_tag = [idx2tag[i] for i in pre[1:-1]]
+    Returns:
+        list: 与 sens 一一对应的标签列表，每个元素形如 ['B-疾病', 'I-疾病', 'O', ...]
+    """
+    start = time.perf_counter()
+    all_ids = [tokenizer.encode(sen, add_special_tokens=True) for sen in sens]
+    max_len = max(len(ids) for ids in all_ids)
+    batch = torch.tensor([ids + [0] * (max_len - len(ids)) for ids in all_ids], device=device)
+    tokenized = time.perf_counter()
+    with torch.no_grad():
+        pre = model(batch)
+    # forward 在 batch=1 时会 squeeze 掉 batch 维度，这里统一恢复为二维
+    if pre.dim() == 1:
+        pre = pre.unsqueeze(0)
+    pre = pre.tolist()
+    if timings is not None:
+        timings["tokenize"] = tokenized - start
+        timings["forward"] = time.perf_counter() - tokenized
+    # 去掉 [CLS]/[SEP] 以及补齐部分
+    return [[idx2tag[i] for i in pre[k][1:len(ids) - 1]] for k, ids in enumerate(all_ids)]
+
+def decode_ner_result(sen, pre_tag, rule, tfidf_r, timings=None):
+    """
+    单条句子的后处理：BIO 解码 -> 规则匹配 -> 合并 -> TF-IDF 对齐。
+    传入 timings 字典时写入 decode / rule / align 三步的耗时（秒）。
+    """
+    start = time.perf_counter()
     model_result = find_entities(pre_tag)
     model_result_word = []
     for res in model_result:
         word = sen[res[0]:res[1] + 1]
         model_result_word.append((res[0], res[1], res[2], word))
+    decoded = time.perf_counter()
     
     # 规则匹配
     rule_result = rule.find(sen)
 
     # 结果合并
     merge_result = merge(model_result_word, rule_result)
+    matched = time.perf_counter()
     
     # 标准化对齐
     tfidf_result = tfidf_r.align(merge_result)
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings["rule"] = matched - decoded
+        timings["align"] = time.perf_counter() - matched
     return tfidf_result
 
+def get_ner_result(model, tokenizer, sen, rule, tfidf_r, device, idx2tag):
+    """
+    NER 任务的完整推理流程：模型预测 -> 规则匹配 -> 合并 -> TF-IDF 对齐。
+    """
+    pre_tag = predict_tags(model, tokenizer, [sen], device, idx2tag)[0]
+    return decode_ner_result(sen, pre_tag, rule, tfidf_r)
+
 if __name__ == "__main__":
     # 示例训练/推理逻辑
     pass